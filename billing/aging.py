@@ -0,0 +1,263 @@
+"""
+HMO aging ledger.
+
+HMOReceivable holds one row per invoice with an HMO share; HMOAgingSummary
+holds outstanding totals per (HMO, bucket). Both are adjusted
+incrementally as invoices and HMO payments change (see billing.signals),
+and `rebucket_hmo_aging` re-ages them nightly, so the dashboard only reads
+a handful of indexed rows.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from billing.models import AGING_BUCKETS, HMOAgingSummary, HMOReceivable, Invoice, Payment
+
+UNKNOWN_HMO = "UNKNOWN HMO"
+
+# Invoice fields that can move the receivable; other partial saves are ignored.
+LEDGER_FIELDS = {"hmo_amount", "hmo_name"}
+
+
+def _bucket(days: int) -> str:
+    if days <= 30:
+        return "0-30"
+    if days <= 60:
+        return "31-60"
+    if days <= 90:
+        return "61-90"
+    return "90+"
+
+
+def _hmo_label(hmo_name) -> str:
+    return (hmo_name or "").strip() or UNKNOWN_HMO
+
+
+def invoices_labelled(label) -> Q:
+    """Invoice filter matching the ledger's HMO label: UNKNOWN HMO covers blank and NULL names."""
+    if label == UNKNOWN_HMO:
+        return Q(hmo_name="") | Q(hmo_name__isnull=True) | Q(hmo_name=UNKNOWN_HMO)
+    return Q(hmo_name=label)
+
+
+def _invoiced_on(invoice):
+    return timezone.localdate(invoice.created_at) if invoice.created_at else timezone.localdate()
+
+
+def shift_summary(hmo_name, bucket, amount, count):
+    """Move one (hmo, bucket) summary row by `amount` and `count` outstanding invoices."""
+    if not amount and not count:
+        return
+    row = HMOAgingSummary.objects.filter(hmo_name=hmo_name, bucket=bucket)
+    shift = {"total": F("total") + amount, "invoice_count": F("invoice_count") + count}
+    if row.update(**shift):
+        return
+    try:
+        with transaction.atomic():  # savepoint: losing the race must not abort the caller's transaction
+            HMOAgingSummary.objects.create(hmo_name=hmo_name, bucket=bucket, total=amount, invoice_count=count)
+    except IntegrityError:
+        row.update(**shift)  # another writer created the row first
+
+
+def _store(receivable, *, old=None):
+    """Persist a receivable and move its summary contribution from `old` to the new figures."""
+    if old is not None and old.outstanding > 0:
+        shift_summary(old.hmo_name, old.bucket, -old.outstanding, -1)
+    if receivable.outstanding > 0:
+        shift_summary(receivable.hmo_name, receivable.bucket, receivable.outstanding, 1)
+    receivable.save(force_insert=old is None)
+
+
+def _hmo_paid(invoice_id) -> Decimal:
+    return (
+        Payment.objects.filter(invoice_id=invoice_id, method=Payment.Method.HMO)
+        .aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
+    )
+
+
+def sync_invoice(invoice, created=False):
+    """Bring the receivable in line with the invoice's HMO share / HMO name."""
+    if invoice.hmo_amount <= 0:
+        # private invoice: nothing to track unless it used to carry an HMO share
+        if created or not HMOReceivable.objects.filter(pk=invoice.pk).exists():
+            return
+
+    with transaction.atomic():
+        old = HMOReceivable.objects.select_for_update().filter(pk=invoice.pk).first()
+        hmo_paid = Decimal("0.00") if created else (old.hmo_paid if old else _hmo_paid(invoice.pk))
+        invoiced_on = old.invoiced_on if old else _invoiced_on(invoice)
+        receivable = HMOReceivable(
+            invoice_id=invoice.pk,
+            hmo_name=_hmo_label(invoice.hmo_name),
+            invoiced_on=invoiced_on,
+            hmo_amount=invoice.hmo_amount,
+            hmo_paid=hmo_paid,
+            outstanding=(Decimal(invoice.hmo_amount) - hmo_paid).quantize(Decimal("0.01")),
+            bucket=_bucket((timezone.localdate() - invoiced_on).days),
+        )
+        _store(receivable, old=old)
+
+
+@transaction.atomic
+def record_hmo_payment(invoice_id, amount):
+    """Apply an HMO settlement (negative amount reverses one) to the ledger."""
+    old = HMOReceivable.objects.select_for_update().filter(pk=invoice_id).first()
+    if old is None:
+        # invoice predates the ledger (or is being deleted); rebuild from source
+        if Decimal(amount) > 0:
+            sync_invoice(Invoice.objects.get(pk=invoice_id))
+        return
+
+    receivable = HMOReceivable(
+        invoice_id=old.invoice_id,
+        hmo_name=old.hmo_name,
+        invoiced_on=old.invoiced_on,
+        hmo_amount=old.hmo_amount,
+        hmo_paid=old.hmo_paid + Decimal(amount),
+        outstanding=(old.outstanding - Decimal(amount)).quantize(Decimal("0.01")),
+        bucket=old.bucket,
+    )
+    _store(receivable, old=old)
+
+
+@transaction.atomic
+def drop_invoice(invoice_id):
+    old = HMOReceivable.objects.select_for_update().filter(pk=invoice_id).first()
+    if old is None:
+        return
+    if old.outstanding > 0:
+        shift_summary(old.hmo_name, old.bucket, -old.outstanding, -1)
+    old.delete()
+
+
+def _bucket_case(today):
+    return Case(
+        When(invoiced_on__gte=today - timedelta(days=30), then=Value("0-30")),
+        When(invoiced_on__gte=today - timedelta(days=60), then=Value("31-60")),
+        When(invoiced_on__gte=today - timedelta(days=90), then=Value("61-90")),
+        default=Value("90+"),
+    )
+
+
+def backfill_receivables(batch_size=2000) -> int:
+    """Rebuild every receivable from invoices + HMO payments (two reads, bulk insert)."""
+    hmo_paid = dict(
+        Payment.objects.filter(method=Payment.Method.HMO)
+        .values("invoice_id")
+        .annotate(total=Sum("amount"))
+        .values_list("invoice_id", "total")
+    )
+    today = timezone.localdate()
+
+    rows = []
+    invoices = (
+        Invoice.objects.filter(hmo_amount__gt=0)
+        .values_list("id", "hmo_name", "hmo_amount", "created_at")
+        .iterator(chunk_size=batch_size)
+    )
+    for inv_id, hmo_name, hmo_amount, created_at in invoices:
+        paid = Decimal(hmo_paid.get(inv_id) or 0)
+        invoiced_on = timezone.localdate(created_at)
+        rows.append(HMOReceivable(
+            invoice_id=inv_id,
+            hmo_name=_hmo_label(hmo_name),
+            invoiced_on=invoiced_on,
+            hmo_amount=hmo_amount,
+            hmo_paid=paid,
+            outstanding=(Decimal(hmo_amount) - paid).quantize(Decimal("0.01")),
+            bucket=_bucket((today - invoiced_on).days),
+        ))
+
+    HMOReceivable.objects.all().delete()
+    HMOReceivable.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def rebucket(today=None) -> int:
+    """Re-age every receivable in one UPDATE, then rebuild the summary table."""
+    today = today or timezone.localdate()
+    moved = HMOReceivable.objects.exclude(bucket=_bucket_case(today)).update(bucket=_bucket_case(today))
+    rebuild_summary()
+    return moved
+
+
+def rebuild_summary():
+    grouped = (
+        HMOReceivable.objects.filter(outstanding__gt=0)
+        .values("hmo_name", "bucket")
+        .annotate(total=Sum("outstanding"), n=Count("pk"))
+    )
+    rows = [
+        HMOAgingSummary(hmo_name=g["hmo_name"], bucket=g["bucket"], total=g["total"], invoice_count=g["n"])
+        for g in grouped
+    ]
+    HMOAgingSummary.objects.all().delete()
+    HMOAgingSummary.objects.bulk_create(rows)
+
+
+def aging_tables():
+    """
+    Dashboard tables from the summary rows (one query):
+    hmo_table sorted by total desc, and grand totals per bucket.
+    """
+    zero = Decimal("0.00")
+    by_hmo = {}
+    grand = {b: zero for b in AGING_BUCKETS}
+    grand["total"] = zero
+
+    for s in HMOAgingSummary.objects.filter(invoice_count__gt=0):
+        vals = by_hmo.setdefault(s.hmo_name, {**{b: zero for b in AGING_BUCKETS}, "total": zero})
+        vals[s.bucket] += s.total
+        vals["total"] += s.total
+        grand[s.bucket] += s.total
+        grand["total"] += s.total
+
+    hmo_table = [{"hmo_name": name, **vals} for name, vals in by_hmo.items()]
+    hmo_table.sort(key=lambda x: x["total"], reverse=True)
+    return hmo_table, grand
+
+
+def iter_reminder_rows(hmo_name, today=None, chunk_size=2000):
+    """
+    (invoice no, hospital no, patient, days, outstanding) for one HMO's open
+    receivables, oldest first, read in chunks for the paged reminder PDF.
+    """
+    today = today or timezone.localdate()
+    rows = (
+        HMOReceivable.objects.filter(hmo_name=hmo_name, outstanding__gt=0)
+        .order_by("invoiced_on", "invoice_id")
+        .values_list(
+            "invoice__invoice_number", "invoice__patient__hospital_number",
+            "invoice__patient__last_name", "invoice__patient__first_name", "invoiced_on", "outstanding",
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for invoice_number, hospital_number, last_name, first_name, invoiced_on, outstanding in rows:
+        yield invoice_number, hospital_number, f"{last_name} {first_name}", (today - invoiced_on).days, outstanding
+
+
+def top_outstanding(limit=50, today=None):
+    today = today or timezone.localdate()
+    receivables = (
+        HMOReceivable.objects.filter(outstanding__gt=0)
+        .select_related("invoice__patient")
+        .order_by("-outstanding")[:limit]
+    )
+    rows = []
+    for r in receivables:
+        inv = r.invoice
+        rows.append({
+            "invoice_id": r.invoice_id,
+            "invoice_number": inv.invoice_number,
+            "hospital_number": inv.patient.hospital_number,
+            "patient": f"{inv.patient.last_name} {inv.patient.first_name}",
+            "hmo_name": r.hmo_name,
+            "days": (today - r.invoiced_on).days,
+            "bucket": r.bucket,
+            "outstanding": r.outstanding,
+            "created_at": inv.created_at,
+        })
+    return rows
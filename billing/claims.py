@@ -1,21 +1,149 @@
 import csv
-from django.http import HttpResponse
-from .models import HMOClaimBatch
+import zlib
+from datetime import datetime, time, timedelta
 
-def export_claim_batch_csv(batch_id):
-    batch = HMOClaimBatch.objects.prefetch_related("items").get(pk=batch_id)
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = f'attachment; filename="EDH_HMO_CLAIMS_{batch.id}.csv"'
+from .models import HMOClaimBatch, HMOClaimItem, Invoice
 
-    writer = csv.writer(response)
-    writer.writerow(["HMO", "Period Start", "Period End", "Hospital No", "Patient", "Visit No", "Invoice", "HMO Amount"])
 
-    for item in batch.items.all():
-        writer.writerow([
+def _period_bounds(start, end):
+    """[start 00:00, day-after-end 00:00) as aware datetimes, so created_at stays index-friendly."""
+    lo = timezone.make_aware(datetime.combine(start, time.min))
+    hi = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return lo, hi
+
+
+def unclaimed_hmo_invoices(start, end):
+    """HMO invoices created in [start, end] that are not in ANY claim batch (one anti-join)."""
+    lo, hi = _period_bounds(start, end)
+    return (
+        Invoice.objects
+        .filter(hmo_amount__gt=0, created_at__gte=lo, created_at__lt=hi)
+        .filter(~Exists(HMOClaimItem.objects.filter(invoice=OuterRef("pk"))))
+    )
+
+
+def eligible_claim_invoices(batch):
+    """
+    Invoices that may go into this batch:
+    - invoice has HMO amount > 0
+    - invoice created within period
+    - invoice hmo_name matches batch.hmo_name
+    - not already in ANY claim batch item (to avoid double-claiming)
+    """
+    return unclaimed_hmo_invoices(batch.period_start, batch.period_end).filter(hmo_name=batch.hmo_name)
+
+
+@transaction.atomic
+def add_invoices_to_batch(batch, invoice_ids=None) -> int:
+    """
+    Claim eligible invoices into `batch` with one read and one bulk insert.
+    invoice_ids=None takes every eligible invoice. Returns the number added.
+    """
+    qs = eligible_claim_invoices(batch)
+    if invoice_ids is not None:
+        qs = qs.filter(id__in=invoice_ids)
+
+    rows = qs.order_by("created_at").values_list(
+        "id", "hmo_amount", "patient__last_name", "patient__first_name",
+        "patient__hospital_number", "visit__visit_number",
+    )
+    items = [
+        HMOClaimItem(
+            batch=batch,
+            invoice_id=inv_id,
+            hmo_amount=hmo_amount,
+            patient=f"{last_name} {first_name}",
+            hospital_number=hospital_number,
+            visit_number=visit_number or "",
+        )
+        for inv_id, hmo_amount, last_name, first_name, hospital_number, visit_number in rows
+    ]
+    HMOClaimItem.objects.bulk_create(items, batch_size=500)
+    return len(items)
+
+
+CLAIM_CSV_HEADER = ["HMO", "Period Start", "Period End", "Hospital No", "Patient", "Visit No", "Invoice", "HMO Amount"]
+CLAIM_CSV_CHUNK_SIZE = 2000  # rows per server-side cursor fetch
+CLAIM_CSV_ROWS_PER_WRITE = 500  # rows joined into one streamed chunk
+
+
+class _Echo:
+    """csv.writer target that hands each formatted row straight back."""
+
+    def write(self, value):
+        return value
+
+
+def iter_claim_batch_csv(batch, chunk_size=CLAIM_CSV_CHUNK_SIZE):
+    """
+    Yield the batch CSV as text chunks. Items are read through a
+    server-side cursor with the invoice number joined in, so memory stays
+    flat however big the batch is.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CLAIM_CSV_HEADER)
+
+    rows = (
+        HMOClaimItem.objects
+        .filter(batch=batch)
+        .order_by("id")
+        .values_list("hospital_number", "patient", "visit_number", "invoice__invoice_number", "hmo_amount")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    lines = []
+    for hospital_number, patient, visit_number, invoice_number, hmo_amount in rows:
+        lines.append(writer.writerow([
             batch.hmo_name, batch.period_start, batch.period_end,
-            item.hospital_number, item.patient, item.visit_number,
-            item.invoice.invoice_number, item.hmo_amount
-        ])
+            hospital_number, patient, visit_number,
+            invoice_number, hmo_amount,
+        ]))
+        if len(lines) >= CLAIM_CSV_ROWS_PER_WRITE:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def iter_claim_cover_rows(batch, chunk_size=CLAIM_CSV_CHUNK_SIZE):
+    """(invoice no, hospital no, patient, visit no, HMO amount) per claim line, read in chunks."""
+    return (
+        HMOClaimItem.objects
+        .filter(batch=batch)
+        .order_by("id")
+        .values_list("invoice__invoice_number", "hospital_number", "patient", "visit_number", "hmo_amount")
+        .iterator(chunk_size=chunk_size)
+    )
+
 
+def _gzip_stream(chunks):
+    z = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = z.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
+
+
+def stream_claim_batch_csv(batch, compress=False):
+    filename = f"EDH_HMO_CLAIMS_{batch.id}.csv"
+    chunks = iter_claim_batch_csv(batch)
+
+    if compress:
+        response = StreamingHttpResponse(_gzip_stream(chunks), content_type="application/gzip")
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(chunks, content_type="text/csv")
+
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
+
+
+def export_claim_batch_csv(batch_id, compress=False):
+    batch = HMOClaimBatch.objects.get(pk=batch_id)
+    return stream_claim_batch_csv(batch, compress=compress)
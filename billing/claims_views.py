@@ -1,12 +1,15 @@
 from decimal import Decimal
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum
-from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 
 from accounts.utils import require_roles
-from billing.models import HMOClaimBatch, HMOClaimItem, Invoice, Payment
+from billing.claims import add_invoices_to_batch, eligible_claim_invoices, stream_claim_batch_csv
+from billing.models import HMOClaimBatch
+from billing.settlement import RemittanceError, parse_remittance, settle_batch
+from core.replicas import read_only_replica
 
 @login_required
 def claim_batch_list(request):
@@ -59,49 +62,22 @@ def claim_batch_detail(request, batch_id: int):
 @login_required
 def claim_batch_add_invoices(request, batch_id: int):
     """
-    Add eligible invoices into batch:
-    - invoice has HMO amount > 0
-    - invoice created within period
-    - invoice hmo_name matches batch.hmo_name
-    - not already in ANY claim batch item (to avoid double-claiming)
+    Add eligible invoices into batch (see billing.claims.eligible_claim_invoices).
+    POST with "all" claims every eligible invoice, not just the 300 listed.
     """
     require_roles(request.user, roles={"billing", "admin"})
     batch = get_object_or_404(HMOClaimBatch, pk=batch_id)
 
     if request.method == "POST":
-        invoice_ids = request.POST.getlist("invoice_ids")
-        invoices = Invoice.objects.select_related("patient", "visit").filter(id__in=invoice_ids)
-
-        created = 0
-        for inv in invoices:
-            if inv.hmo_amount <= 0:
-                continue
-            if inv.hmo_name != batch.hmo_name:
-                continue
-            # prevent duplicate claim of same invoice
-            if HMOClaimItem.objects.filter(invoice=inv).exists():
-                continue
-
-            HMOClaimItem.objects.create(
-                batch=batch,
-                invoice=inv,
-                hmo_amount=inv.hmo_amount,
-                patient=f"{inv.patient.last_name} {inv.patient.first_name}",
-                hospital_number=inv.patient.hospital_number,
-                visit_number=(inv.visit.visit_number if inv.visit else ""),
-            )
-            created += 1
-
+        invoice_ids = None if request.POST.get("all") else request.POST.getlist("invoice_ids")
+        created = add_invoices_to_batch(batch, invoice_ids)
+        messages.success(request, f"{created} invoice(s) added to batch.")
         return redirect("billing:claim_batch_detail", batch_id=batch.id)
 
     # Eligible invoice search set
-    start = batch.period_start
-    end = batch.period_end
-
     eligible = (
-        Invoice.objects.select_related("patient", "visit")
-        .filter(hmo_amount__gt=0, hmo_name=batch.hmo_name, created_at__date__gte=start, created_at__date__lte=end)
-        .exclude(id__in=HMOClaimItem.objects.values_list("invoice_id", flat=True))
+        eligible_claim_invoices(batch)
+        .select_related("patient", "visit")
         .order_by("-created_at")
     )[:300]
 
@@ -112,28 +88,12 @@ def claim_batch_add_invoices(request, batch_id: int):
 
 
 @login_required
+@read_only_replica
 def claim_batch_export_csv(request, batch_id: int):
     require_roles(request.user, roles={"billing", "admin"})
     batch = get_object_or_404(HMOClaimBatch, pk=batch_id)
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = f'attachment; filename="EDH_HMO_CLAIMS_{batch.id}.csv"'
-
-    import csv
-    writer = csv.writer(response)
-    writer.writerow([
-        "HMO", "Period Start", "Period End",
-        "Hospital No", "Patient", "Visit No", "Invoice", "HMO Amount"
-    ])
-
-    for item in batch.items.select_related("invoice").all():
-        writer.writerow([
-            batch.hmo_name, batch.period_start, batch.period_end,
-            item.hospital_number, item.patient, item.visit_number,
-            item.invoice.invoice_number, item.hmo_amount
-        ])
-
-    return response
+    return stream_claim_batch_csv(batch, compress=request.GET.get("gzip") == "1")
 
 
 @login_required
@@ -151,33 +111,34 @@ def claim_batch_mark_paid(request, batch_id: int):
     """
     When HMO pays, post settlements against invoices as Payment(method=HMO).
     This does NOT affect patient balances; it just records HMO receivable settlement.
+    An optional remittance CSV posts what the HMO actually paid per invoice.
     """
     require_roles(request.user, roles={"billing", "admin"})
     batch = get_object_or_404(HMOClaimBatch, pk=batch_id)
 
     if request.method == "POST":
         reference = (request.POST.get("reference") or "").strip()
-
-        for item in batch.items.select_related("invoice").all():
-            inv = item.invoice
-            if item.hmo_amount <= 0:
-                continue
-
-            # avoid double posting HMO settlement for same invoice/batch
-            already = inv.payments.filter(method=Payment.Method.HMO, reference=reference).exists()
-            if already:
-                continue
-
-            Payment.objects.create(
-                invoice=inv,
-                amount=item.hmo_amount,
-                method=Payment.Method.HMO,
-                reference=reference,
-                received_by=request.user,
-            )
-
-        batch.status = "PAID"
-        batch.save(update_fields=["status"])
+        remittance = None
+        upload = request.FILES.get("remittance")
+        if upload:
+            try:
+                remittance = parse_remittance(upload)
+            except RemittanceError as exc:
+                messages.error(request, str(exc))
+                return redirect("billing:claim_batch_detail", batch_id=batch.id)
+
+        result = settle_batch(batch, reference=reference, remittance=remittance, user=request.user)
+
+        messages.success(
+            request,
+            f"{result.posted} settlement(s) posted ({result.total:,.2f}); {len(result.settled)} invoice(s) settled.",
+        )
+        if result.short:
+            messages.warning(request, f"{len(result.short)} invoice(s) short-paid and marked disputed.")
+        if result.over:
+            messages.warning(request, f"{len(result.over)} invoice(s) paid above the claimed amount.")
+        if result.unmatched:
+            messages.warning(request, "Not in this batch: " + ", ".join(result.unmatched))
         return redirect("billing:claim_batch_detail", batch_id=batch.id)
 
     return redirect("billing:claim_batch_detail", batch_id=batch.id)
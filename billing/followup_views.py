@@ -3,10 +3,13 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.contrib import messages
 
+from core.replicas import read_only_replica
+
 from .models import HMOFollowUp
 
 
 @login_required
+@read_only_replica
 def followups_list(request):
     today = timezone.localdate()
     followups = (
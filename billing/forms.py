@@ -0,0 +1,14 @@
+from decimal import Decimal
+
+from django import forms
+
+from .models import Payment
+
+# what the cashier can take at the desk; HMO settlements only come in through billing.settlement
+CASHIER_METHODS = [Payment.Method.CASH, Payment.Method.POS, Payment.Method.TRANSFER]
+
+
+class PaymentForm(forms.Form):
+    amount = forms.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal("0.01"))
+    method = forms.ChoiceField(choices=[(m.value, m.label) for m in CASHIER_METHODS])
+    reference = forms.CharField(max_length=80, required=False)
@@ -0,0 +1,55 @@
+"""
+Cached invoice page fragments.
+
+The line-items table and the payments list on the invoice page are cached
+as rendered HTML (the {% cache %} tags in billing/invoice_detail.html),
+keyed on the invoice number and Invoice.fragment_version. The version lives
+on the invoice row the page loads anyway, so a repeat view at the cashier
+desk is that one query; a miss costs one query each for lines and payments.
+Because the version is in the database, a bump is seen by every process
+even without a shared cache backend, and stale fragments simply age out.
+
+The version moves with every line or payment change:
+
+* the services that write lines/payments (generate_invoice_for_visit,
+  post_payment, settle_batch) fold `next_version()` into the invoice
+  UPDATE they already issue, under `caller_bumps_version()` so the signals
+  don't bump a second time;
+* anything else goes through the post_save/post_delete signals
+  (billing.signals), which call `bump_version`.
+
+InvoiceLine has no post_delete receiver on purpose: it would stop Django
+fast-deleting lines on every invoice rebuild. Lines are only deleted by
+generate_invoice_for_visit, which bumps the version itself.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import F
+
+from .models import Invoice
+
+FRAGMENT_TTL = 60 * 60 * 24  # seconds; versioned keys never go stale, this just frees memory
+
+_caller_bumps = ContextVar("invoice_fragment_caller_bumps", default=False)
+
+
+def next_version():
+    """Expression for the invoice UPDATE a service issues anyway."""
+    return F("fragment_version") + 1
+
+
+@contextmanager
+def caller_bumps_version():
+    """The enclosed code bumps fragment_version itself; the signal receivers stand down."""
+    token = _caller_bumps.set(True)
+    try:
+        yield
+    finally:
+        _caller_bumps.reset(token)
+
+
+def bump_version(invoice_id):
+    if invoice_id is None or _caller_bumps.get():
+        return
+    Invoice.objects.filter(pk=invoice_id).update(fragment_version=next_version())
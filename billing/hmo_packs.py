@@ -0,0 +1,167 @@
+"""
+Weekly HMO packs.
+
+generate_weekly_hmo_packs runs these stages:
+
+1. collect   - one grouped query over the aging summary gives every HMO
+               with money outstanding.
+2. render    - each HMO's reminder letter and dispute sheet are rendered by
+               a process pool worker. The worker streams its own rows
+               from the DB, and the PDFs go into a dated output directory.
+3. manifest  - manifest.json lists each file with its line count, total
+               and SHA-256.
+4. follow-up - HMOFollowUp rows for the period are upserted in bulk.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import django
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from billing.aging import invoices_labelled, iter_reminder_rows
+from billing.models import HMOAgingSummary, HMOFollowUp, Invoice
+from billing.pdf_hmo_disputes import build_hmo_dispute_pdf
+from billing.pdf_hmo_reminder import build_hmo_reminder_pdf
+from billing.pdf_service import HOSPITAL_META
+
+FOLLOW_UP_DAYS = 7
+
+
+def outstanding_by_hmo():
+    """[{"hmo_name", "outstanding", "invoices"}] for every HMO that owes anything (one query)."""
+    return list(
+        HMOAgingSummary.objects.filter(total__gt=0)
+        .values("hmo_name")
+        .annotate(outstanding=Sum("total"), invoices=Sum("invoice_count"))
+        .order_by("hmo_name")
+    )
+
+
+def iter_dispute_rows(hmo_name, chunk_size=2000):
+    """
+    (invoice no, hospital no, patient, reason, disputed amount) for an HMO's
+    disputed invoices; hmo_name is the aging-ledger label the packs are keyed by.
+    """
+    rows = (
+        Invoice.objects.filter(invoices_labelled(hmo_name), hmo_state=Invoice.HMOState.DISPUTED)
+        .order_by("created_at", "id")
+        .values_list(
+            "invoice_number", "patient__hospital_number", "patient__last_name", "patient__first_name",
+            "hmo_dispute_reason", "hmo_dispute_amount",
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for invoice_number, hospital_number, last_name, first_name, reason, amount in rows:
+        yield invoice_number, hospital_number, f"{last_name} {first_name}", reason, amount
+
+
+def _slug(name) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "HMO"
+
+
+def _sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def render_pack(job) -> dict:
+    """
+    Render one HMO's reminder and dispute PDFs into job["out_dir"].
+    Runs in a pool worker: job is plain data, and rows are read here.
+    """
+    started = time.perf_counter()
+    hospital = SimpleNamespace(**HOSPITAL_META)
+    generated_at = datetime.fromisoformat(job["generated_at"])
+    today = generated_at.date()
+    name = job["hmo_name"]
+    files = {}
+
+    for kind, build, rows in (
+        ("reminder", build_hmo_reminder_pdf, iter_reminder_rows(name, today=today)),
+        ("disputes", build_hmo_dispute_pdf, iter_dispute_rows(name)),
+    ):
+        filename = f"{_slug(name)}_{kind}.pdf"
+        path = os.path.join(job["out_dir"], filename)
+        with open(path, "wb") as out:
+            lines, total = build(hospital=hospital, hmo_name=name, rows=rows, generated_at=generated_at, out=out)
+        files[kind] = {"file": filename, "lines": lines, "total": str(total), "sha256": _sha256(path)}
+
+    return {
+        "hmo_name": name,
+        "outstanding": job["outstanding"],
+        "invoices": job["invoices"],
+        **files,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def render_packs(jobs, workers=2):
+    """Yield render_pack results as they finish; workers=0 renders in this process."""
+    if not workers:
+        for job in jobs:
+            yield render_pack(job)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,  # workers query their own rows
+    ) as pool:
+        futures = [pool.submit(render_pack, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_manifest(out_dir, *, generated_at, period_start, period_end, packs) -> str:
+    path = os.path.join(out_dir, "manifest.json")
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({
+            "generated_at": generated_at.isoformat(),
+            "period_start": period_start.isoformat(),
+            "period_end": period_end.isoformat(),
+            "packs": sorted(packs, key=lambda p: p["hmo_name"]),
+        }, fh, indent=2)
+    return path
+
+
+@transaction.atomic
+def upsert_followups(hmo_names, *, period_start, period_end, now=None):
+    """Mark each HMO's follow-up for the period as reminded; returns (created, updated)."""
+    now = now or timezone.now()
+    next_at = timezone.localdate(now) + timedelta(days=FOLLOW_UP_DAYS)
+    existing = {
+        f.hmo_name: f
+        for f in HMOFollowUp.objects.filter(
+            hmo_name__in=hmo_names, period_start=period_start, period_end=period_end,
+        )
+    }
+
+    to_update = []
+    for f in existing.values():
+        f.status = HMOFollowUp.Status.REMINDED
+        f.last_action_at = now
+        f.next_follow_up_at = next_at
+        to_update.append(f)
+    HMOFollowUp.objects.bulk_update(to_update, ["status", "last_action_at", "next_follow_up_at"])
+
+    to_create = [
+        HMOFollowUp(
+            hmo_name=name, period_start=period_start, period_end=period_end,
+            status=HMOFollowUp.Status.REMINDED, last_action_at=now, next_follow_up_at=next_at,
+        )
+        for name in hmo_names if name not in existing
+    ]
+    HMOFollowUp.objects.bulk_create(to_create)
+    return len(to_create), len(to_update)
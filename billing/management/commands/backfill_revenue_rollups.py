@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.revenue import backfill_rollups, rebuild_totals
+
+
+class Command(BaseCommand):
+    help = "Rebuild DailyRevenueRollup rows from the Payment table and the running invoice totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only rebuild days from YYYY-MM-DD onwards (default: all history)")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = date.fromisoformat(options["since"])
+            except ValueError as exc:
+                raise CommandError(f"Invalid --since date: {exc}")
+
+        n = backfill_rollups(since=since)
+        rebuild_totals()
+        self.stdout.write(self.style.SUCCESS(f"Revenue rollups rebuilt. Day/method rows: {n}"))
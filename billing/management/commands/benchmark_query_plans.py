@@ -0,0 +1,131 @@
+import re
+import time
+from datetime import timedelta
+from random import Random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from billing.claims import unclaimed_hmo_invoices
+from billing.models import HMOFollowUp, Invoice, Payment
+from core import synthetic
+from patients.models import Patient
+from patients.search import search_patients
+from pharmacy.models import PrescriptionItem
+from visits.models import Visit
+
+# "SCAN billing_invoice" (SQLite, no index) / "Seq Scan on billing_invoice" (PostgreSQL)
+TABLE_SCAN = re.compile(r"(\bSCAN (?P<sqlite>\w+)\s*$)|(Seq Scan on (?P<pg>\w+))", re.MULTILINE)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    """(label, table that must be reached via an index, queryset) for each hot view path."""
+    today = timezone.localdate()
+    now = timezone.now()
+    return [
+        ("visits.queue", Visit._meta.db_table, Visit.objects.filter(
+            status__in=[Visit.Status.OPEN, Visit.Status.WAITING_DOCTOR, Visit.Status.IN_CONSULT],
+        ).order_by("created_at")),
+        ("pharmacy.queue_page", PrescriptionItem._meta.db_table, PrescriptionItem.objects.filter(
+            status=PrescriptionItem.Status.PENDING, visit_id__gt=0,
+        ).order_by("visit_id").values_list("visit_id", flat=True).distinct()[:26]),
+        ("billing.invoice_list", Invoice._meta.db_table, Invoice.objects.order_by("-created_at")[:200]),
+        ("billing.claim_eligible", Invoice._meta.db_table, unclaimed_hmo_invoices(
+            today - timedelta(days=30), today,
+        ).filter(hmo_name="Hygeia HMO")),
+        ("billing.hmo_paid_per_invoice", Payment._meta.db_table, Payment.objects.filter(
+            method=Payment.Method.HMO,
+        ).values("invoice_id")),
+        ("billing.collections_range", Payment._meta.db_table, Payment.objects.filter(
+            paid_at__gte=now - timedelta(days=30),
+        )),
+        ("billing.followups_due", HMOFollowUp._meta.db_table, HMOFollowUp.objects.filter(
+            next_follow_up_at__lte=today,
+        ).exclude(status=HMOFollowUp.Status.SETTLED)),
+        ("patients.search_name", Patient._meta.db_table, search_patients("okaf")),
+        ("patients.search_phone", Patient._meta.db_table, search_patients("+23480312")),
+        ("patients.visit_history", Visit._meta.db_table, Visit.objects.filter(
+            patient_id=1,
+        ).order_by("-created_at")),
+    ]
+
+
+def table_scans(plan: str, table: str) -> bool:
+    return any((m.group("sqlite") or m.group("pg")) == table for m in TABLE_SCAN.finditer(plan))
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed realistic volumes (rolled back afterwards), then EXPLAIN and time each hot "
+        "queue/dashboard query and fail if any of them falls back to a table scan"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query (median reported)")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded rows instead of rolling back")
+
+    def handle(self, *args, **opts):
+        failures = []
+        try:
+            with transaction.atomic():
+                self._seed(opts["patients"])
+                if connection.vendor == "sqlite":
+                    with connection.cursor() as cur:
+                        cur.execute("ANALYZE")
+                failures = self._check(opts["repeat"])
+                if not opts["keep"]:
+                    raise _Rollback
+        except _Rollback:
+            pass
+
+        if failures:
+            raise CommandError("Table scans on hot paths: " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All hot paths use an index."))
+
+    def _check(self, repeat):
+        failures = []
+        for label, table, qs in hot_queries():
+            plan = qs.explain()
+            timings = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                list(qs[:200] if not qs.query.is_sliced else qs)
+                timings.append((time.perf_counter() - t0) * 1000)
+            median = sorted(timings)[len(timings) // 2]
+
+            scan = table_scans(plan, table)
+            if scan:
+                failures.append(label)
+            status = self.style.ERROR("TABLE SCAN") if scan else self.style.SUCCESS("index")
+            self.stdout.write(f"{label:<32} {status:<10} {median:8.2f} ms")
+            self.stdout.write("    " + plan.replace("\n", "\n    "))
+        return failures
+
+    def _seed(self, n_patients):
+        rnd = Random(7)
+        now = timezone.now()
+        t0 = time.perf_counter()
+
+        counts = synthetic.generate(n_patients, visits_per_patient=3, days=730)
+        HMOFollowUp.objects.bulk_create([
+            HMOFollowUp(
+                hmo_name=synthetic.HMO_NAMES[i % len(synthetic.HMO_NAMES)],
+                period_start=(now - timedelta(days=30 + i)).date(),
+                period_end=(now - timedelta(days=i)).date(),
+                status=rnd.choice(HMOFollowUp.Status.values),
+                next_follow_up_at=(now + timedelta(days=rnd.randint(-30, 30))).date(),
+            )
+            for i in range(min(n_patients, 5000))
+        ], batch_size=2000)
+
+        self.stdout.write(
+            f"Seeded {counts['patient']} patients, {counts['visit']} visits, "
+            f"{counts['prescriptionitem']} prescription items, {counts['invoice']} invoices, "
+            f"{counts['payment']} payments in {time.perf_counter() - t0:.1f}s"
+        )
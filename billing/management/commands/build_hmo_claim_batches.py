@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from billing.claims import add_invoices_to_batch, unclaimed_hmo_invoices
+from billing.models import HMOClaimBatch
+
+
+class Command(BaseCommand):
+    help = "Auto-build DRAFT HMO claim batches (one per HMO) for a period"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="Period start YYYY-MM-DD (default: first day of last month)")
+        parser.add_argument("--end", help="Period end YYYY-MM-DD (default: last day of last month)")
+        parser.add_argument("--hmo", help="Only build the batch for this HMO name")
+
+    def handle(self, *args, **options):
+        first_of_month = timezone.localdate().replace(day=1)
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else (first_of_month - timedelta(days=1)).replace(day=1)
+            end = date.fromisoformat(options["end"]) if options["end"] else first_of_month - timedelta(days=1)
+        except ValueError as exc:
+            raise CommandError(f"Invalid date: {exc}")
+        if start > end:
+            raise CommandError("--start must be on or before --end")
+
+        # HMOs with anything left to claim in the period (one grouped query)
+        pending = unclaimed_hmo_invoices(start, end)
+        if options["hmo"]:
+            pending = pending.filter(hmo_name=options["hmo"])
+        hmos = pending.exclude(hmo_name="").order_by("hmo_name").values_list("hmo_name", flat=True).distinct()
+
+        total = 0
+        for hmo in hmos:
+            # top up an open DRAFT for the same period rather than starting another
+            batch = HMOClaimBatch.objects.filter(
+                hmo_name=hmo, period_start=start, period_end=end, status="DRAFT",
+            ).order_by("id").first()
+            created = batch is None
+            if created:
+                batch = HMOClaimBatch.objects.create(
+                    hmo_name=hmo, period_start=start, period_end=end, status="DRAFT",
+                )
+            added = add_invoices_to_batch(batch)
+            total += added
+            self.stdout.write(
+                f"{hmo}: {'new' if created else 'existing'} batch #{batch.id} | {added} invoice(s) added"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Claim batches built for {start} to {end}. Invoices claimed: {total}"
+        ))
@@ -1,58 +1,80 @@
+import os
+import time
+from contextlib import contextmanager
 from datetime import timedelta
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db.models import Sum
 
-from billing.models import Invoice, HMOFollowUp, Payment
-from billing.pdf_views import hmo_reminder_letter_pdf, hmo_dispute_sheet_pdf
-from billing.hmo_aging_views import _bucket
+from billing import hmo_packs
+
 
 class Command(BaseCommand):
-    help = "Generate weekly HMO reminder packs and schedule follow-ups"
-
-    def handle(self, *args, **options):
-        today = timezone.localdate()
-        start = today - timedelta(days=30)  # rolling window
-
-        # HMOs with outstanding balances
-        hmos = (
-            Invoice.objects
-            .filter(hmo_amount__gt=0)
-            .values_list("hmo_name", flat=True)
-            .distinct()
-        )
-
-        for hmo in hmos:
-            qs = Invoice.objects.filter(hmo_name=hmo, hmo_amount__gt=0)
-
-            # compute outstanding
-            total_paid = (
-                Payment.objects.filter(method=Payment.Method.HMO, invoice__in=qs)
-                .aggregate(t=Sum("amount"))["t"] or 0
-            )
-            total_hmo = qs.aggregate(t=Sum("hmo_amount"))["t"] or 0
-            outstanding = total_hmo - total_paid
-
-            if outstanding <= 0:
-                continue
-
-            followup, created = HMOFollowUp.objects.get_or_create(
-                hmo_name=hmo,
-                period_start=start,
-                period_end=today,
-                defaults={
-                    "status": HMOFollowUp.Status.OPEN,
-                    "next_follow_up_at": today + timedelta(days=7),
-                }
-            )
+    help = (
+        "Generate weekly HMO packs (reminder letter + dispute sheet per HMO with money outstanding) "
+        "into a dated directory with a manifest, and schedule follow-ups"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Base directory (default: <BASE_DIR>/hmo_packs)")
+        parser.add_argument("--workers", type=int, default=2, help="Render processes (0 = render inline)")
+        parser.add_argument("--window-days", type=int, default=30, help="Follow-up period length")
+        parser.add_argument("--hmo", action="append", help="Only these HMOs (repeatable)")
+
+    @contextmanager
+    def _stage(self, name):
+        t0 = time.perf_counter()
+        self.stdout.write(f"[{name}] ...")
+        yield
+        self.stdout.write(f"[{name}] done in {time.perf_counter() - t0:.2f}s")
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        today = timezone.localdate(now)
+        start = today - timedelta(days=opts["window_days"])  # rolling window
 
-            followup.status = HMOFollowUp.Status.REMINDED
-            followup.last_action_at = timezone.now()
-            followup.next_follow_up_at = today + timedelta(days=7)
-            followup.save()
+        base = opts["output"] or os.path.join(settings.BASE_DIR, "hmo_packs")
+        out_dir = os.path.join(base, today.isoformat())
+        os.makedirs(out_dir, exist_ok=True)
 
-            self.stdout.write(self.style.SUCCESS(
-                f"Prepared weekly pack for {hmo} | Outstanding ₦{outstanding:,.2f}"
-            ))
+        with self._stage("collect"):
+            hmos = hmo_packs.outstanding_by_hmo()
+            if opts["hmo"]:
+                hmos = [h for h in hmos if h["hmo_name"] in opts["hmo"]]
+            self.stdout.write(f"  {len(hmos)} HMO(s) with outstanding balances")
+
+        jobs = [
+            {
+                "hmo_name": h["hmo_name"],
+                "outstanding": str(h["outstanding"]),
+                "invoices": h["invoices"],
+                "out_dir": out_dir,
+                "generated_at": now.isoformat(),
+            }
+            for h in hmos
+        ]
+
+        packs = []
+        with self._stage("render"):
+            for pack in hmo_packs.render_packs(jobs, workers=opts["workers"]):
+                packs.append(pack)
+                self.stdout.write(
+                    f"  [{len(packs)}/{len(jobs)}] {pack['hmo_name']}: "
+                    f"{pack['reminder']['lines']} reminder line(s), {pack['disputes']['lines']} dispute(s), "
+                    f"outstanding ₦{float(pack['outstanding']):,.2f} ({pack['seconds']:.2f}s)"
+                )
+
+        with self._stage("manifest"):
+            path = hmo_packs.write_manifest(
+                out_dir, generated_at=now, period_start=start, period_end=today, packs=packs,
+            )
+            self.stdout.write(f"  {path}")
+
+        with self._stage("follow-ups"):
+            created, updated = hmo_packs.upsert_followups(
+                [p["hmo_name"] for p in packs], period_start=start, period_end=today, now=now,
+            )
+            self.stdout.write(f"  {created} created, {updated} updated")
 
-        self.stdout.write(self.style.SUCCESS("Weekly HMO reminder packs generated."))
+        self.stdout.write(self.style.SUCCESS(f"Weekly HMO packs generated in {out_dir}"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from billing.pdf_service import prune_cache
+
+
+class Command(BaseCommand):
+    help = "Delete rendered PDFs not served recently, keeping PDF_CACHE_DIR under PDF_CACHE_MAX_MB (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age-days", type=int, help="Default: PDF_CACHE_MAX_AGE_DAYS")
+        parser.add_argument("--max-mb", type=int, help="Default: PDF_CACHE_MAX_MB")
+
+    def handle(self, *args, **options):
+        result = prune_cache(max_age_days=options["max_age_days"], max_mb=options["max_mb"])
+        self.stdout.write(self.style.SUCCESS(
+            f"PDF cache pruned: {result['deleted']} deleted, {result['kept']} kept "
+            f"({result['bytes'] / 1024 / 1024:.1f} MB)"
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from billing import aging
+
+
+class Command(BaseCommand):
+    help = "Nightly: re-age HMO receivables into 0-30/31-60/61-90/90+ and rebuild the aging summary"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Rebuild every receivable from invoices and HMO payments first (initial load / repair)",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if options["full"]:
+            n = aging.backfill_receivables()
+            self.stdout.write(f"Rebuilt {n} HMO receivable(s) from source.")
+
+        moved = aging.rebucket()
+        self.stdout.write(self.style.SUCCESS(f"HMO aging re-bucketed. Receivables moved: {moved}"))
@@ -0,0 +1,99 @@
+# Generated by Django 6.0 on 2026-10-17 20:35
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+
+def _bucket(days):
+    if days <= 30:
+        return "0-30"
+    if days <= 60:
+        return "31-60"
+    if days <= 90:
+        return "61-90"
+    return "90+"
+
+
+def backfill_ledger(apps, schema_editor):
+    """Receivables for existing HMO invoices, then the summary (what rebucket_hmo_aging rebuilds)."""
+    Invoice = apps.get_model("billing", "Invoice")
+    Payment = apps.get_model("billing", "Payment")
+    HMOReceivable = apps.get_model("billing", "HMOReceivable")
+    HMOAgingSummary = apps.get_model("billing", "HMOAgingSummary")
+
+    hmo_paid = dict(
+        Payment.objects.filter(method="HMO").values("invoice_id")
+        .annotate(total=Sum("amount")).values_list("invoice_id", "total")
+    )
+    today = timezone.localdate()
+    rows = []
+    invoices = (
+        Invoice.objects.filter(hmo_amount__gt=0)
+        .values_list("id", "hmo_name", "hmo_amount", "created_at").iterator(chunk_size=2000)
+    )
+    for inv_id, hmo_name, hmo_amount, created_at in invoices:
+        paid = Decimal(hmo_paid.get(inv_id) or 0)
+        invoiced_on = timezone.localdate(created_at)
+        rows.append(HMOReceivable(
+            invoice_id=inv_id,
+            hmo_name=(hmo_name or "").strip() or "UNKNOWN HMO",
+            invoiced_on=invoiced_on,
+            hmo_amount=hmo_amount,
+            hmo_paid=paid,
+            outstanding=(Decimal(hmo_amount) - paid).quantize(Decimal("0.01")),
+            bucket=_bucket((today - invoiced_on).days),
+        ))
+    HMOReceivable.objects.bulk_create(rows, batch_size=2000)
+
+    grouped = (
+        HMOReceivable.objects.filter(outstanding__gt=0).values("hmo_name", "bucket")
+        .annotate(total=Sum("outstanding"), n=Count("pk"))
+    )
+    HMOAgingSummary.objects.bulk_create([
+        HMOAgingSummary(hmo_name=g["hmo_name"], bucket=g["bucket"], total=g["total"], invoice_count=g["n"])
+        for g in grouped
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_alter_hmofollowup_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HMOAgingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hmo_name', models.CharField(max_length=120)),
+                ('bucket', models.CharField(max_length=8)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hmo_name', 'bucket'), name='billing_uniq_hmo_aging_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HMOReceivable',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='hmo_receivable', serialize=False, to='billing.invoice')),
+                ('hmo_name', models.CharField(max_length=120)),
+                ('invoiced_on', models.DateField()),
+                ('hmo_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('hmo_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bucket', models.CharField(default='0-30', max_length=8)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hmo_name', 'bucket'], name='billing_rcv_hmo_bucket_idx'), models.Index(fields=['-outstanding'], name='billing_rcv_outstanding_idx'), models.Index(fields=['invoiced_on'], name='billing_rcv_invoiced_on_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 20:37
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Collections per (day, method) from existing payments, one grouped query."""
+    Payment = apps.get_model("billing", "Payment")
+    DailyRevenueRollup = apps.get_model("billing", "DailyRevenueRollup")
+    grouped = (
+        Payment.objects.annotate(day=TruncDate("paid_at")).values("day", "method")
+        .annotate(total=Sum("amount"), n=Count("id"))
+    )
+    DailyRevenueRollup.objects.bulk_create([
+        DailyRevenueRollup(day=g["day"], method=g["method"], total=g["total"], payment_count=g["n"])
+        for g in grouped
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_hmo_aging_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('method', models.CharField(choices=[('CASH', 'Cash'), ('POS', 'POS'), ('TRANSFER', 'Transfer'), ('HMO', 'HMO Settlement')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payment_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'method'), name='billing_uniq_revenue_day_method')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
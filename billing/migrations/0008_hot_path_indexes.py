@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 20:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0007_daily_revenue_rollup'),
+        ('patients', '0002_alter_patient_user'),
+        ('visits', '0002_visit_chief_complaint_visit_closed_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hmofollowup',
+            index=models.Index(fields=['next_follow_up_at', 'status'], name='followup_due_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['hmo_name', 'created_at'], name='invoice_hmo_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-created_at'], name='invoice_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['method', 'invoice'], name='payment_method_invoice_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['paid_at'], name='payment_paid_at_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='fragment_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
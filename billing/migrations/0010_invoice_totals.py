@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 21:47
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Invoice = apps.get_model("billing", "Invoice")
+    InvoiceTotals = apps.get_model("billing", "InvoiceTotals")
+    totals = Invoice.objects.aggregate(outstanding=Sum("balance"), hmo=Sum("hmo_amount"))
+    InvoiceTotals.objects.create(pk=1, outstanding=totals["outstanding"] or 0, hmo_billed=totals["hmo"] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_invoice_fragment_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('hmo_billed', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+SHARDS = 16  # billing.revenue.TOTALS_SHARDS when this was written
+
+
+def create_shards(apps, schema_editor):
+    InvoiceTotals = apps.get_model("billing", "InvoiceTotals")
+    existing = set(InvoiceTotals.objects.values_list("pk", flat=True))
+    InvoiceTotals.objects.bulk_create([
+        InvoiceTotals(pk=shard, outstanding=0, hmo_billed=0)
+        for shard in range(1, SHARDS + 1) if shard not in existing
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shards, migrations.RunPython.noop),
+    ]
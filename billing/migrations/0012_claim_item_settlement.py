@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-17 22:22
+
+from django.db import migrations, models
+
+
+def backfill_settlement(apps, schema_editor):
+    """Stamp items whose invoice already has HMO payments, and reopen PAID batches left short."""
+    HMOClaimBatch = apps.get_model("billing", "HMOClaimBatch")
+    HMOClaimItem = apps.get_model("billing", "HMOClaimItem")
+    Payment = apps.get_model("billing", "Payment")
+
+    paid = {}  # invoice_id -> [total, last paid_at, last reference]
+    for invoice_id, amount, paid_at, reference in (
+        Payment.objects.filter(method="HMO").order_by("paid_at", "id")
+        .values_list("invoice_id", "amount", "paid_at", "reference").iterator()
+    ):
+        row = paid.setdefault(invoice_id, [0, None, ""])
+        row[0] += amount
+        row[1], row[2] = paid_at, reference
+
+    stamped = []
+    for item in HMOClaimItem.objects.filter(invoice_id__in=paid).iterator():
+        item.settled_amount, item.settled_at, item.settlement_reference = paid[item.invoice_id]
+        stamped.append(item)
+    HMOClaimItem.objects.bulk_update(
+        stamped, ["settled_at", "settled_amount", "settlement_reference"], batch_size=500,
+    )
+
+    short = (
+        HMOClaimItem.objects.filter(batch__status="PAID", hmo_amount__gt=0)
+        .exclude(settled_amount__gte=models.F("hmo_amount"))
+        .values_list("batch_id", flat=True)
+    )
+    HMOClaimBatch.objects.filter(pk__in=set(short)).update(status="PARTIAL")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0011_invoice_totals_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hmoclaimitem',
+            name='settled_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='hmoclaimitem',
+            name='settled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hmoclaimitem',
+            name='settlement_reference',
+            field=models.CharField(blank=True, max_length=80),
+        ),
+        migrations.RunPython(backfill_settlement, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,9 @@
 from django.conf import settings
 from django.db import models
-from django.utils import timezone
+from core import sequences
 from patients.models import Patient
 from visits.models import Visit
 
-import uuid
-
 
 class Invoice(models.Model):
     class Status(models.TextChoices):
@@ -42,32 +40,20 @@ class Invoice(models.Model):
     hmo_dispute_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     hmo_last_reminded_at = models.DateTimeField(null=True, blank=True)
 
-    @staticmethod
-    def _new_invoice_number() -> str:
-        """
-        Practically-unique invoice number:
-        INV-YYYYMMDD-HHMMSS-XXXXXX
-        """
-        ts = timezone.now().strftime("%Y%m%d-%H%M%S")
-        token = uuid.uuid4().hex[:6].upper()
-        return f"INV-{ts}-{token}"
-
-    def _ensure_unique_invoice_number(self):
-        """
-        If invoice_number is blank OR collides with an existing record,
-        regenerate until unique.
-        This fixes bad generators elsewhere (e.g. services) permanently.
-        """
-        # If blank, generate
-        if not self.invoice_number:
-            self.invoice_number = self._new_invoice_number()
-
-        # If colliding (for a different row), regenerate
-        while Invoice.objects.filter(invoice_number=self.invoice_number).exclude(pk=self.pk).exists():
-            self.invoice_number = self._new_invoice_number()
+    # bumped whenever lines or payments change; keys the cached page fragments (billing.fragments)
+    fragment_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # claims eligibility / reminders: one HMO, created within a period
+            models.Index(fields=["hmo_name", "created_at"], name="invoice_hmo_created_idx"),
+            # invoice list, newest first
+            models.Index(fields=["-created_at"], name="invoice_created_idx"),
+        ]
 
     def save(self, *args, **kwargs):
-        self._ensure_unique_invoice_number()
+        if self._state.adding and not self.invoice_number:
+            self.invoice_number = sequences.next_number(sequences.INVOICE)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -113,6 +99,14 @@ class Payment(models.Model):
 
     received_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
 
+    class Meta:
+        indexes = [
+            # HMO settlements per invoice (aging, weekly packs, settlement dedupe)
+            models.Index(fields=["method", "invoice"], name="payment_method_invoice_idx"),
+            # collections by date range (rollup backfill, reports)
+            models.Index(fields=["paid_at"], name="payment_paid_at_idx"),
+        ]
+
     def __str__(self):
         return f"{self.invoice.invoice_number} - {self.amount}"
 
@@ -126,7 +120,7 @@ class HMOClaimBatch(models.Model):
     period_end = models.DateField()
 
     created_at = models.DateTimeField(auto_now_add=True)
-    status = models.CharField(max_length=20, default="DRAFT")  # DRAFT, SUBMITTED, PAID
+    status = models.CharField(max_length=20, default="DRAFT")  # DRAFT, SUBMITTED, PARTIAL, PAID
 
     def __str__(self):
         return f"{self.hmo_name} ({self.period_start} to {self.period_end})"
@@ -147,6 +141,11 @@ class HMOClaimItem(models.Model):
     dispute_reason = models.TextField(blank=True)
     disputed_at = models.DateTimeField(null=True, blank=True)
 
+    # set once an HMO payment is posted for this item (billing.settlement); never posted twice
+    settled_at = models.DateTimeField(null=True, blank=True)
+    settled_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    settlement_reference = models.CharField(max_length=80, blank=True)
+
 
 class HMOFollowUp(models.Model):
     class Status(models.TextChoices):
@@ -168,5 +167,81 @@ class HMOFollowUp(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # follow-ups due: next_follow_up_at <= today, not settled
+            models.Index(fields=["next_follow_up_at", "status"], name="followup_due_status_idx"),
+        ]
+
     def __str__(self):
         return f"{self.hmo_name} ({self.period_start}–{self.period_end})"
+
+
+AGING_BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+
+
+class HMOReceivable(models.Model):
+    """
+    Materialized HMO receivable, one row per invoice with an HMO share.
+    Kept current by billing.aging as invoices and HMO payments change.
+    """
+    invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, primary_key=True, related_name="hmo_receivable")
+    hmo_name = models.CharField(max_length=120)
+    invoiced_on = models.DateField()
+
+    hmo_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    hmo_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bucket = models.CharField(max_length=8, default="0-30")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["hmo_name", "bucket"], name="billing_rcv_hmo_bucket_idx"),
+            models.Index(fields=["-outstanding"], name="billing_rcv_outstanding_idx"),
+            models.Index(fields=["invoiced_on"], name="billing_rcv_invoiced_on_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.hmo_name} / {self.invoice_id} ({self.outstanding})"
+
+
+class HMOAgingSummary(models.Model):
+    """Outstanding HMO totals per (HMO, aging bucket); what the aging dashboard reads."""
+    hmo_name = models.CharField(max_length=120)
+    bucket = models.CharField(max_length=8)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    invoice_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hmo_name", "bucket"], name="billing_uniq_hmo_aging_bucket"),
+        ]
+
+    def __str__(self):
+        return f"{self.hmo_name} {self.bucket}: {self.total}"
+
+
+class DailyRevenueRollup(models.Model):
+    """Collections per (day, payment method), maintained as payments post (billing.revenue)."""
+    day = models.DateField()
+    method = models.CharField(max_length=20, choices=Payment.Method.choices)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "method"], name="billing_uniq_revenue_day_method"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.method}: {self.total}"
+
+
+class InvoiceTotals(models.Model):
+    """Running Sum(balance) / Sum(hmo_amount) over all invoices, split over a few rows (billing.revenue)."""
+    outstanding = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    hmo_billed = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"outstanding {self.outstanding}, HMO {self.hmo_billed}"
@@ -0,0 +1,37 @@
+from django.utils import timezone
+
+from .pdf_paged import PagedTableWriter
+from .pdf_receipts import _money
+
+COVER_COLUMNS = [
+    ("Invoice", 36, "L"),
+    ("Hospital No", 26, "L"),
+    ("Patient", 54, "L"),
+    ("Visit", 28, "L"),
+    ("HMO Amount (₦)", 30, "R"),
+]
+
+
+def render_claim_cover_pdf(out, *, hospital, batch, rows, item_count, total_hmo, generated_at=None):
+    """
+    Write the claim cover sheet for `batch` to the file object `out`.
+    rows: iterable of (invoice no, hospital no, patient, visit no, HMO amount).
+    """
+    generated_at = generated_at or timezone.now()
+    writer = PagedTableWriter(
+        out,
+        hospital=hospital,
+        title="HMO CLAIM COVER SHEET",
+        columns=COVER_COLUMNS,
+        meta=[
+            f"HMO: {batch.hmo_name}",
+            f"Batch #{batch.id} • Period: {batch.period_start:%b %d, %Y} to {batch.period_end:%b %d, %Y}",
+            f"Claim lines: {item_count} • Amount claimed: ₦{_money(total_hmo)}",
+            f"Generated: {generated_at:%b %d, %Y %H:%M}",
+        ],
+    )
+    return writer.write(rows, closing=[
+        "Please find attached the claim lines listed above for the stated period. "
+        "Kindly acknowledge receipt and advise on any query within 14 days.",
+        "Billing/Accounts Department",
+    ])
@@ -0,0 +1,41 @@
+from io import BytesIO
+from django.utils import timezone
+
+from .pdf_paged import PagedTableWriter
+
+
+DISPUTE_COLUMNS = [
+    ("Invoice", 36, "L"),
+    ("Hospital No", 26, "L"),
+    ("Patient", 44, "L"),
+    ("Reason", 42, "L"),
+    ("Disputed (₦)", 26, "R"),
+]
+
+
+def build_hmo_dispute_pdf(*, hospital, hmo_name: str, rows, generated_at=None, out=None):
+    """
+    Dispute sheet listing an HMO's disputed invoices, paged like the reminder.
+    rows: iterable of (invoice no, hospital no, patient, reason, disputed amount).
+    Writes to `out` when given (returns (row count, total)), else returns the PDF bytes.
+    """
+    if generated_at is None:
+        generated_at = timezone.now()
+
+    buf = out if out is not None else BytesIO()
+    writer = PagedTableWriter(
+        buf,
+        hospital=hospital,
+        title="HMO DISPUTE SHEET",
+        columns=DISPUTE_COLUMNS,
+        meta=[f"HMO: {hmo_name}", f"Generated: {generated_at.strftime('%b %d, %Y %H:%M')}"],
+        intro="The invoices below are under query. Kindly review the stated reasons and advise so we can resolve promptly.",
+    )
+    result = writer.write(rows, closing=[
+        "For clarification, contact Billing/Accounts Department. This document was generated from EDH HMS.",
+    ])
+    if out is not None:
+        return result
+    pdf = buf.getvalue()
+    buf.close()
+    return pdf
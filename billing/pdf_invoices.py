@@ -0,0 +1,129 @@
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from .pdf_receipts import _money
+
+
+def render_invoice_pdf(*, hospital, invoice, lines, payments) -> bytes:
+    """
+    Render an invoice (header, line items with patient/HMO split, payments,
+    totals) with ReportLab. Returns PDF bytes.
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+
+    width, height = A4
+    left = 18 * mm
+    right = width - 18 * mm
+    bottom = 20 * mm
+
+    def header():
+        y = height - 20 * mm
+        c.setFont("Helvetica-Bold", 14)
+        c.drawCentredString(width / 2, y, getattr(hospital, "name", "Hospital"))
+        y -= 6 * mm
+        c.setFont("Helvetica", 9)
+        addr = getattr(hospital, "address", "")
+        if addr:
+            c.drawCentredString(width / 2, y, addr)
+            y -= 4.5 * mm
+        phone = getattr(hospital, "phone", "")
+        email = getattr(hospital, "email", "")
+        c.drawCentredString(width / 2, y, f"{phone} • {email}".strip(" •"))
+        y -= 6 * mm
+        c.setDash(3, 2)
+        c.line(left, y, right, y)
+        c.setDash()
+        return y - 8 * mm
+
+    def columns(y):
+        c.setFont("Helvetica-Bold", 8.5)
+        c.drawString(left, y, "Description")
+        c.drawRightString(left + 105 * mm, y, "Qty")
+        c.drawRightString(left + 125 * mm, y, "Unit")
+        c.drawRightString(left + 150 * mm, y, "Patient")
+        c.drawRightString(right, y, "HMO")
+        y -= 2 * mm
+        c.line(left, y, right, y)
+        return y - 5 * mm
+
+    y = header()
+
+    # ---- Invoice / patient block ----
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(left, y, f"INVOICE {invoice.invoice_number}")
+    c.setFont("Helvetica", 9)
+    created_at = getattr(invoice, "created_at", None)
+    c.drawRightString(right, y, created_at.strftime("%b %d, %Y %H:%M") if created_at else "")
+    y -= 7 * mm
+
+    patient = invoice.patient
+    c.drawString(left, y, f"Patient: {patient.last_name} {patient.first_name}".strip())
+    c.drawRightString(right, y, f"Hospital No: {patient.hospital_number}")
+    y -= 5 * mm
+    if invoice.visit_number:
+        c.drawString(left, y, f"Visit: {invoice.visit_number}")
+    if invoice.hmo_name:
+        c.drawRightString(right, y, f"HMO: {invoice.hmo_name}")
+    y -= 10 * mm
+
+    # ---- Lines ----
+    y = columns(y)
+    c.setFont("Helvetica", 8.5)
+    for line in lines:
+        if y < bottom + 40 * mm:
+            c.showPage()
+            y = columns(header())
+            c.setFont("Helvetica", 8.5)
+        c.drawString(left, y, str(line.description)[:70])
+        c.drawRightString(left + 105 * mm, y, str(line.qty))
+        c.drawRightString(left + 125 * mm, y, _money(line.unit_price))
+        c.drawRightString(left + 150 * mm, y, _money(line.patient_share))
+        c.drawRightString(right, y, _money(line.hmo_share))
+        y -= 5.5 * mm
+
+    y -= 2 * mm
+    c.line(left, y, right, y)
+    y -= 7 * mm
+
+    # ---- Totals ----
+    def total(label, value, bold=False):
+        nonlocal y
+        c.setFont("Helvetica-Bold" if bold else "Helvetica", 9)
+        c.drawString(left + 95 * mm, y, label)
+        c.drawRightString(right, y, f"₦{_money(value)}")
+        y -= 5.5 * mm
+
+    total("Total", invoice.total_amount)
+    total("HMO Share", invoice.hmo_amount)
+    total("Patient Share", invoice.patient_amount)
+    total("Amount Paid", invoice.amount_paid)
+    total("Balance", invoice.balance, bold=True)
+    c.setFont("Helvetica", 9)
+    c.drawString(left, y + 5.5 * mm, f"Status: {invoice.status}")
+
+    # ---- Payments ----
+    if payments:
+        y -= 5 * mm
+        c.setFont("Helvetica-Bold", 9)
+        c.drawString(left, y, "Payments")
+        y -= 5.5 * mm
+        c.setFont("Helvetica", 8.5)
+        for p in payments:
+            if y < bottom:
+                c.showPage()
+                y = header()
+                c.setFont("Helvetica", 8.5)
+            paid_at = p.paid_at.strftime("%b %d, %Y %H:%M") if p.paid_at else ""
+            c.drawString(left, y, f"{paid_at}  {p.method}  {p.reference or ''}".strip())
+            c.drawRightString(right, y, f"₦{_money(p.amount)}")
+            y -= 5 * mm
+
+    c.showPage()
+    c.save()
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
@@ -0,0 +1,189 @@
+"""
+Paged table writer for long HMO documents (claim covers, reminders).
+
+Rows are consumed from an iterator one page at a time and drawn straight
+onto a ReportLab canvas, so Python only ever holds one page of rows. A
+platypus Table would hold and lay out every cell at once. The canvas does
+keep each finished page's compressed stream until save(), roughly
+0.5 KB per row. Each page
+repeats the column header and closes with its subtotal and the running
+total carried forward. The caller passes a file object, usually a temp
+file that is then streamed to the client.
+"""
+from decimal import Decimal
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .pdf_receipts import _money
+
+PAGE_W, PAGE_H = A4
+LEFT = 18 * mm
+RIGHT = PAGE_W - 18 * mm
+BOTTOM = 22 * mm
+ROW_H = 6 * mm
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+FONT_SIZE = 8.5
+
+
+def _fit(text, width, font=FONT, size=FONT_SIZE) -> str:
+    text = str(text)
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + "…", font, size) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _wrap(text, width, font=FONT, size=9) -> list:
+    lines, current = [], ""
+    for word in str(text).split():
+        candidate = f"{current} {word}".strip()
+        if current and stringWidth(candidate, font, size) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+
+class PagedTableWriter:
+    """
+    columns: [(heading, width_mm, align)] with align "L" or "R"; the last
+    column is the amount that page subtotals and the running total sum.
+    """
+
+    def __init__(self, out, *, hospital, title, columns, meta=(), intro=""):
+        self.c = canvas.Canvas(out, pagesize=A4, pageCompression=1)
+        self.c.setTitle(title)
+        self.hospital = hospital
+        self.title = title
+        self.columns = [(h, w * mm, a) for h, w, a in columns]
+        self.meta = list(meta)
+        self.intro = intro
+        self.page = 0
+        self.count = 0
+        self.total = Decimal("0.00")
+
+    # -- page furniture ------------------------------------------------
+    def _hospital_header(self, y):
+        c = self.c
+        c.setFont(FONT_BOLD, 13)
+        c.drawString(LEFT, y, getattr(self.hospital, "name", "Hospital"))
+        y -= 5 * mm
+        c.setFont(FONT, 8.5)
+        c.setFillGray(0.35)
+        contact = " • ".join(
+            x for x in (getattr(self.hospital, "address", ""), getattr(self.hospital, "phone", ""),
+                        getattr(self.hospital, "email", "")) if x
+        )
+        if contact:
+            c.drawString(LEFT, y, _fit(contact, RIGHT - LEFT, size=8.5))
+            y -= 5 * mm
+        c.setFillGray(0)
+        return y
+
+    def _start_page(self):
+        c = self.c
+        self.page += 1
+        y = PAGE_H - 16 * mm
+        if self.page == 1:
+            y = self._hospital_header(y) - 3 * mm
+            c.setFont(FONT_BOLD, 11)
+            c.drawString(LEFT, y, self.title)
+            y -= 5.5 * mm
+            c.setFont(FONT, 9)
+            for line in self.meta:
+                c.drawString(LEFT, y, line)
+                y -= 4.8 * mm
+            if self.intro:
+                y -= 2 * mm
+                for line in _wrap(self.intro, RIGHT - LEFT):
+                    c.drawString(LEFT, y, line)
+                    y -= 4.5 * mm
+            y -= 4 * mm
+        else:
+            c.setFont(FONT_BOLD, 10)
+            c.drawString(LEFT, y, f"{self.title} (continued)")
+            c.setFont(FONT, 9)
+            c.drawRightString(RIGHT, y, f"Brought forward: ₦{_money(self.total)}")
+            y -= 8 * mm
+
+        # column header, repeated on every page
+        c.setFillColor(colors.HexColor("#F6F7FB"))
+        c.rect(LEFT, y - 2 * mm, RIGHT - LEFT, ROW_H, stroke=0, fill=1)
+        c.setFillGray(0)
+        self._draw_row([h for h, _, _ in self.columns], y, FONT_BOLD)
+        return y - ROW_H
+
+    def _end_page(self, page_total, last=False):
+        c = self.c
+        y = BOTTOM - 6 * mm
+        c.setStrokeColor(colors.HexColor("#E5E7EB"))
+        c.line(LEFT, y + 4 * mm, RIGHT, y + 4 * mm)
+        c.setStrokeGray(0)
+        c.setFont(FONT, 8.5)
+        c.drawString(LEFT, y, f"Page {self.page}")
+        label = "Total" if last else "Carried forward"
+        c.drawRightString(
+            RIGHT, y, f"Page subtotal: ₦{_money(page_total)}    {label}: ₦{_money(self.total)}",
+        )
+        c.showPage()
+
+    def _draw_row(self, values, y, font=FONT):
+        x = LEFT
+        self.c.setFont(font, FONT_SIZE)
+        for value, (_, width, align) in zip(values, self.columns):
+            text = _fit(value, width - 2 * mm, font)
+            if align == "R":
+                self.c.drawRightString(x + width - 1 * mm, y, text)
+            else:
+                self.c.drawString(x + 1 * mm, y, text)
+            x += width
+
+    # -- body ------------------------------------------------------------
+    def write(self, rows, *, closing=()):
+        """Draw every row (amount last), then the closing lines; returns (row count, total)."""
+        y = self._start_page()
+        page_total = Decimal("0.00")
+        for row in rows:
+            if y < BOTTOM + ROW_H:
+                self._end_page(page_total)
+                page_total = Decimal("0.00")
+                y = self._start_page()
+            amount = Decimal(row[-1] or 0)
+            self._draw_row(list(row[:-1]) + [_money(amount)], y)
+            page_total += amount
+            self.total += amount
+            self.count += 1
+            y -= ROW_H
+
+        if self.count == 0:
+            self.c.setFont(FONT, 9)
+            self.c.drawString(LEFT, y, "No rows.")
+            y -= ROW_H
+
+        # grand total + closing text, on a fresh page if they don't fit
+        closing_lines = [line for text in closing for line in (_wrap(text, RIGHT - LEFT) or [""])]
+        if y - (len(closing_lines) + 3) * 5 * mm < BOTTOM:
+            self._end_page(page_total)
+            page_total = Decimal("0.00")
+            y = self._start_page()
+        y -= 3 * mm
+        self.c.setFont(FONT_BOLD, 11)
+        self.c.drawRightString(RIGHT, y, f"Total: ₦{_money(self.total)} ({self.count} line{'s' if self.count != 1 else ''})")
+        y -= 8 * mm
+        self.c.setFont(FONT, 9)
+        for line in closing_lines:
+            self.c.drawString(LEFT, y, line)
+            y -= 4.5 * mm
+
+        self._end_page(page_total, last=True)
+        self.c.save()
+        return self.count, self.total
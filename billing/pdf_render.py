@@ -0,0 +1,32 @@
+"""
+PDF render entry point for the worker processes (see billing.pdf_service).
+
+Documents arrive as plain JSON-able dicts (no model instances), so a
+worker only needs the renderers, not the ORM.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+from .pdf_invoices import render_invoice_pdf
+from .pdf_receipts import render_receipt_pdf
+
+
+def _ns(value, key=""):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _ns(v, k) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_ns(v) for v in value]
+    if key.endswith("_at") and isinstance(value, str) and value:
+        return datetime.fromisoformat(value)
+    return value
+
+
+RENDERERS = {
+    "invoice": render_invoice_pdf,
+    "receipt": render_receipt_pdf,
+}
+
+
+def render_document(kind, doc) -> bytes:
+    """doc is {"hospital": {...}, "invoice": {...}, ...}: the renderer's keyword arguments."""
+    return RENDERERS[kind](**{name: _ns(part) for name, part in doc.items()})
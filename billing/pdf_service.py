@@ -0,0 +1,321 @@
+"""
+Cached, pooled PDF rendering.
+
+A document is first reduced to the plain rows it is drawn from. The
+SHA-256 of those rows (plus RENDER_VERSION) names the rendered file in
+PDF_CACHE_DIR and doubles as the HTTP ETag. A reprint is a 304 or a file
+read, and a changed invoice gets a new key by construction.
+
+Cache misses render in a small process pool so ReportLab's CPU time stays
+off the web worker's GIL. At most PDF_RENDER_QUEUE renders may be in flight
+per web process. Beyond that the caller gets PDFRenderBusy (503 + Retry-After)
+instead of piling up behind the pool. PDF_RENDER_WORKERS = 0 renders
+inline, for hosts that don't allow subprocesses.
+
+Every edit leaves its old files behind, so `prune_pdf_cache` (prune_cache)
+deletes files not served for PDF_CACHE_MAX_AGE_DAYS and then the least
+recently served ones until the directory fits in PDF_CACHE_MAX_MB. A cache
+hit touches the file's mtime, which is what "recently served" means here.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Sum
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import Payment
+from .pdf_render import render_document
+from .services import patient_payments
+
+# bump when a renderer's layout changes so old files stop matching
+RENDER_VERSION = "1"
+
+HOSPITAL_META = {
+    "name": "EMPRESS DESIRE HOSPITAL",
+    "address": "Port Harcourt, Rivers State, Nigeria",
+    "phone": "+2348067086554",
+    "email": "info@empressdesirehospital.com",
+}
+
+
+class PDFRenderBusy(Exception):
+    """Every render slot is taken; try again shortly."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def cache_dir():
+    return _setting("PDF_CACHE_DIR", os.path.join(settings.BASE_DIR, "pdf_cache"))
+
+
+# ------------------------------------------------------------------
+# Source rows
+# ------------------------------------------------------------------
+def _dt(value):
+    return value.isoformat() if value else ""
+
+
+def _patient(patient):
+    return {
+        "last_name": patient.last_name,
+        "first_name": patient.first_name,
+        "hospital_number": patient.hospital_number,
+    }
+
+
+def invoice_document(invoice):
+    """Invoice with patient and visit loaded; lines and payments are read here (two queries)."""
+    lines = invoice.lines.order_by("id").values_list(
+        "description", "qty", "unit_price", "line_total", "patient_share", "hmo_share",
+    )
+    payments = invoice.payments.order_by("paid_at", "id").values_list("paid_at", "method", "reference", "amount")
+    return {
+        "hospital": HOSPITAL_META,
+        "invoice": {
+            "invoice_number": invoice.invoice_number,
+            "created_at": _dt(invoice.created_at),
+            "status": invoice.get_status_display(),
+            "hmo_name": invoice.hmo_name,
+            "visit_number": invoice.visit.visit_number if invoice.visit_id else "",
+            "patient": _patient(invoice.patient),
+            "total_amount": str(invoice.total_amount),
+            "patient_amount": str(invoice.patient_amount),
+            "hmo_amount": str(invoice.hmo_amount),
+            "amount_paid": str(invoice.amount_paid),
+            "balance": str(invoice.balance),
+        },
+        "lines": [
+            {
+                "description": d, "qty": str(q), "unit_price": str(u), "line_total": str(t),
+                "patient_share": str(ps), "hmo_share": str(hs),
+            }
+            for d, q, u, t, ps, hs in lines
+        ],
+        "payments": [
+            {"paid_at": _dt(at), "method": Payment.Method(m).label, "reference": ref, "amount": str(a)}
+            for at, m, ref, a in payments
+        ],
+    }
+
+
+def receipt_document(invoice, payment):
+    """
+    A receipt as of its payment: paid-to-date is summed from the payments up
+    to and including this one (counted the way amount_paid counts them), not
+    derived from the live invoice, so later payments, HMO settlements and
+    invoice rebuilds leave the document (and its cache key) alone.
+    """
+    paid = (
+        patient_payments(invoice.payments.filter(pk__lte=payment.pk)).aggregate(total=Sum("amount"))["total"]
+        or Decimal("0.00")
+    ).quantize(Decimal("0.01"))
+    return {
+        "hospital": HOSPITAL_META,
+        "invoice": {
+            "invoice_number": invoice.invoice_number,
+            "patient": _patient(invoice.patient),
+            "patient_amount": str(invoice.patient_amount),
+            "amount_paid": str(paid),
+            "balance": str(Decimal(invoice.patient_amount) - paid),
+        },
+        "payment": {
+            "paid_at": _dt(payment.paid_at),
+            "amount": str(payment.amount),
+            "method": payment.get_method_display(),
+            "reference": payment.reference,
+        },
+    }
+
+
+def document_key(kind, doc) -> str:
+    raw = json.dumps([RENDER_VERSION, kind, doc], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cached_path(key) -> str:
+    return os.path.join(cache_dir(), key[:2], f"{key}.pdf")
+
+
+# ------------------------------------------------------------------
+# Rendering
+# ------------------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_inflight = {}  # key -> _Pending, so concurrent requests for one document render once
+
+
+class _Pending:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def wait(self):
+        self._event.wait(_setting("PDF_RENDER_TIMEOUT", 60))
+
+    def done(self):
+        self._event.set()
+
+
+def _executor():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded WSGI process is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=_setting("PDF_RENDER_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _slots = threading.BoundedSemaphore(_setting("PDF_RENDER_QUEUE", 8))
+        return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def _write(path, pdf_bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(pdf_bytes)
+    os.replace(tmp, path)  # atomic: readers never see a half-written file
+
+
+def _render(kind, doc):
+    if not _setting("PDF_RENDER_WORKERS", 2):
+        return render_document(kind, doc)
+
+    pool = _executor()
+    if not _slots.acquire(timeout=_setting("PDF_RENDER_QUEUE_WAIT", 2)):
+        raise PDFRenderBusy
+    try:
+        return pool.submit(render_document, kind, doc).result(timeout=_setting("PDF_RENDER_TIMEOUT", 60))
+    except BrokenProcessPool:
+        # a worker died (OOM, killed): start a fresh pool next time, render this one here
+        _reset_pool(pool)
+        return render_document(kind, doc)
+    finally:
+        _slots.release()
+
+
+def _touch(path) -> bool:
+    """Mark a cached file as just served; False if it is not (or no longer) there."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def render_cached(kind, doc):
+    """(key, path) of the rendered document, rendering it on a cache miss."""
+    key = document_key(kind, doc)
+    path = cached_path(key)
+    if _touch(path):
+        return key, path
+
+    with _pool_lock:
+        pending = _inflight.get(key)
+        owner = pending is None
+        if owner:
+            pending = _inflight[key] = _Pending()
+    if not owner:
+        pending.wait()
+        if os.path.exists(path):
+            return key, path
+
+    try:
+        _write(path, _render(kind, doc))
+    finally:
+        if owner:
+            with _pool_lock:
+                _inflight.pop(key, None)
+            pending.done()
+    return key, path
+
+
+def prune_cache(max_age_days=None, max_mb=None, now=None) -> dict:
+    """
+    Delete cached PDFs not served for max_age_days, then the least recently
+    served until the rest fit in max_mb. {"deleted": n, "kept": n, "bytes": kept size}.
+    """
+    max_age_days = _setting("PDF_CACHE_MAX_AGE_DAYS", 30) if max_age_days is None else max_age_days
+    max_mb = _setting("PDF_CACHE_MAX_MB", 500) if max_mb is None else max_mb
+    cutoff = (now or time.time()) - max_age_days * 86400
+
+    root = cache_dir()
+    files = []
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+
+    files.sort(reverse=True)  # most recently served first
+    kept, total, doomed = 0, 0, []
+    for mtime, size, path in files:
+        if mtime < cutoff or total + size > max_mb * 1024 * 1024:
+            doomed.append(path)
+        else:
+            kept += 1
+            total += size
+
+    for path in doomed:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    for dirpath, _, _ in os.walk(root, topdown=False):
+        if dirpath != str(root):
+            try:
+                os.rmdir(dirpath)  # only succeeds once the shard is empty
+            except OSError:
+                pass
+    return {"deleted": len(doomed), "kept": kept, "bytes": total}
+
+
+def _open_cached(kind, doc):
+    """The rendered file, opened; re-rendered if prune_cache removed it between the lookup and the open."""
+    _, path = render_cached(kind, doc)
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        _, path = render_cached(kind, doc)
+        return open(path, "rb")
+
+
+def pdf_response(request, kind, doc, filename):
+    """Serve a document: 304 on a matching ETag, else the cached (or freshly rendered) file."""
+    etag = f'"{document_key(kind, doc)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            fh = _open_cached(kind, doc)
+        except PDFRenderBusy:
+            response = HttpResponse("PDF renderer busy, please retry.", status=503, content_type="text/plain")
+            response["Retry-After"] = "5"
+            return response
+        response = FileResponse(fh, content_type="application/pdf")
+        response["Content-Disposition"] = f'inline; filename="{filename}"'
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
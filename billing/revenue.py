@@ -0,0 +1,165 @@
+"""
+Revenue dashboard snapshot.
+
+DailyRevenueRollup keeps collections per (day, method) as payments post, so
+the dashboard sums at most ~31 days x 4 methods instead of scanning Payment.
+InvoiceTotals keeps the outstanding and HMO-billed totals the same way:
+invoice saves move it by the change in balance / hmo_amount (billing.signals)
+and post_payment by the amount paid, so a snapshot build is two small reads
+whatever the size of the invoice table. The totals are spread over
+TOTALS_SHARDS rows picked by invoice id and summed on read, so billing
+writes on different invoices don't all queue on one row lock (writes to the
+same invoice already serialize on the invoice row).
+The assembled snapshot is cached and invalidated when a payment or invoice
+change commits (see billing.signals); dropping the key any earlier would let
+a concurrent request re-cache the pre-commit figures. The TTL only bounds
+staleness for other processes sharing no cache backend. A snapshot built
+from the read replica (the dashboard is @read_only_replica) is served but
+not cached: it may lag the primary, and caching it would undo the
+invalidation for the whole TTL.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from billing.models import DailyRevenueRollup, Invoice, InvoiceTotals, Payment
+from core.replicas import reading_replica
+
+SNAPSHOT_CACHE_KEY = "billing:revenue_dashboard:{day}"
+SNAPSHOT_TTL = 300  # seconds
+TREND_DAYS = 30
+TOTALS_SHARDS = 16
+
+
+def _shift_or_create(row, shift, create):
+    """UPDATE `row` by the F() `shift`; if it doesn't exist yet, create() it, tolerating a concurrent creator."""
+    if row.update(**shift):
+        return
+    try:
+        with transaction.atomic():  # savepoint: losing the race must not abort the caller's transaction
+            create()
+    except IntegrityError:
+        row.update(**shift)  # another writer created the row first
+
+
+def shift_rollup(day, method, amount, count):
+    """Move one (day, method) rollup row by `amount` and `count` payments."""
+    _shift_or_create(
+        DailyRevenueRollup.objects.filter(day=day, method=method),
+        {"total": F("total") + amount, "payment_count": F("payment_count") + count},
+        lambda: DailyRevenueRollup.objects.create(day=day, method=method, total=amount, payment_count=count),
+    )
+
+
+def record_payment(payment, reverse=False):
+    """Roll one payment into (or, with reverse=True, out of) its day/method bucket."""
+    sign = -1 if reverse else 1
+    day = timezone.localdate(payment.paid_at)
+    shift_rollup(day, payment.method, sign * Decimal(payment.amount), sign)
+    transaction.on_commit(invalidate_snapshot)
+
+
+def shift_totals(outstanding=0, hmo=0, invoice_id=0):
+    """Move the running invoice totals by the given deltas (on the shard of `invoice_id`)."""
+    if not outstanding and not hmo:
+        return
+    shard = invoice_id % TOTALS_SHARDS + 1
+    _shift_or_create(
+        InvoiceTotals.objects.filter(pk=shard),
+        {"outstanding": F("outstanding") + outstanding, "hmo_billed": F("hmo_billed") + hmo},
+        lambda: InvoiceTotals.objects.create(pk=shard, outstanding=outstanding, hmo_billed=hmo),
+    )
+    transaction.on_commit(invalidate_snapshot)
+
+
+@transaction.atomic
+def rebuild_totals():
+    """Recompute InvoiceTotals from the invoice table (one aggregate, kept in a single row)."""
+    totals = Invoice.objects.aggregate(outstanding=Sum("balance"), hmo=Sum("hmo_amount"))
+    InvoiceTotals.objects.all().delete()
+    InvoiceTotals.objects.create(pk=1, outstanding=totals["outstanding"] or 0, hmo_billed=totals["hmo"] or 0)
+    transaction.on_commit(invalidate_snapshot)
+
+
+def invalidate_snapshot(day=None):
+    cache.delete(SNAPSHOT_CACHE_KEY.format(day=day or timezone.localdate()))
+
+
+@transaction.atomic
+def backfill_rollups(since=None) -> int:
+    """Recompute rollups from Payment (from `since` onwards, or everything) with one grouped query."""
+    payments = Payment.objects.all()
+    rollups = DailyRevenueRollup.objects.all()
+    if since is not None:
+        payments = payments.filter(paid_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+        rollups = rollups.filter(day__gte=since)
+
+    grouped = (
+        payments.annotate(day=TruncDate("paid_at"))
+        .values("day", "method")
+        .annotate(total=Sum("amount"), n=Count("id"))
+    )
+    rows = [
+        DailyRevenueRollup(day=g["day"], method=g["method"], total=g["total"], payment_count=g["n"])
+        for g in grouped
+    ]
+    rollups.delete()
+    DailyRevenueRollup.objects.bulk_create(rows, batch_size=1000)
+    transaction.on_commit(invalidate_snapshot)
+    return len(rows)
+
+
+def _build_snapshot(today):
+    start = today.replace(day=1)  # month-to-date
+    last30 = today - timedelta(days=TREND_DAYS - 1)
+    window_start = min(start, last30)
+
+    # one read covers today, MTD, trend and method breakdown
+    rollups = list(
+        DailyRevenueRollup.objects.filter(day__gte=window_start, day__lte=today)
+        .values_list("day", "method", "total")
+    )
+
+    payments_today = sum((t for d, m, t in rollups if d == today), Decimal("0.00"))
+    payments_mtd = sum((t for d, m, t in rollups if d >= start), Decimal("0.00"))
+
+    trend_map, method_map = {}, {}
+    for d, m, t in rollups:
+        if d < last30:
+            continue
+        trend_map[d] = trend_map.get(d, Decimal("0.00")) + t
+        method_map[m] = method_map.get(m, Decimal("0.00")) + t
+
+    trend = [{"day": d.isoformat(), "total": float(t)} for d, t in sorted(trend_map.items()) if t]
+    by_method = [
+        {"method": m, "total": float(t)}
+        for m, t in sorted(method_map.items(), key=lambda x: x[1], reverse=True) if t
+    ]
+
+    # Outstanding + HMO receivables, from the running totals shards
+    totals = InvoiceTotals.objects.aggregate(outstanding=Sum("outstanding"), hmo_billed=Sum("hmo_billed"))
+
+    return {
+        "payments_today": payments_today,
+        "payments_mtd": payments_mtd,
+        "outstanding": totals.get("outstanding") or 0,
+        "hmo_receivables": totals.get("hmo_billed") or 0,
+        "trend": trend,
+        "by_method": by_method,
+    }
+
+
+def dashboard_snapshot(today=None):
+    today = today or timezone.localdate()
+    key = SNAPSHOT_CACHE_KEY.format(day=today)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = _build_snapshot(today)
+        if not reading_replica():
+            cache.set(key, snapshot, SNAPSHOT_TTL)
+    return snapshot
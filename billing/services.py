@@ -1,67 +1,168 @@
 from decimal import Decimal
-from billing.models import Invoice, InvoiceLine
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+
+from billing import fragments, revenue
+from billing.models import Invoice, InvoiceLine, Payment
 from billing.utils import split_amount
-from pharmacy.models import PrescriptionItem
+from patients.models import Patient
 
 CONSULTATION_FEE = Decimal("5000.00")  # adjust for EDH
 
-def generate_invoice_for_visit(visit, user=None):
-    patient = visit.patient
-
-    invoice, created = Invoice.objects.get_or_create(
-        visit=visit,
-        defaults={"patient": patient, "created_by": user}
-    )
+# Fields rewritten on every rebuild (everything except identity/ownership).
+INVOICE_TOTAL_FIELDS = [
+    "hmo_name", "total_amount", "patient_amount", "hmo_amount",
+    "amount_paid", "balance", "status",
+]
 
-    # Clear existing lines (safe rebuild)
-    invoice.lines.all().delete()
 
-    # 1) Consultation
-    ps, hs = split_amount(CONSULTATION_FEE, patient.is_hmo)
-    InvoiceLine.objects.create(
+def _line(invoice, line_type, description, unit_price, is_hmo, qty=1):
+    """Unsaved InvoiceLine with shares + line_total filled in (bulk_create skips save())."""
+    unit_price = Decimal(unit_price or 0)
+    qty = Decimal(qty)
+    ps, hs = split_amount(unit_price * qty, is_hmo)
+    return InvoiceLine(
         invoice=invoice,
-        line_type=InvoiceLine.LineType.CONSULTATION,
-        description="Consultation Fee",
-        qty=1,
-        unit_price=CONSULTATION_FEE,
+        line_type=line_type,
+        description=description,
+        qty=qty,
+        unit_price=unit_price,
+        line_total=qty * unit_price,
         patient_share=ps,
         hmo_share=hs,
     )
 
-        
 
-    # 3) Drugs prescribed
+def build_invoice_lines(visit, invoice, is_hmo: bool) -> list:
+    """
+    Compute every billable line for a visit in memory.
+    Costs one query (prescriptions + drug); nothing is written.
+    """
+    lines = [
+        _line(invoice, InvoiceLine.LineType.CONSULTATION, "Consultation Fee", CONSULTATION_FEE, is_hmo),
+    ]
+
     for rx in visit.prescriptions.select_related("drug").all():
-        price = Decimal(rx.drug.price or 0)
-        ps, hs = split_amount(price, patient.is_hmo)
-        InvoiceLine.objects.create(
-            invoice=invoice,
-            line_type=InvoiceLine.LineType.DRUG,
-            description=f"Drug: {rx.drug}",
-            qty=1,
-            unit_price=price,
-            patient_share=ps,
-            hmo_share=hs,
-        )
+        lines.append(_line(invoice, InvoiceLine.LineType.DRUG, f"Drug: {rx.drug}", rx.drug.price, is_hmo))
 
-    # Totals
-    total = sum((l.line_total for l in invoice.lines.all()), Decimal("0.00"))
-    patient_amount = sum((l.patient_share for l in invoice.lines.all()), Decimal("0.00"))
-    hmo_amount = sum((l.hmo_share for l in invoice.lines.all()), Decimal("0.00"))
-    invoice.hmo_name = patient.hmo.name if patient.is_hmo and patient.hmo else ""
+    return lines
 
-    invoice.total_amount = total
-    invoice.patient_amount = patient_amount
-    invoice.hmo_amount = hmo_amount
-    invoice.amount_paid = sum((p.amount for p in invoice.payments.all()), Decimal("0.00"))
+
+def invoice_status_for(balance, amount_paid) -> str:
+    if balance <= 0:
+        return Invoice.Status.PAID
+    if amount_paid > 0:
+        return Invoice.Status.PARTIAL
+    return Invoice.Status.UNPAID
+
+
+def apply_line_totals(invoice, lines, amount_paid) -> None:
+    """Derive invoice totals from in-memory lines (no lazy re-reads of invoice.lines)."""
+    invoice.total_amount = sum((l.line_total for l in lines), Decimal("0.00"))
+    invoice.patient_amount = sum((l.patient_share for l in lines), Decimal("0.00"))
+    invoice.hmo_amount = sum((l.hmo_share for l in lines), Decimal("0.00"))
+    invoice.amount_paid = Decimal(amount_paid or 0)
     invoice.balance = (invoice.patient_amount - invoice.amount_paid).quantize(Decimal("0.01"))
+    invoice.status = invoice_status_for(invoice.balance, invoice.amount_paid)
+
+
+@transaction.atomic
+def generate_invoice_for_visit(visit, user=None):
+    """
+    Build (or rebuild) the invoice for a visit in one transaction.
+
+    Lines and shares are computed in memory and written with a single
+    bulk_create; totals come from that same list. Query budget:
+      new invoice      -> patient, prescriptions, invoice lookup, insert invoice, bulk insert lines
+      existing invoice -> patient, prescriptions, invoice lookup (locked), delete lines,
+                          bulk insert lines, payments sum, update invoice
+    plus one UPDATE of the running invoice totals (billing.revenue).
+    """
+    patient = Patient.objects.select_related("hmo").get(pk=visit.patient_id)
+    is_hmo = patient.is_hmo
+    hmo_name = patient.hmo.name if patient.is_hmo and patient.hmo else ""
 
-    if invoice.balance <= 0:
-        invoice.status = Invoice.Status.PAID
-    elif invoice.amount_paid > 0:
-        invoice.status = Invoice.Status.PARTIAL
+    invoice = Invoice.objects.select_for_update().filter(visit=visit).first()
+    created = invoice is None
+
+    if created:
+        invoice = Invoice(visit=visit, patient=patient, created_by=user)
+
+    lines = build_invoice_lines(visit, invoice, is_hmo)
+    invoice.hmo_name = hmo_name
+
+    if created:
+        # no payments can exist yet
+        apply_line_totals(invoice, lines, Decimal("0.00"))
+        invoice.save()
     else:
-        invoice.status = Invoice.Status.UNPAID
+        invoice.lines.all().delete()
+        amount_paid = patient_payments(Payment.objects.filter(invoice=invoice)).aggregate(total=Sum("amount"))["total"]
+        invoice._totals_before = (invoice.balance, invoice.hmo_amount)  # locked row, already read
+        apply_line_totals(invoice, lines, amount_paid)
+        invoice.fragment_version += 1  # row is locked; drops the cached line/payment fragments
+        invoice.save(update_fields=INVOICE_TOTAL_FIELDS + ["fragment_version"])
 
-    invoice.save()
+    InvoiceLine.objects.bulk_create(lines)
+    visit.invoice = invoice
     return invoice
+
+
+def counts_toward_patient(method) -> bool:
+    """
+    amount_paid / balance cover the patient's share only. HMO settlements
+    (Payment.Method.HMO) pay the HMO share and are tracked in the aging ledger,
+    so neither post_payment nor a rebuild counts them.
+    """
+    return method != Payment.Method.HMO
+
+
+def patient_payments(payments):
+    """The payments that make up amount_paid (see counts_toward_patient)."""
+    return payments.exclude(method=Payment.Method.HMO)
+
+
+@transaction.atomic
+def post_payment(invoice, *, amount, method, reference="", user=None):
+    """
+    Record a payment and roll it into the invoice's running figures.
+
+    Only amount_paid / balance / status move, via one UPDATE with F()
+    arithmetic, so the cost is O(1) in line count and two cashiers posting
+    at once can't overwrite each other's totals. Lines are left untouched.
+    The invoice row is locked first (the same order as a rebuild), so the
+    status Case is decided against the row the UPDATE writes, and the
+    payment, invoice, ledgers and running totals commit or roll back together.
+    An HMO payment is recorded (rollups, aging ledger) but leaves the
+    patient's figures alone, as a rebuild would.
+    """
+    amount = Decimal(amount)
+    Invoice.objects.select_for_update().filter(pk=invoice.pk).values_list("pk", flat=True).get()
+    with fragments.caller_bumps_version():
+        payment = Payment.objects.create(
+            invoice=invoice,
+            amount=amount,
+            method=method,
+            reference=reference,
+            received_by=user,
+        )
+    if not counts_toward_patient(method):
+        Invoice.objects.filter(pk=invoice.pk).update(fragment_version=fragments.next_version())
+        invoice.refresh_from_db(fields=["fragment_version"])
+        return payment
+
+    # every right-hand side sees the pre-update row
+    Invoice.objects.filter(pk=invoice.pk).update(
+        fragment_version=fragments.next_version(),
+        amount_paid=F("amount_paid") + amount,
+        balance=F("balance") - amount,
+        status=Case(
+            When(balance__lte=amount, then=Value(Invoice.Status.PAID)),
+            When(amount_paid__gt=-amount, then=Value(Invoice.Status.PARTIAL)),
+            default=Value(Invoice.Status.UNPAID),
+        ),
+    )
+    revenue.shift_totals(outstanding=-amount, invoice_id=invoice.pk)
+    invoice.refresh_from_db(fields=["amount_paid", "balance", "status", "fragment_version"])
+    return payment
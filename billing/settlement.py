@@ -0,0 +1,190 @@
+"""
+HMO batch settlement.
+
+Marking a claim batch paid posts one Payment(method=HMO) per claimed invoice.
+The whole batch goes through a fixed number of statements regardless of size:
+one read of the claim items, one bulk insert of payments, then set-based
+updates of the aging ledger, revenue rollup, invoice HMO states (which also
+bump the invoices' fragment versions), claim-item settlement and disputes.
+bulk_create skips the Payment signals, so the ledger/rollup side effects they
+would apply are done here in bulk instead.
+
+A claim item is stamped settled (settled_at / settled_amount) in the same
+transaction as its payment, and stamped items are skipped, so posting the
+same remittance again, under any reference, pays nothing twice. The batch
+is PAID only once every item has been paid in full; until then it stays
+PARTIAL and can take another remittance for the items still unpaid.
+
+HMOs often pay less than claimed. An optional remittance CSV (invoice_number,
+amount; other columns ignored) replaces the claimed figure per invoice:
+full or over payments settle the invoice, short payments post what was paid
+and flag the shortfall as a dispute, and remittance lines that match no item
+in the batch are reported back rather than posted.
+"""
+import csv
+import io
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import aging, fragments, revenue
+from .models import HMOClaimBatch, HMOClaimItem, HMOReceivable, Invoice, Payment
+
+ZERO = Decimal("0.00")
+
+
+class RemittanceError(ValueError):
+    """The uploaded remittance file can't be read as invoice_number/amount rows."""
+
+
+@dataclass
+class Settlement:
+    posted: int = 0
+    total: Decimal = ZERO
+    settled: list = field(default_factory=list)    # invoice numbers paid in full
+    short: list = field(default_factory=list)      # (invoice number, claimed, paid)
+    over: list = field(default_factory=list)       # (invoice number, claimed, paid)
+    skipped: list = field(default_factory=list)    # items already settled by an earlier post
+    unmatched: list = field(default_factory=list)  # remittance invoice numbers not in the batch
+
+
+def _amount(raw) -> Decimal:
+    return Decimal((raw or "").replace(",", "").strip()).quantize(Decimal("0.01"))
+
+
+def parse_remittance(fileobj) -> dict:
+    """{invoice_number: amount} from a remittance CSV; repeated invoice lines are summed."""
+    data = fileobj.read()
+    if isinstance(data, bytes):
+        try:
+            data = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise RemittanceError("Remittance file must be a UTF-8 CSV.")
+
+    reader = csv.DictReader(io.StringIO(data))
+    columns = {(name or "").strip().lower(): name for name in reader.fieldnames or ()}
+    if "invoice_number" not in columns or "amount" not in columns:
+        raise RemittanceError("Remittance CSV needs 'invoice_number' and 'amount' columns.")
+
+    paid = defaultdict(lambda: ZERO)
+    for line_no, row in enumerate(reader, start=2):
+        number = (row[columns["invoice_number"]] or "").strip()
+        if not number:
+            continue
+        try:
+            paid[number] += _amount(row[columns["amount"]])
+        except InvalidOperation:
+            raise RemittanceError(f"Line {line_no}: '{row[columns['amount']]}' is not an amount.")
+    return dict(paid)
+
+
+def _apply_to_ledger(amounts):
+    """Move {invoice_id: amount} of HMO payments through the receivables and summary in bulk."""
+    receivables = list(HMOReceivable.objects.select_for_update().filter(pk__in=amounts))
+    deltas = defaultdict(lambda: [ZERO, 0])
+    for r in receivables:
+        amount = amounts[r.pk]
+        if r.outstanding > 0:
+            deltas[r.hmo_name, r.bucket][0] -= r.outstanding
+            deltas[r.hmo_name, r.bucket][1] -= 1
+        r.hmo_paid += amount
+        r.outstanding = (r.outstanding - amount).quantize(Decimal("0.01"))
+        if r.outstanding > 0:
+            deltas[r.hmo_name, r.bucket][0] += r.outstanding
+            deltas[r.hmo_name, r.bucket][1] += 1
+
+    HMOReceivable.objects.bulk_update(receivables, ["hmo_paid", "outstanding"])
+    for (hmo_name, bucket), (total, count) in deltas.items():
+        aging.shift_summary(hmo_name, bucket, total, count)
+
+    # invoices that predate the ledger are rebuilt from their payments
+    missing = set(amounts) - {r.pk for r in receivables}
+    for invoice in Invoice.objects.filter(pk__in=missing, hmo_amount__gt=0):
+        aging.sync_invoice(invoice)
+
+
+@transaction.atomic
+def settle_batch(batch, *, reference, remittance=None, user=None) -> Settlement:
+    """
+    Post HMO settlements for every claimed invoice in `batch` under `reference`.
+
+    remittance=None pays each item its claimed hmo_amount; otherwise it is the
+    {invoice_number: amount} mapping from parse_remittance. Items settled by an
+    earlier post are skipped, so a retried or re-sent post is harmless.
+    """
+    batch = HMOClaimBatch.objects.select_for_update().get(pk=batch.pk)
+    items = list(
+        batch.items.filter(hmo_amount__gt=0)
+        .values_list("id", "invoice_id", "invoice__invoice_number", "hmo_amount", "settled_at", "settled_amount")
+    )
+
+    result = Settlement()
+    if remittance is not None:
+        claimed = {number for _, _, number, _, _, _ in items}
+        result.unmatched = sorted(number for number in remittance if number not in claimed)
+
+    now = timezone.now()
+    payments, amounts, settled_ids, short, stamped = [], {}, [], {}, []
+    unresolved = 0
+    for item_id, inv_id, number, claimed_amount, settled_at, settled_amount in items:
+        if settled_at is not None:
+            result.skipped.append(number)
+            unresolved += settled_amount < claimed_amount
+            continue
+        paid = claimed_amount if remittance is None else remittance.get(number, ZERO)
+        if paid > 0:
+            payments.append(Payment(
+                invoice_id=inv_id, amount=paid, method=Payment.Method.HMO,
+                reference=reference, received_by=user,
+            ))
+            amounts[inv_id] = paid
+            stamped.append(HMOClaimItem(
+                pk=item_id, settled_at=now, settled_amount=paid, settlement_reference=reference,
+            ))
+        if paid >= claimed_amount:
+            settled_ids.append(inv_id)
+            result.settled.append(number)
+            if paid > claimed_amount:
+                result.over.append((number, claimed_amount, paid))
+        else:
+            short[item_id] = (inv_id, claimed_amount - paid)
+            result.short.append((number, claimed_amount, paid))
+            unresolved += 1
+
+    Payment.objects.bulk_create(payments, batch_size=500)
+    HMOClaimItem.objects.bulk_update(
+        stamped, ["settled_at", "settled_amount", "settlement_reference"], batch_size=500,
+    )
+    result.posted = len(payments)
+    result.total = sum(amounts.values(), ZERO)
+
+    if amounts:
+        _apply_to_ledger(amounts)
+        revenue.shift_rollup(timezone.localdate(), Payment.Method.HMO, result.total, result.posted)
+    # every invoice with a new payment is in one of these, so both bump the fragment version
+    if settled_ids:
+        Invoice.objects.filter(pk__in=settled_ids).update(
+            hmo_state=Invoice.HMOState.SETTLED, fragment_version=fragments.next_version(),
+        )
+    if short:
+        reason = f"Short-paid on remittance {reference}"
+        Invoice.objects.bulk_update(
+            [
+                Invoice(pk=inv_id, hmo_state=Invoice.HMOState.DISPUTED,
+                        hmo_dispute_reason=reason, hmo_dispute_amount=shortfall,
+                        fragment_version=fragments.next_version())
+                for inv_id, shortfall in short.values()
+            ],
+            ["hmo_state", "hmo_dispute_reason", "hmo_dispute_amount", "fragment_version"],
+        )
+        HMOClaimItem.objects.filter(pk__in=short).update(
+            disputed=True, dispute_reason=reason, disputed_at=now,
+        )
+
+    batch.status = "PARTIAL" if unresolved else "PAID"
+    batch.save(update_fields=["status"])
+    transaction.on_commit(revenue.invalidate_snapshot)
+    return result
@@ -1,9 +1,85 @@
-from django.db.models.signals import post_save
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Invoice
+from .models import Invoice, InvoiceLine, Payment
+from . import aging, fragments, revenue
+
+# Invoice fields summed into InvoiceTotals
+TOTAL_FIELDS = {"balance", "hmo_amount"}
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_totals(sender, instance: Invoice, update_fields=None, **kwargs):
+    # callers that already hold the stored figures set _totals_before themselves
+    if hasattr(instance, "_totals_before"):
+        return
+    if update_fields is not None and not TOTAL_FIELDS & set(update_fields):
+        instance._totals_before = None
+    elif instance.pk is None:
+        instance._totals_before = (Decimal("0.00"), Decimal("0.00"))
+    else:
+        instance._totals_before = (
+            Invoice.objects.filter(pk=instance.pk).values_list("balance", "hmo_amount").first()
+            or (Decimal("0.00"), Decimal("0.00"))
+        )
+
 
 @receiver(post_save, sender=Invoice)
-def set_invoice_number(sender, instance: Invoice, created, **kwargs):
-    if created and not instance.invoice_number:
-        instance.invoice_number = f"EDH-INV-{instance.id:06d}"
-        instance.save(update_fields=["invoice_number"])
+def shift_invoice_totals(sender, instance: Invoice, **kwargs):
+    before = instance.__dict__.pop("_totals_before", None)
+    if before is not None:
+        revenue.shift_totals(
+            outstanding=Decimal(instance.balance) - before[0], hmo=Decimal(instance.hmo_amount) - before[1],
+            invoice_id=instance.pk,
+        )
+
+
+@receiver(post_save, sender=Invoice)
+def sync_hmo_receivable(sender, instance: Invoice, created, update_fields=None, **kwargs):
+    if update_fields is not None and not aging.LEDGER_FIELDS & set(update_fields):
+        return
+    aging.sync_invoice(instance, created=created)
+
+
+@receiver(pre_delete, sender=Invoice)
+def drop_hmo_receivable(sender, instance: Invoice, **kwargs):
+    aging.drop_invoice(instance.pk)
+
+
+@receiver(pre_delete, sender=Invoice)
+def drop_invoice_totals(sender, instance: Invoice, **kwargs):
+    revenue.shift_totals(
+        outstanding=-Decimal(instance.balance), hmo=-Decimal(instance.hmo_amount), invoice_id=instance.pk,
+    )
+
+
+@receiver(post_save, sender=Payment)
+def roll_up_payment(sender, instance: Payment, created, **kwargs):
+    if created:
+        revenue.record_payment(instance)
+
+
+@receiver(post_delete, sender=Payment)
+def roll_back_payment(sender, instance: Payment, **kwargs):
+    revenue.record_payment(instance, reverse=True)
+
+
+@receiver(post_save, sender=Payment)
+def apply_hmo_payment(sender, instance: Payment, created, **kwargs):
+    if created and instance.method == Payment.Method.HMO:
+        aging.record_hmo_payment(instance.invoice_id, instance.amount)
+
+
+@receiver(post_delete, sender=Payment)
+def reverse_hmo_payment(sender, instance: Payment, **kwargs):
+    if instance.method == Payment.Method.HMO:
+        aging.record_hmo_payment(instance.invoice_id, -instance.amount)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=InvoiceLine)
+def bump_invoice_fragments(sender, instance, **kwargs):
+    # no InvoiceLine post_delete: see billing.fragments
+    fragments.bump_version(instance.invoice_id)
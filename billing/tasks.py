@@ -0,0 +1,34 @@
+"""
+Background tasks for billing (see core.tasks).
+
+The PDF tasks pre-render into the content-addressed cache of
+billing.pdf_service, so the first print at the desk is a file read. They
+render the document as it is when the task runs; if the invoice changed in
+between, the new content gets its own key and the print renders it then.
+A render can wait on a busy pool, so they renew their lock first and stop
+if another worker has taken the task over.
+"""
+from core.tasks import heartbeat, task
+
+from . import pdf_service
+from .models import Invoice, Payment
+
+
+@task(max_attempts=3, backoff=30)
+def prerender_invoice_pdf(invoice_id):
+    invoice = Invoice.objects.select_related("patient", "visit").filter(pk=invoice_id).first()
+    if invoice is None:
+        return  # deleted since it was queued
+    doc = pdf_service.invoice_document(invoice)
+    if heartbeat():
+        pdf_service.render_cached("invoice", doc)
+
+
+@task(max_attempts=3, backoff=30)
+def prerender_receipt_pdf(payment_id):
+    payment = Payment.objects.select_related("invoice__patient").filter(pk=payment_id).first()
+    if payment is None:
+        return
+    doc = pdf_service.receipt_document(payment.invoice, payment)
+    if heartbeat():
+        pdf_service.render_cached("receipt", doc)
@@ -1,3 +1,777 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from billing import aging, hmo_packs, pdf_service, pdf_views, revenue, views
+from billing.claims import add_invoices_to_batch, iter_claim_batch_csv, stream_claim_batch_csv
+from billing.models import (
+    DailyRevenueRollup, HMOAgingSummary, HMOClaimBatch, HMOClaimItem, HMOFollowUp, HMOReceivable, Invoice, InvoiceLine,
+    InvoiceTotals, Payment,
+)
+from billing.pdf_claims import COVER_COLUMNS
+from billing.pdf_paged import PagedTableWriter
+from billing.settlement import RemittanceError, parse_remittance, settle_batch
+from billing.services import CONSULTATION_FEE, generate_invoice_for_visit, post_payment
+from hmo.models import HMO
+from patients.models import Patient
+from pharmacy.models import Drug, PrescriptionItem
+from visits.models import Visit
+
+
+def make_visit(*, hmo=None, drug_prices=("300.00", "1500.00", "2000.00")):
+    patient = Patient.objects.create(
+        first_name="Ada", last_name="Obi", gender="F", phone="08030000000",
+        is_hmo=hmo is not None, hmo=hmo,
+    )
+    visit = Visit.objects.create(patient=patient)
+    for i, price in enumerate(drug_prices):
+        drug = Drug.objects.create(name=f"Drug {i}", strength="500mg", price=Decimal(price))
+        PrescriptionItem.objects.create(visit=visit, drug=drug)
+    return Visit.objects.get(pk=visit.pk)
+
+
+class GenerateInvoiceForVisitTests(TestCase):
+    def test_new_invoice_query_budget(self):
+        visit = make_visit()
+        # savepoint + patient + invoice lookup + prescriptions + invoice number
+        # + insert invoice + invoice totals bump + bulk insert lines + release savepoint
+        with self.assertNumQueries(9):
+            invoice = generate_invoice_for_visit(visit)
+
+        self.assertEqual(invoice.lines.count(), 4)
+        self.assertEqual(invoice.total_amount, CONSULTATION_FEE + Decimal("3800.00"))
+        self.assertEqual(invoice.patient_amount, invoice.total_amount)
+        self.assertEqual(invoice.balance, invoice.total_amount)
+        self.assertEqual(invoice.status, Invoice.Status.UNPAID)
+
+    def test_rebuild_query_budget_is_independent_of_line_count(self):
+        visit = make_visit(drug_prices=["100.00"] * 25)
+        generate_invoice_for_visit(visit)
+
+        # savepoint + patient + invoice lookup + prescriptions + delete lines
+        # + payments sum + update invoice + aging ledger probe + bulk insert lines
+        # + release savepoint
+        with self.assertNumQueries(10):
+            generate_invoice_for_visit(visit)
+
+        self.assertEqual(InvoiceLine.objects.filter(invoice__visit=visit).count(), 26)
+
+    def test_rebuild_keeps_payments_and_hmo_split(self):
+        hmo = HMO.objects.create(name="Hygeia HMO")
+        visit = make_visit(hmo=hmo, drug_prices=["1000.00"])
+        invoice = generate_invoice_for_visit(visit)
+        Payment.objects.create(invoice=invoice, amount=Decimal("600.00"), method=Payment.Method.CASH)
+
+        invoice = generate_invoice_for_visit(visit)
+
+        self.assertEqual(invoice.hmo_name, "Hygeia HMO")
+        self.assertEqual(invoice.total_amount, Decimal("6000.00"))
+        self.assertEqual(invoice.hmo_amount, Decimal("4800.00"))
+        self.assertEqual(invoice.patient_amount, Decimal("1200.00"))
+        self.assertEqual(invoice.amount_paid, Decimal("600.00"))
+        self.assertEqual(invoice.balance, Decimal("600.00"))
+        self.assertEqual(invoice.status, Invoice.Status.PARTIAL)
+
+        line_totals = list(invoice.lines.values_list("line_total", flat=True))
+        self.assertEqual(sum(line_totals), invoice.total_amount)
+
+
+class PostPaymentTests(TestCase):
+    def setUp(self):
+        self.invoice = generate_invoice_for_visit(make_visit(drug_prices=["1000.00"] * 10))
+
+    def test_payment_updates_running_figures_without_touching_lines(self):
+        line_ids = set(self.invoice.lines.values_list("id", flat=True))
+
+        post_payment(self.invoice, amount="1000.00", method=Payment.Method.CASH)
+
+        # savepoint + lock invoice + insert payment + revenue rollup bump + update invoice
+        # + invoice totals bump + refresh + release savepoint
+        with self.assertNumQueries(8):
+            post_payment(self.invoice, amount="3000.00", method=Payment.Method.CASH)
+
+        self.assertEqual(self.invoice.amount_paid, Decimal("4000.00"))
+        self.assertEqual(self.invoice.balance, Decimal("11000.00"))
+        self.assertEqual(self.invoice.status, Invoice.Status.PARTIAL)
+        self.assertEqual(set(self.invoice.lines.values_list("id", flat=True)), line_ids)
+
+    def test_stale_instances_do_not_lose_each_others_payments(self):
+        other_desk = Invoice.objects.get(pk=self.invoice.pk)
+
+        post_payment(self.invoice, amount="10000.00", method=Payment.Method.CASH)
+        post_payment(other_desk, amount="5000.00", method=Payment.Method.POS)
+
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.amount_paid, Decimal("15000.00"))
+        self.assertEqual(self.invoice.balance, Decimal("0.00"))
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+
+    def test_failure_after_the_insert_rolls_the_payment_back(self):
+        with mock.patch("billing.services.revenue.shift_totals", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            post_payment(self.invoice, amount="1000.00", method=Payment.Method.CASH)
+
+        self.invoice.refresh_from_db()
+        self.assertFalse(self.invoice.payments.exists())
+        self.assertEqual(self.invoice.amount_paid, Decimal("0.00"))
+        self.assertFalse(DailyRevenueRollup.objects.exists())
+
+    def test_add_payment_rejects_bad_input(self):
+        user = get_user_model().objects.create_user(username="cashier", password="x", role="billing")
+        self.client.force_login(user)
+        url = reverse("billing:add_payment", args=[self.invoice.pk])
+        for data in (
+            {"amount": "12o0", "method": "CASH"},
+            {"amount": "0", "method": "CASH"},
+            {"amount": "-500", "method": "POS"},
+            {"amount": "500", "method": Payment.Method.HMO},
+            {"amount": "500", "method": "CHEQUE"},
+        ):
+            with self.subTest(**data):
+                resp = self.client.post(url, data)
+                self.assertRedirects(resp, reverse("billing:invoice_detail", args=[self.invoice.pk]),
+                                     fetch_redirect_response=False)
+        self.assertFalse(self.invoice.payments.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"amount": "500", "method": "POS", "reference": " RRN1 "})
+        payment = self.invoice.payments.get()
+        self.assertEqual((payment.amount, payment.method, payment.reference), (Decimal("500"), "POS", "RRN1"))
+
+    def test_running_figures_match_full_rebuild(self):
+        post_payment(self.invoice, amount="2500.00", method=Payment.Method.TRANSFER)
+        post_payment(self.invoice, amount="4000.00", method=Payment.Method.HMO)  # not the patient's share
+        self.assertEqual(self.invoice.amount_paid, Decimal("2500.00"))
+
+        rebuilt = generate_invoice_for_visit(self.invoice.visit)
+
+        self.assertEqual(rebuilt.amount_paid, self.invoice.amount_paid)
+        self.assertEqual(rebuilt.balance, self.invoice.balance)
+        self.assertEqual(rebuilt.status, self.invoice.status)
+
+
+class InvoiceDetailFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.invoice = generate_invoice_for_visit(make_visit(drug_prices=["1000.00"] * 10))
+        post_payment(self.invoice, amount="2000.00", method=Payment.Method.CASH)
+        self.user = get_user_model().objects.create_user(username="cashier", password="x", role="billing")
+
+    def render(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        return views.invoice_detail(request, self.invoice.pk).content.decode()
+
+    def receipt_links(self, html):
+        return sum(
+            reverse("billing:receipt_pdf", args=[self.invoice.pk, pk]) in html
+            for pk in Payment.objects.values_list("pk", flat=True)
+        )
+
+    def test_repeat_views_are_one_query(self):
+        with self.assertNumQueries(3):  # invoice, lines, payments
+            self.render()
+        with self.assertNumQueries(1):
+            html = self.render()
+        self.assertEqual(self.receipt_links(html), 1)
+        self.assertIn("₦15000.00", html)
+
+    def test_payment_invalidates_the_fragments(self):
+        self.render()
+        post_payment(self.invoice, amount="500.00", method=Payment.Method.POS)
+        self.assertEqual(self.receipt_links(self.render()), 2)
+
+    def test_direct_writes_bump_through_signals(self):
+        version = Invoice.objects.get(pk=self.invoice.pk).fragment_version
+        payment = Payment.objects.create(invoice=self.invoice, amount=Decimal("100.00"), method=Payment.Method.CASH)
+        payment.delete()
+        line = self.invoice.lines.first()
+        line.description = "Consultation (review)"
+        line.save()
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).fragment_version, version + 3)
+
+    def test_rebuild_invalidates_the_lines(self):
+        self.render()
+        PrescriptionItem.objects.create(
+            visit=self.invoice.visit, drug=Drug.objects.create(name="Ceftriaxone", price=Decimal("2500.00")),
+        )
+        generate_invoice_for_visit(self.invoice.visit)
+        self.assertIn("Ceftriaxone", self.render())
+
+
+class ClaimBatchAssemblyTests(TestCase):
+    def setUp(self):
+        self.hmo = HMO.objects.create(name="Hygeia HMO")
+        self.invoices = [
+            generate_invoice_for_visit(make_visit(hmo=self.hmo, drug_prices=[])) for _ in range(5)
+        ]
+        generate_invoice_for_visit(make_visit(drug_prices=[]))  # private patient, never claimable
+        today = timezone.localdate()
+        self.batch = HMOClaimBatch.objects.create(
+            hmo_name="Hygeia HMO", period_start=today - timedelta(days=7), period_end=today,
+        )
+
+    def test_adds_all_eligible_with_one_read_and_one_insert(self):
+        # savepoint + eligible read + bulk insert + release savepoint
+        with self.assertNumQueries(4):
+            added = add_invoices_to_batch(self.batch)
+
+        self.assertEqual(added, 5)
+        item = self.batch.items.get(invoice=self.invoices[0])
+        self.assertEqual(item.hmo_amount, Decimal("4000.00"))
+        self.assertEqual(item.hospital_number, self.invoices[0].patient.hospital_number)
+        self.assertEqual(item.visit_number, self.invoices[0].visit.visit_number)
+
+    def test_already_claimed_invoices_are_skipped(self):
+        other = HMOClaimBatch.objects.create(
+            hmo_name="Hygeia HMO", period_start=self.batch.period_start, period_end=self.batch.period_end,
+        )
+        add_invoices_to_batch(other, [self.invoices[0].id])
+
+        added = add_invoices_to_batch(self.batch, [inv.id for inv in self.invoices])
+
+        self.assertEqual(added, 4)
+        self.assertEqual(HMOClaimItem.objects.filter(invoice=self.invoices[0]).count(), 1)
+
+    def test_management_command_builds_batch_per_hmo(self):
+        today = timezone.localdate().isoformat()
+        out = StringIO()
+
+        call_command("build_hmo_claim_batches", "--start", today, "--end", today, stdout=out)
+        call_command("build_hmo_claim_batches", "--start", today, "--end", today, stdout=out)
+
+        batch = HMOClaimBatch.objects.get(period_start=today, period_end=today)
+        self.assertEqual(batch.items.count(), 5)
+
+
+class ClaimBatchExportTests(TestCase):
+    def setUp(self):
+        hmo = HMO.objects.create(name="Hygeia HMO")
+        for _ in range(3):
+            generate_invoice_for_visit(make_visit(hmo=hmo, drug_prices=[]))
+        today = timezone.localdate()
+        self.batch = HMOClaimBatch.objects.create(hmo_name="Hygeia HMO", period_start=today, period_end=today)
+        add_invoices_to_batch(self.batch)
+
+    def test_rows_come_from_one_joined_query(self):
+        with self.assertNumQueries(1):
+            text = "".join(iter_claim_batch_csv(self.batch))
+
+        lines = text.strip().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith("HMO,Period Start"))
+        first = self.batch.items.order_by("id").select_related("invoice").first()
+        self.assertIn(first.invoice.invoice_number, lines[1])
+
+    def test_gzip_stream_matches_plain_stream(self):
+        plain = b"".join(stream_claim_batch_csv(self.batch).streaming_content)
+        response = stream_claim_batch_csv(self.batch, compress=True)
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn(".csv.gz", response["Content-Disposition"])
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
+
+
+class ClaimSettlementTests(TestCase):
+    def setUp(self):
+        self.hmo = HMO.objects.create(name="Hygeia HMO")
+        self.invoices = [
+            generate_invoice_for_visit(make_visit(hmo=self.hmo, drug_prices=[])) for _ in range(4)
+        ]
+        today = timezone.localdate()
+        self.batch = HMOClaimBatch.objects.create(hmo_name="Hygeia HMO", period_start=today, period_end=today)
+        add_invoices_to_batch(self.batch)
+
+    def test_full_settlement_posts_in_bulk_and_updates_ledger(self):
+        result = settle_batch(self.batch, reference="TRF-001")
+
+        self.assertEqual(result.posted, 4)
+        self.assertEqual(result.total, Decimal("16000.00"))
+        self.assertEqual(Payment.objects.filter(method=Payment.Method.HMO, reference="TRF-001").count(), 4)
+        self.assertFalse(HMOAgingSummary.objects.filter(invoice_count__gt=0).exists())
+        self.assertEqual(set(HMOReceivable.objects.values_list("outstanding", flat=True)), {Decimal("0.00")})
+        self.assertEqual(set(Invoice.objects.values_list("hmo_state", flat=True)), {Invoice.HMOState.SETTLED})
+        # patient balances are untouched
+        self.assertEqual(set(Invoice.objects.values_list("balance", flat=True)), {Decimal("1000.00")})
+        self.assertEqual(
+            DailyRevenueRollup.objects.get(method=Payment.Method.HMO).payment_count, 4,
+        )
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "PAID")
+
+        again = settle_batch(self.batch, reference="TRF-001")
+        self.assertEqual(again.posted, 0)
+        self.assertEqual(len(again.skipped), 4)
+        # a corrected or blank reference doesn't make it a new settlement
+        self.assertEqual(settle_batch(self.batch, reference="").posted, 0)
+        self.assertEqual(Payment.objects.filter(method=Payment.Method.HMO).count(), 4)
+
+    def test_batch_stays_partial_until_every_item_is_paid(self):
+        numbers = [inv.invoice_number for inv in self.invoices]
+        first = {numbers[0]: Decimal("4000.00"), numbers[1]: Decimal("1000.00")}
+
+        settle_batch(self.batch, reference="REM-1", remittance=first)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "PARTIAL")
+        item = HMOClaimItem.objects.get(invoice=self.invoices[1])
+        self.assertEqual((item.settled_amount, item.settlement_reference), (Decimal("1000.00"), "REM-1"))
+
+        # the HMO re-sends the whole remittance with the rest added
+        result = settle_batch(self.batch, reference="REM-1b", remittance={
+            **first, numbers[2]: Decimal("4000.00"), numbers[3]: Decimal("4000.00"),
+        })
+        self.assertEqual(result.posted, 2)
+        self.assertEqual(sorted(result.skipped), sorted(numbers[:2]))
+        self.assertEqual(
+            Payment.objects.filter(method=Payment.Method.HMO).aggregate(t=Sum("amount"))["t"], Decimal("13000.00"),
+        )
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, "PARTIAL")  # numbers[1] is still short-paid
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        # savepoint, batch lock, items, bulk insert, item stamps, receivables read + bulk update,
+        # summary shift, rollup update + insert (in its own savepoint), invoice states, batch status, release
+        with self.assertNumQueries(15):
+            settle_batch(self.batch, reference="TRF-002")
+
+        for _ in range(6):
+            generate_invoice_for_visit(make_visit(hmo=self.hmo, drug_prices=[]))
+        bigger = HMOClaimBatch.objects.create(
+            hmo_name="Hygeia HMO", period_start=self.batch.period_start, period_end=self.batch.period_end,
+        )
+        add_invoices_to_batch(bigger)
+        # same statements, minus the rollup insert and its savepoint now today's HMO row exists
+        with self.assertNumQueries(12):
+            settle_batch(bigger, reference="TRF-003")
+
+    def test_remittance_reconciles_short_over_and_unmatched(self):
+        numbers = [inv.invoice_number for inv in self.invoices]
+        csv_text = (
+            "Invoice_Number,Amount,Narration\n"
+            f"{numbers[0]},\"4,000.00\",full\n"
+            f"{numbers[1]},2500.00,short\n"
+            f"{numbers[2]},4500.00,over\n"
+            "EDH-INV-999999,100.00,not ours\n"
+        )
+        remittance = parse_remittance(BytesIO(csv_text.encode("utf-8-sig")))
+
+        result = settle_batch(self.batch, reference="REM-1", remittance=remittance)
+
+        self.assertEqual(result.posted, 3)
+        self.assertEqual(result.total, Decimal("11000.00"))
+        self.assertEqual(sorted(result.settled), sorted(numbers[0:1] + numbers[2:3]))
+        self.assertEqual(result.over, [(numbers[2], Decimal("4000.00"), Decimal("4500.00"))])
+        self.assertEqual(result.unmatched, ["EDH-INV-999999"])
+        # numbers[3] was missing from the remittance: nothing posted, whole claim disputed
+        self.assertEqual(
+            {n: paid for n, _, paid in result.short},
+            {numbers[1]: Decimal("2500.00"), numbers[3]: Decimal("0.00")},
+        )
+
+        short = Invoice.objects.get(pk=self.invoices[1].pk)
+        self.assertEqual(short.hmo_state, Invoice.HMOState.DISPUTED)
+        self.assertEqual(short.hmo_dispute_amount, Decimal("1500.00"))
+        self.assertTrue(HMOClaimItem.objects.get(invoice=short).disputed)
+        self.assertEqual(HMOReceivable.objects.get(pk=short.pk).outstanding, Decimal("1500.00"))
+        self.assertEqual(
+            HMOAgingSummary.objects.get(hmo_name="Hygeia HMO", bucket="0-30").total, Decimal("5500.00"),
+        )
+
+    def test_bad_remittance_is_rejected(self):
+        with self.assertRaises(RemittanceError):
+            parse_remittance(BytesIO(b"invoice,paid\nX,1\n"))
+        with self.assertRaises(RemittanceError):
+            parse_remittance(BytesIO(b"invoice_number,amount\nX,abc\n"))
+
+    def test_view_accepts_uploaded_remittance(self):
+        user = get_user_model().objects.create_user(username="billing", password="x", role="billing")
+        self.client.force_login(user)
+        upload = SimpleUploadedFile(
+            "remit.csv", f"invoice_number,amount\n{self.invoices[0].invoice_number},4000\n".encode(), "text/csv",
+        )
+
+        response = self.client.post(
+            reverse("billing:claim_batch_mark_paid", args=[self.batch.id]),
+            {"reference": "REM-2", "remittance": upload},
+        )
+
+        self.assertRedirects(response, reverse("billing:claim_batch_detail", args=[self.batch.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(Payment.objects.filter(reference="REM-2").count(), 1)
+        self.assertEqual(Invoice.objects.filter(hmo_state=Invoice.HMOState.DISPUTED).count(), 3)
+
+
+class HMOAgingLedgerTests(TestCase):
+    def setUp(self):
+        self.hmo = HMO.objects.create(name="Hygeia HMO")
+        self.invoices = [
+            generate_invoice_for_visit(make_visit(hmo=self.hmo, drug_prices=[])) for _ in range(3)
+        ]
+
+    def summary(self):
+        return {
+            (s.hmo_name, s.bucket): (s.total, s.invoice_count)
+            for s in HMOAgingSummary.objects.filter(invoice_count__gt=0)
+        }
+
+    def test_invoices_and_hmo_payments_update_ledger_incrementally(self):
+        self.assertEqual(self.summary(), {("Hygeia HMO", "0-30"): (Decimal("12000.00"), 3)})
+
+        Payment.objects.create(invoice=self.invoices[0], amount=Decimal("4000.00"), method=Payment.Method.HMO)
+        Payment.objects.create(invoice=self.invoices[1], amount=Decimal("1000.00"), method=Payment.Method.HMO)
+        Payment.objects.create(invoice=self.invoices[2], amount=Decimal("500.00"), method=Payment.Method.CASH)
+
+        self.assertEqual(self.summary(), {("Hygeia HMO", "0-30"): (Decimal("7000.00"), 2)})
+        self.assertEqual(HMOReceivable.objects.get(pk=self.invoices[1].pk).outstanding, Decimal("3000.00"))
+
+        hmo_table, grand = aging.aging_tables()
+        self.assertEqual(grand["total"], Decimal("7000.00"))
+        self.assertEqual(hmo_table[0]["0-30"], Decimal("7000.00"))
+
+    def test_rebucket_moves_receivables_and_matches_full_backfill(self):
+        Payment.objects.create(invoice=self.invoices[0], amount=Decimal("1000.00"), method=Payment.Method.HMO)
+        incremental = dict(HMOReceivable.objects.values_list("pk", "outstanding"))
+
+        aging.backfill_receivables()
+        self.assertEqual(dict(HMOReceivable.objects.values_list("pk", "outstanding")), incremental)
+
+        moved = aging.rebucket(today=timezone.localdate() + timedelta(days=45))
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(self.summary(), {("Hygeia HMO", "31-60"): (Decimal("11000.00"), 3)})
+
+    def test_summary_row_created_concurrently_is_shifted_not_duplicated(self):
+        HMOAgingSummary.objects.filter(hmo_name="Acme HMO").delete()
+        real_update = type(HMOAgingSummary.objects.none()).update
+        raced = []
+
+        def first_update_misses(qs, **kwargs):
+            if not raced:  # another writer inserts the row between our UPDATE and INSERT
+                raced.append(True)
+                HMOAgingSummary.objects.create(hmo_name="Acme HMO", bucket="0-30", total=100, invoice_count=1)
+                return 0
+            return real_update(qs, **kwargs)
+
+        with mock.patch("django.db.models.query.QuerySet.update", first_update_misses):
+            aging.shift_summary("Acme HMO", "0-30", Decimal("50.00"), 1)
+
+        row = HMOAgingSummary.objects.get(hmo_name="Acme HMO", bucket="0-30")
+        self.assertEqual((row.total, row.invoice_count), (Decimal("150.00"), 2))
+
+    def test_top_outstanding_reads_ledger(self):
+        with self.assertNumQueries(1):
+            rows = aging.top_outstanding(limit=2)
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["bucket"], "0-30")
+        self.assertEqual(rows[0]["hmo_name"], "Hygeia HMO")
+
+
+class RevenueRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.invoice = generate_invoice_for_visit(make_visit(drug_prices=[]))
+
+    def test_payments_roll_up_and_invalidate_cached_snapshot(self):
+        post_payment(self.invoice, amount="1500.00", method=Payment.Method.CASH)
+        snapshot = revenue.dashboard_snapshot()
+        self.assertEqual(snapshot["payments_today"], Decimal("1500.00"))
+
+        with self.assertNumQueries(0):
+            revenue.dashboard_snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = post_payment(self.invoice, amount="500.00", method=Payment.Method.POS)
+            # the key is only dropped once the payment commits
+            self.assertEqual(revenue.dashboard_snapshot()["payments_today"], Decimal("1500.00"))
+        snapshot = revenue.dashboard_snapshot()
+        self.assertEqual(snapshot["payments_today"], Decimal("2000.00"))
+        self.assertEqual(snapshot["outstanding"], Decimal("3000.00"))
+        self.assertEqual(snapshot["by_method"], [
+            {"method": "CASH", "total": 1500.0}, {"method": "POS", "total": 500.0},
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.delete()
+        self.assertEqual(revenue.dashboard_snapshot()["payments_today"], Decimal("1500.00"))
+
+    def test_invoice_totals_track_the_invoice_table(self):
+        def aggregate():
+            totals = Invoice.objects.aggregate(o=Sum("balance"), h=Sum("hmo_amount"))
+            return {"outstanding": totals["o"], "hmo_receivables": totals["h"]}
+
+        hmo_invoice = generate_invoice_for_visit(make_visit(hmo=HMO.objects.create(name="Hygeia HMO")))
+        post_payment(self.invoice, amount="1500.00", method=Payment.Method.CASH)
+        hmo_invoice.hmo_state = Invoice.HMOState.DISPUTED
+        hmo_invoice.save(update_fields=["hmo_state"])  # no totals field: no read, no shift
+        generate_invoice_for_visit(hmo_invoice.visit)  # rebuild
+        Invoice.objects.get(pk=self.invoice.pk).delete()
+
+        with self.assertNumQueries(2):  # rollups + totals row; the invoice table isn't read
+            snapshot = revenue.dashboard_snapshot()
+        self.assertEqual({k: snapshot[k] for k in ("outstanding", "hmo_receivables")}, aggregate())
+
+        InvoiceTotals.objects.all().delete()
+        revenue.rebuild_totals()
+        self.assertEqual(
+            {k: revenue.dashboard_snapshot()[k] for k in ("outstanding", "hmo_receivables")}, aggregate(),
+        )
+
+    def test_rollup_row_created_concurrently_is_shifted_not_duplicated(self):
+        today = timezone.localdate()
+        real_update = type(DailyRevenueRollup.objects.none()).update
+        raced = []
+
+        def first_update_misses(qs, **kwargs):
+            if not raced:  # another payment inserts the row between our UPDATE and INSERT
+                raced.append(True)
+                DailyRevenueRollup.objects.create(day=today, method="CASH", total=100, payment_count=1)
+                return 0
+            return real_update(qs, **kwargs)
+
+        with mock.patch("django.db.models.query.QuerySet.update", first_update_misses):
+            revenue.shift_rollup(today, "CASH", Decimal("50.00"), 1)
+
+        row = DailyRevenueRollup.objects.get(day=today, method="CASH")
+        self.assertEqual((row.total, row.payment_count), (Decimal("150.00"), 2))
+
+    def test_backfill_matches_incremental_rollups(self):
+        post_payment(self.invoice, amount="1500.00", method=Payment.Method.CASH)
+        post_payment(self.invoice, amount="250.00", method=Payment.Method.CASH)
+        incremental = set(DailyRevenueRollup.objects.values_list("day", "method", "total", "payment_count"))
+
+        revenue.backfill_rollups()
+
+        self.assertEqual(
+            set(DailyRevenueRollup.objects.values_list("day", "method", "total", "payment_count")), incremental,
+        )
+
+
+class HotPathIndexTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command("benchmark_query_plans", "--patients", "1000", "--repeat", "1", stdout=out)
+
+        self.assertIn("All hot paths use an index.", out.getvalue())
+        self.assertFalse(Patient.objects.filter(hospital_number__startswith="BENCH-").exists())
+
+
+class PDFServiceTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.user = get_user_model().objects.create_user(username="cashier", password="x", role="billing")
+        self.client.force_login(self.user)
+        self.invoice = generate_invoice_for_visit(make_visit())
+        self.payment = post_payment(self.invoice, amount=Decimal("1000.00"), method=Payment.Method.CASH)
+
+    def test_invoice_is_rendered_once_and_revalidated_by_etag(self):
+        url = reverse("billing:invoice_pdf", args=[self.invoice.pk])
+        with self.settings(PDF_CACHE_DIR=self.tmp, PDF_RENDER_WORKERS=0):
+            with mock.patch("billing.pdf_service.render_document", wraps=pdf_service.render_document) as render:
+                resp = self.client.get(url)
+                self.assertEqual(resp["Content-Type"], "application/pdf")
+                self.assertTrue(b"".join(resp.streaming_content).startswith(b"%PDF"))
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(render.call_count, 1)
+
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+            post_payment(self.invoice, amount=Decimal("500.00"), method=Payment.Method.POS)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 200)
+
+    def test_receipt_does_not_change_after_later_payments(self):
+        doc = pdf_service.receipt_document(self.invoice, self.payment)
+        post_payment(self.invoice, amount=Decimal("500.00"), method=Payment.Method.POS)
+        self.invoice.refresh_from_db()
+        self.assertEqual(pdf_service.receipt_document(self.invoice, self.payment), doc)
+        self.assertEqual(doc["invoice"]["amount_paid"], "1000.00")
+
+    def test_prune_drops_old_files_then_least_recently_served(self):
+        def cached(name, size, age_days):
+            path = os.path.join(self.tmp, name[:2], f"{name}.pdf")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as fh:
+                fh.write(b"x" * size)
+            stamp = time.time() - age_days * 86400
+            os.utime(path, (stamp, stamp))
+            return path
+
+        stale = cached("aa01", 10, age_days=40)
+        oldest = cached("bb01", 600 * 1024, age_days=3)
+        newer = cached("bb02", 600 * 1024, age_days=1)
+        with self.settings(PDF_CACHE_DIR=self.tmp):
+            result = pdf_service.prune_cache(max_age_days=30, max_mb=1)
+
+        self.assertEqual(result["deleted"], 2)
+        self.assertFalse(os.path.exists(stale))
+        self.assertFalse(os.path.exists(os.path.dirname(stale)))
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(newer))
+
+    def test_file_pruned_before_it_is_opened_is_rendered_again(self):
+        url = reverse("billing:invoice_pdf", args=[self.invoice.pk])
+        real_render_cached = pdf_service.render_cached
+
+        def pruned_after_lookup(kind, doc):
+            key, path = real_render_cached(kind, doc)
+            if render.call_count == 1:
+                os.remove(path)
+            return key, path
+
+        with self.settings(PDF_CACHE_DIR=self.tmp, PDF_RENDER_WORKERS=0), \
+                mock.patch("billing.pdf_service.render_cached", side_effect=pruned_after_lookup) as render:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(b"".join(resp.streaming_content).startswith(b"%PDF"))
+            self.assertEqual(render.call_count, 2)
+
+    def test_cache_hit_counts_as_recently_served(self):
+        with self.settings(PDF_CACHE_DIR=self.tmp, PDF_RENDER_WORKERS=0):
+            doc = pdf_service.invoice_document(self.invoice)
+            _, path = pdf_service.render_cached("invoice", doc)
+            os.utime(path, (0, 0))
+            pdf_service.render_cached("invoice", doc)
+            self.assertEqual(pdf_service.prune_cache(max_age_days=30)["deleted"], 0)
+
+    def test_receipt_ignores_hmo_settlements_and_rebuilds(self):
+        doc = pdf_service.receipt_document(self.invoice, self.payment)
+        Payment.objects.create(
+            invoice=self.invoice, amount=Decimal("300.00"), method=Payment.Method.HMO, reference="SET-1",
+        )
+        invoice = generate_invoice_for_visit(self.invoice.visit)
+        self.assertEqual(invoice.amount_paid, Decimal("1000.00"))
+        self.assertEqual(pdf_service.receipt_document(invoice, self.payment), doc)
+        self.assertEqual(
+            Decimal(doc["invoice"]["balance"]), Decimal(doc["invoice"]["patient_amount"]) - Decimal("1000.00"),
+        )
+
+    def test_renders_in_worker_process(self):
+        doc = pdf_service.receipt_document(self.invoice, self.payment)
+        with self.settings(PDF_CACHE_DIR=self.tmp, PDF_RENDER_WORKERS=1):
+            key, path = pdf_service.render_cached("receipt", doc)
+        self.assertEqual(os.path.basename(path), f"{key}.pdf")
+        with open(path, "rb") as fh:
+            self.assertTrue(fh.read().startswith(b"%PDF"))
+
+    def test_busy_renderer_answers_503(self):
+        url = reverse("billing:receipt_pdf", args=[self.invoice.pk, self.payment.pk])
+        with self.settings(PDF_CACHE_DIR=self.tmp), \
+                mock.patch("billing.pdf_service.render_cached", side_effect=pdf_service.PDFRenderBusy):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "5")
+
+
+class PagedPDFTests(TestCase):
+    def test_writer_pages_rows_with_running_totals(self):
+        rows = ((f"INV-{i}", f"EDH-{i:06d}", "Obi Ada", "EDH-V-1", Decimal("100.50")) for i in range(250))
+        out = BytesIO()
+        writer = PagedTableWriter(out, hospital=pdf_views._get_hospital(), title="T", columns=COVER_COLUMNS)
+        count, total = writer.write(rows, closing=["Thanks."])
+        self.assertEqual((count, total), (250, Decimal("25125.00")))
+        self.assertGreater(writer.page, 4)
+        self.assertEqual(out.getvalue().count(b"/Type /Page\n"), writer.page)
+
+    def test_claim_cover_streams_from_a_temp_file(self):
+        user = get_user_model().objects.create_user(username="claims", password="x", role="billing")
+        self.client.force_login(user)
+        hmo = HMO.objects.create(name="Hygeia HMO")
+        invoice = generate_invoice_for_visit(make_visit(hmo=hmo))
+        batch = HMOClaimBatch.objects.create(
+            hmo_name="Hygeia HMO", period_start=timezone.localdate(), period_end=timezone.localdate(),
+        )
+        add_invoices_to_batch(batch)
+
+        resp = self.client.get(reverse("billing:claim_cover_pdf", args=[batch.pk]))
+        self.assertTrue(resp.streaming)
+        self.assertTrue(b"".join(resp.streaming_content).startswith(b"%PDF"))
+
+        resp = self.client.get(reverse("billing:hmo_reminder_pdf", args=[invoice.hmo_name]))
+        self.assertTrue(b"".join(resp.streaming_content).startswith(b"%PDF"))
+
+    def test_reminder_rows_come_from_the_ledger(self):
+        hmo = HMO.objects.create(name="Hygeia HMO")
+        invoice = generate_invoice_for_visit(make_visit(hmo=hmo))
+        rows = list(aging.iter_reminder_rows(invoice.hmo_name))
+        self.assertEqual(rows, [(invoice.invoice_number, invoice.patient.hospital_number, "Obi Ada", 0, invoice.hmo_amount)])
+
+
+class WeeklyHMOPackTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.hygeia = generate_invoice_for_visit(make_visit(hmo=HMO.objects.create(name="Hygeia HMO")))
+        self.axa = generate_invoice_for_visit(make_visit(hmo=HMO.objects.create(name="AXA Mansard")))
+        Invoice.objects.filter(pk=self.axa.pk).update(
+            hmo_state=Invoice.HMOState.DISPUTED, hmo_dispute_reason="Not covered", hmo_dispute_amount=Decimal("300.00"),
+        )
+
+    def run_command(self):
+        out = StringIO()
+        call_command("generate_weekly_hmo_packs", output=self.tmp, workers=0, stdout=out)
+        return out.getvalue()
+
+    def test_outstanding_is_one_grouped_query(self):
+        with self.assertNumQueries(1):
+            rows = hmo_packs.outstanding_by_hmo()
+        self.assertEqual([r["hmo_name"] for r in rows], ["AXA Mansard", "Hygeia HMO"])
+        self.assertEqual(rows[1]["outstanding"], self.hygeia.hmo_amount)
+
+    def test_blank_hmo_disputes_land_in_the_unknown_hmo_pack(self):
+        Invoice.objects.filter(pk=self.hygeia.pk).update(
+            hmo_name="", hmo_state=Invoice.HMOState.DISPUTED, hmo_dispute_reason="No HMO on file",
+        )
+        aging.sync_invoice(Invoice.objects.get(pk=self.hygeia.pk))
+
+        self.assertIn(aging.UNKNOWN_HMO, [r["hmo_name"] for r in hmo_packs.outstanding_by_hmo()])
+        rows = list(hmo_packs.iter_dispute_rows(aging.UNKNOWN_HMO))
+        self.assertEqual([r[0] for r in rows], [self.hygeia.invoice_number])
+        self.assertEqual([r[0] for r in hmo_packs.iter_dispute_rows("AXA Mansard")], [self.axa.invoice_number])
+
+    def test_packs_manifest_and_followups(self):
+        output = self.run_command()
+        for stage in ("collect", "render", "manifest", "follow-ups"):
+            self.assertIn(f"[{stage}] done in", output)
+
+        out_dir = os.path.join(self.tmp, timezone.localdate().isoformat())
+        with open(os.path.join(out_dir, "manifest.json")) as fh:
+            manifest = json.load(fh)
+        packs = {p["hmo_name"]: p for p in manifest["packs"]}
+        self.assertEqual(packs["AXA Mansard"]["disputes"]["lines"], 1)
+        self.assertEqual(packs["Hygeia HMO"]["reminder"]["lines"], 1)
+        self.assertEqual(packs["Hygeia HMO"]["disputes"]["lines"], 0)
+        for pack in packs.values():
+            for kind in ("reminder", "disputes"):
+                with open(os.path.join(out_dir, pack[kind]["file"]), "rb") as fh:
+                    self.assertTrue(fh.read().startswith(b"%PDF"))
+
+        self.assertEqual(HMOFollowUp.objects.filter(status=HMOFollowUp.Status.REMINDED).count(), 2)
+        self.run_command()  # same period again: updated, not duplicated
+        self.assertEqual(HMOFollowUp.objects.count(), 2)
+
+    def test_followup_upsert_query_budget(self):
+        today = timezone.localdate()
+        hmo_packs.upsert_followups(["A"], period_start=today, period_end=today)
+        # savepoint + existing lookup + bulk update + bulk insert + release
+        with self.assertNumQueries(5):
+            created, updated = hmo_packs.upsert_followups(["A", "B"], period_start=today, period_end=today)
+        self.assertEqual((created, updated), (1, 1))
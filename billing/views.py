@@ -1,9 +1,13 @@
-from decimal import Decimal
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from django.shortcuts import get_object_or_404, redirect, render
 from accounts.utils import require_roles
-from .models import Invoice, Payment
+from .forms import PaymentForm
+from .fragments import FRAGMENT_TTL
+from .models import Invoice
+from .services import post_payment
+from .tasks import prerender_invoice_pdf, prerender_receipt_pdf
 
 @login_required
 def invoice_list(request):
@@ -25,8 +29,12 @@ def invoice_list(request):
 @login_required
 def invoice_detail(request, invoice_id):
     require_roles(request.user, roles={"billing", "admin", "frontdesk"})
+    # one query; lines and payments are read only when their cached fragments miss (billing.fragments)
     invoice = get_object_or_404(Invoice.objects.select_related("patient", "visit"), pk=invoice_id)
-    return render(request, "billing/invoice_detail.html", {"invoice": invoice})
+    return render(request, "billing/invoice_detail.html", {
+        "invoice": invoice,
+        "fragment_ttl": FRAGMENT_TTL,
+    })
 
 
 @login_required
@@ -35,27 +43,22 @@ def add_payment(request, invoice_id):
     invoice = get_object_or_404(Invoice, pk=invoice_id)
 
     if request.method == "POST":
-        amount = Decimal(request.POST.get("amount") or "0")
-        method = request.POST.get("method")
-        reference = (request.POST.get("reference") or "").strip()
-
-        Payment.objects.create(
-            invoice=invoice,
-            amount=amount,
-            method=method,
-            reference=reference,
-            received_by=request.user,
-        )
+        form = PaymentForm(request.POST)
+        if not form.is_valid():
+            for field, errors in form.errors.items():
+                messages.error(request, f"{form.fields[field].label or field.title()}: {' '.join(errors)}")
+            return redirect("billing:invoice_detail", invoice_id=invoice.id)
 
-        # recompute invoice figures
-        from billing.services import generate_invoice_for_visit
-        if invoice.visit:
-            generate_invoice_for_visit(invoice.visit, user=request.user)
-        else:
-            # fallback if not tied to visit
-            invoice.amount_paid = sum((p.amount for p in invoice.payments.all()), Decimal("0.00"))
-            invoice.balance = (invoice.patient_amount - invoice.amount_paid).quantize(Decimal("0.01"))
-            invoice.save()
+        payment = post_payment(
+            invoice,
+            amount=form.cleaned_data["amount"],
+            method=form.cleaned_data["method"],
+            reference=form.cleaned_data["reference"].strip(),
+            user=request.user,
+        )
+        # the cashier prints next; render both documents off the request path
+        prerender_receipt_pdf.enqueue(payment_id=payment.id)
+        prerender_invoice_pdf.enqueue(invoice_id=invoice.id)
 
         return redirect("billing:invoice_detail", invoice_id=invoice.id)
 
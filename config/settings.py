@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from core.dbprofile import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     'accounts',
+    'core.apps.CoreConfig',
     'hmo',
     'patients.apps.PatientsConfig',
     'visits.apps.VisitsConfig',
@@ -51,6 +55,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,12 +88,18 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# SQLite by default, tuned for concurrent writers (WAL, busy timeout,
+# IMMEDIATE transactions); DB_ENGINE=postgresql|mysql plus DB_NAME/DB_USER/
+# DB_PASSWORD/DB_HOST/DB_PORT select a server database, DB_CONN_MAX_AGE and
+# DB_POOL_MAX_SIZE its connection reuse. See core.dbprofile.
+DATABASES = database_settings(BASE_DIR)
+
+# Reporting views marked @read_only_replica read from DATABASES["replica"]
+# (DB_REPLICA_NAME/DB_REPLICA_HOST) when it is at most MAX_LAG seconds behind;
+# otherwise from the primary. See core.replicas.
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+DATABASE_REPLICA_MAX_LAG = 30          # seconds; None = any lag is acceptable
+DATABASE_REPLICA_CHECK_INTERVAL = 5    # seconds between lag checks per process
 
 
 # Password validation
@@ -148,3 +159,28 @@ CSRF_TRUSTED_ORIGINS = [
 
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Rendered invoice/receipt PDFs, content-addressed (billing.pdf_service)
+PDF_CACHE_DIR = BASE_DIR / "pdf_cache"
+PDF_RENDER_WORKERS = 2   # 0 = render inline in the web process
+PDF_RENDER_QUEUE = 8     # renders in flight per web process before answering 503
+PDF_CACHE_MAX_AGE_DAYS = 30  # `prune_pdf_cache` drops files not served for this long...
+PDF_CACHE_MAX_MB = 500       # ...then the least recently served until the directory fits
+
+# Live visit queue (visits.queue). The queue page polls the feed; set VISIT_QUEUE_SSE to
+# use the server-sent events stream instead. Each open stream holds a sync worker, so
+# streams end after VISIT_QUEUE_STREAM_SECONDS and the browser reconnects.
+VISIT_QUEUE_SSE = False
+VISIT_QUEUE_STREAM_SECONDS = 25
+
+# Database-backed background tasks, run by `manage.py run_tasks` (core.tasks)
+TASK_LOCK_TIMEOUT = 600      # seconds a task may stay RUNNING before it is assumed dead and requeued
+TASK_MAX_BACKOFF = 3600      # seconds; cap on the exponential retry delay
+TASK_RETENTION_DAYS = 14     # finished (DONE/FAILED) tasks older than this are purged by the worker
+TASK_PURGE_INTERVAL = 3600   # seconds between purges in a long-running `run_tasks`
+
+# Per-request SQL/template timing, Server-Timing header and /ops/profiling/ (core.profiling).
+# Off by default; turn on while investigating. The header only goes to admins.
+REQUEST_PROFILING = os.environ.get("REQUEST_PROFILING", "") == "1"
+REQUEST_PROFILING_BUFFER = 1000      # requests kept per process
+REQUEST_PROFILING_TOP_QUERIES = 5    # slowest statements kept per request
@@ -26,6 +26,7 @@ urlpatterns = [
     path("visits/", include("visits.urls")),
     path("pharmacy/", include("pharmacy.urls")),
     path("billing/", include("billing.urls")),
+    path("ops/", include("core.urls")),
 ]
 
 if settings.DEBUG:
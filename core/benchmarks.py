@@ -0,0 +1,175 @@
+"""
+Benchmark harness for the hot views and services.
+
+Each benchmark runs against whatever is in the database (typically a
+dataset from `generate_synthetic_data`, or one seeded by `run_benchmarks
+--patients` and rolled back afterwards). Views are called directly with a
+RequestFactory request from a superuser, so the numbers cover the view and
+its template but not middleware or the network.
+
+Results are a median over repeated runs plus the query count of one run.
+`compare` checks them against a stored baseline (JSON): a benchmark
+regresses when it runs more queries than the baseline, or when its median
+is both `tolerance` slower and NOISE_FLOOR_MS slower in absolute terms, so
+sub-millisecond jitter never fails a run. Timings only mean something on the
+machine that recorded them, so against a baseline from another host only
+query counts are compared. benchmarks/baseline.json ships with the repo
+(recorded with `run_benchmarks --patients 2000` on an empty SQLite
+database) to hold the query counts; run --save-baseline locally to compare
+timings too.
+"""
+import json
+import platform
+import time
+from dataclasses import dataclass
+from statistics import median
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from billing import revenue
+from billing.claims import iter_claim_batch_csv
+from billing.models import HMOClaimBatch, Invoice
+from billing.services import generate_invoice_for_visit
+from patients.models import Patient
+from patients.search import search_patients
+from visits.models import Visit
+
+NOISE_FLOOR_MS = 2.0
+SEARCH_TERM = "okaf"
+
+
+@dataclass
+class Result:
+    label: str
+    median_ms: float
+    queries: int
+    runs: int
+
+
+def _samples():
+    """Representative rows to benchmark against; None where the database has none."""
+    visit = (
+        Visit.objects.filter(status=Visit.Status.CLOSED)
+        .annotate(n=Count("prescriptions")).filter(n__gt=0).order_by("-id").first()
+    )
+    return {
+        "visit": visit,
+        "invoice": Invoice.objects.filter(hmo_amount__gt=0).order_by("-id").first(),
+        "batch": HMOClaimBatch.objects.annotate(n=Count("items")).order_by("-n").first(),
+        "patient": Patient.objects.order_by("-id").first(),
+    }
+
+
+def _view(name, *, args=(), query=None):
+    """Callable that renders the named view for a superuser and consumes the response."""
+    path = reverse(name, args=args)
+    match = resolve(path)
+    factory = RequestFactory()
+    user = get_user_model()(username="benchmark", is_superuser=True, is_staff=True)
+
+    def run():
+        request = factory.get(path, query or {})
+        request.user = user
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elif response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}")
+
+    return run
+
+
+def benchmarks(samples=None):
+    """[(label, callable)] for every benchmark the current data supports."""
+    s = samples if samples is not None else _samples()
+    today = timezone.localdate()
+    marks = [
+        ("visits.queue", _view("visits:queue")),
+        ("pharmacy.queue", _view("pharmacy:queue")),
+        ("patients.search", lambda: list(search_patients(SEARCH_TERM)[:50])),
+        ("patients.typeahead", _view("patients:patient_search_json", query={"q": SEARCH_TERM})),
+        ("billing.hmo_aging", _view("billing:hmo_aging")),
+        ("billing.revenue_snapshot", lambda: revenue._build_snapshot(today)),
+        ("billing.invoice_list", _view("billing:invoice_list")),
+    ]
+    if s["patient"]:
+        marks.append(("patients.detail", _view("patients:patient_detail", args=[s["patient"].pk])))
+    if s["visit"]:
+        marks.append(("billing.generate_invoice", lambda: generate_invoice_for_visit(s["visit"])))
+    if s["invoice"]:
+        marks.append(("billing.invoice_detail", _view("billing:invoice_detail", args=[s["invoice"].pk])))
+    if s["batch"]:
+        marks.append(("billing.claims_export", lambda: sum(len(chunk) for chunk in iter_claim_batch_csv(s["batch"]))))
+    return marks
+
+
+def run(repeat=5, only=None, log=None):
+    """Warm up, count queries on one run, then time `repeat` runs of each benchmark."""
+    results = []
+    for label, fn in benchmarks():
+        if only and label not in only:
+            continue
+        fn()  # warm caches/templates so the first timed run isn't an outlier
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - t0) * 1000)
+        result = Result(label, median(timings), len(queries), repeat)
+        results.append(result)
+        if log:
+            log(result)
+    return results
+
+
+def dataset_meta():
+    return {
+        "patients": Patient.objects.count(),
+        "visits": Visit.objects.count(),
+        "invoices": Invoice.objects.count(),
+        "vendor": connection.vendor,
+        "python": platform.python_version(),
+        "host": platform.node(),
+    }
+
+
+def save_baseline(path, results, meta):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "created": timezone.now().isoformat(),
+        "meta": meta,
+        "results": {r.label: {"median_ms": round(r.median_ms, 3), "queries": r.queries} for r in results},
+    }
+    path.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n")
+
+
+def load_baseline(path):
+    return json.loads(path.read_text())
+
+
+def compare(results, baseline, tolerance, timings=True):
+    """
+    [(result, baseline entry or None, regression reason or "")] in result order.
+    timings=False checks query counts only.
+    """
+    rows = []
+    for r in results:
+        base = baseline["results"].get(r.label)
+        reason = ""
+        if base is not None:
+            if r.queries > base["queries"]:
+                reason = f"queries {base['queries']} -> {r.queries}"
+            elif (timings and r.median_ms > base["median_ms"] * (1 + tolerance)
+                  and r.median_ms - base["median_ms"] > NOISE_FLOOR_MS):
+                reason = f"{(r.median_ms / max(base['median_ms'], 1e-9) - 1) * 100:+.0f}% slower"
+        rows.append((r, base, reason))
+    return rows
@@ -0,0 +1,160 @@
+"""
+Write-concurrency benchmark for a database profile.
+
+N worker threads, each with its own private connection, run short
+read-then-write transactions the way cashier, pharmacy and front-desk
+requests do: read a shared counter, bump it, insert a row. The result is committed writes per
+second, latency percentiles and how many transactions failed (on SQLite,
+"database is locked").
+
+On SQLite the benchmark runs in a scratch database file so the stock
+profile (rollback journal, deferred transactions) can be compared with the
+tuned one from core.dbprofile. On a server database it runs the configured
+profile against two scratch tables in the configured database, dropped
+afterwards.
+"""
+import copy
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.db import DatabaseError, connections
+from django.db.utils import load_backend
+
+from .dbprofile import sqlite_options
+
+ALIAS = "concurrency_bench"
+COUNTER_TABLE = "edh_bench_counter"
+WRITES_TABLE = "edh_bench_writes"
+SQLITE_PROFILES = ("stock", "tuned")
+
+
+@dataclass
+class ConcurrencyResult:
+    profile: str
+    workers: int
+    committed: int
+    failed: int
+    seconds: float
+    p50_ms: float
+    p95_ms: float
+
+    @property
+    def writes_per_second(self) -> float:
+        return self.committed / self.seconds if self.seconds else 0.0
+
+
+def _settings(database, profile, scratch_dir):
+    cfg = copy.deepcopy(connections.settings[database])
+    if cfg["ENGINE"] == "django.db.backends.sqlite3":
+        cfg["NAME"] = str(Path(scratch_dir) / f"{profile}.sqlite3")
+        cfg["OPTIONS"] = sqlite_options() if profile == "tuned" else {}
+    cfg["CONN_MAX_AGE"] = None  # one connection per worker for the whole run
+    cfg["OPTIONS"].pop("pool", None)
+    return cfg
+
+
+def _connect(cfg):
+    """A private connection outside django.db.connections, one per worker thread."""
+    return load_backend(cfg["ENGINE"]).DatabaseWrapper(cfg, ALIAS)
+
+
+def _begin(cfg):
+    # what atomic() issues for this profile: SQLite honours OPTIONS["transaction_mode"]
+    if cfg["ENGINE"] == "django.db.backends.sqlite3":
+        return f"BEGIN {cfg['OPTIONS'].get('transaction_mode') or ''}".strip()
+    return "BEGIN"
+
+
+def _create_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {WRITES_TABLE}")
+        cur.execute(f"DROP TABLE IF EXISTS {COUNTER_TABLE}")
+        cur.execute(f"CREATE TABLE {COUNTER_TABLE} (id integer PRIMARY KEY, n integer NOT NULL)")
+        cur.execute(f"CREATE TABLE {WRITES_TABLE} (worker integer NOT NULL, seq integer NOT NULL, note varchar(80))")
+        cur.execute(f"INSERT INTO {COUNTER_TABLE} (id, n) VALUES (1, 0)")
+
+
+def _drop_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {WRITES_TABLE}")
+        cur.execute(f"DROP TABLE IF EXISTS {COUNTER_TABLE}")
+
+
+def _worker(cfg, worker, transactions, start, latencies, failures):
+    conn = _connect(cfg)
+    begin = _begin(cfg)
+    note = f"worker {worker} " + "x" * 40
+    start.wait()
+    try:
+        with conn.cursor() as cur:
+            for _ in range(transactions):
+                t0 = time.perf_counter()
+                try:
+                    cur.execute(begin)
+                    cur.execute(f"SELECT n FROM {COUNTER_TABLE} WHERE id = 1")
+                    seq = cur.fetchone()[0] + 1
+                    cur.execute(f"UPDATE {COUNTER_TABLE} SET n = n + 1 WHERE id = 1")
+                    cur.execute(
+                        f"INSERT INTO {WRITES_TABLE} (worker, seq, note) VALUES (%s, %s, %s)",
+                        [worker, seq, note],
+                    )
+                    cur.execute("COMMIT")
+                except DatabaseError:
+                    failures.append(worker)
+                    try:
+                        cur.execute("ROLLBACK")
+                    except DatabaseError:
+                        pass  # the failed statement already ended the transaction
+                    continue
+                latencies.append((time.perf_counter() - t0) * 1000)
+    finally:
+        conn.close()
+
+
+def run(profile="tuned", *, workers=8, transactions=100, database="default") -> ConcurrencyResult:
+    """Run `workers` threads x `transactions` write transactions under `profile` and time them."""
+    scratch_dir = tempfile.mkdtemp(prefix="edh-dbbench-")
+    cfg = _settings(database, profile, scratch_dir)
+    admin = _connect(cfg)
+    try:
+        _create_tables(admin)
+        latencies, failures = [], []
+        start = threading.Barrier(workers + 1)
+        threads = [
+            threading.Thread(target=_worker, args=(cfg, w, transactions, start, latencies, failures))
+            for w in range(workers)
+        ]
+        for t in threads:
+            t.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for t in threads:
+            t.join()
+        seconds = time.perf_counter() - t0
+
+        latencies.sort()
+        return ConcurrencyResult(
+            profile=profile,
+            workers=workers,
+            committed=len(latencies),
+            failed=len(failures),
+            seconds=seconds,
+            p50_ms=statistics.median(latencies) if latencies else 0.0,
+            p95_ms=latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+        )
+    finally:
+        _drop_tables(admin)
+        admin.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def profiles_for(database="default"):
+    """Profiles worth comparing: stock vs tuned on SQLite, the configured one elsewhere."""
+    if connections.settings[database]["ENGINE"] == "django.db.backends.sqlite3":
+        return SQLITE_PROFILES
+    return ("configured",)
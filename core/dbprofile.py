@@ -0,0 +1,130 @@
+"""
+Database profiles.
+
+settings.DATABASES is built here from DB_* environment variables so one
+settings module serves a single-machine SQLite install and a server
+database without edits.
+
+SQLite (the default) is tuned for several workstations writing at once:
+
+* WAL journal: readers never block the writer and the writer never blocks
+  readers, so only write/write overlaps contend.
+* synchronous=NORMAL: WAL stays crash-safe; only the last transactions
+  before a power cut can be lost, instead of an fsync per commit.
+* mmap_size / cache_size / temp_store: reads come from mapped pages and
+  sorts stay in memory.
+* busy timeout (OPTIONS["timeout"]): a writer waits for the lock instead of
+  failing with "database is locked".
+* transaction_mode=IMMEDIATE: transactions take the write lock when they
+  begin, so two read-then-write transactions can't deadlock on the upgrade
+  (which SQLite reports as "locked" regardless of the timeout).
+* CONN_MAX_AGE: each server thread keeps its connection, so the pragmas run
+  once per thread rather than once per request.
+
+DB_ENGINE=postgresql or mysql selects a server database. It keeps
+persistent connections (CONN_MAX_AGE plus health checks), or, on
+PostgreSQL with DB_POOL_MAX_SIZE set, uses psycopg's connection pool
+instead. DB_REPLICA_NAME / DB_REPLICA_HOST add a "replica" alias for
+core.replicas. `run_db_concurrency_benchmark` measures write throughput
+for a profile under parallel workers.
+"""
+import os
+
+ENGINES = {
+    "sqlite": "django.db.backends.sqlite3",
+    "postgresql": "django.db.backends.postgresql",
+    "mysql": "django.db.backends.mysql",
+}
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,   # 256 MiB
+    "cache_size": -65536,     # negative = KiB, i.e. 64 MiB
+    "temp_store": "MEMORY",
+}
+
+
+def _int(env, name, default):
+    raw = env.get(name)
+    return int(raw) if raw not in (None, "") else default
+
+
+def _max_age(env, default):
+    # "none"/"persistent" = keep connections for the life of the thread
+    raw = (env.get("DB_CONN_MAX_AGE") or "").strip().lower()
+    if raw in ("none", "persistent"):
+        return None
+    return int(raw) if raw else default
+
+
+def sqlite_options(env=os.environ, pragmas=None):
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    return {
+        "timeout": _int(env, "DB_BUSY_TIMEOUT", 20),  # seconds
+        "transaction_mode": env.get("DB_SQLITE_TRANSACTION_MODE") or "IMMEDIATE",
+        "init_command": ";".join(f"PRAGMA {name}={value}" for name, value in pragmas.items()),
+    }
+
+
+def database_settings(base_dir, env=os.environ):
+    """The DATABASES setting for the profile selected by DB_ENGINE (default sqlite), plus any replica."""
+    databases = {"default": _primary(base_dir, env)}
+    replica = _replica(databases["default"], env)
+    if replica:
+        databases["replica"] = replica
+    return databases
+
+
+def _replica(primary, env):
+    """
+    The read replica (core.replicas) when DB_REPLICA_NAME or DB_REPLICA_HOST is set.
+
+    Same profile as the primary; tests run it as a mirror of the test primary.
+    """
+    if not (env.get("DB_REPLICA_NAME") or env.get("DB_REPLICA_HOST")):
+        return None
+    replica = {**primary, "OPTIONS": dict(primary["OPTIONS"]), "TEST": {"MIRROR": "default"}}
+    for key in ("NAME", "HOST", "PORT", "USER", "PASSWORD"):
+        if env.get(f"DB_REPLICA_{key}"):
+            replica[key] = env[f"DB_REPLICA_{key}"]
+    return replica
+
+
+def _primary(base_dir, env):
+    engine = (env.get("DB_ENGINE") or "sqlite").lower()
+    if engine not in ENGINES:
+        raise ValueError(f"DB_ENGINE must be one of {', '.join(ENGINES)}, not {engine!r}")
+
+    if engine == "sqlite":
+        return {
+            "ENGINE": ENGINES[engine],
+            "NAME": env.get("DB_NAME") or base_dir / "db.sqlite3",
+            "OPTIONS": sqlite_options(env),
+            "CONN_MAX_AGE": _max_age(env, 600),
+            "CONN_HEALTH_CHECKS": True,
+        }
+
+    default = {
+        "ENGINE": ENGINES[engine],
+        "NAME": env.get("DB_NAME") or "edh",
+        "USER": env.get("DB_USER", ""),
+        "PASSWORD": env.get("DB_PASSWORD", ""),
+        "HOST": env.get("DB_HOST", ""),
+        "PORT": env.get("DB_PORT", ""),
+        "CONN_MAX_AGE": _max_age(env, 60),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    pool_size = _int(env, "DB_POOL_MAX_SIZE", 0)
+    if engine == "postgresql" and pool_size:
+        # the pool hands out connections per request; Django requires CONN_MAX_AGE=0 with it
+        default["OPTIONS"]["pool"] = {
+            "min_size": _int(env, "DB_POOL_MIN_SIZE", 2),
+            "max_size": pool_size,
+            "timeout": _int(env, "DB_POOL_TIMEOUT", 10),
+        }
+        default["CONN_MAX_AGE"] = 0
+    if engine == "mysql":
+        default["OPTIONS"]["charset"] = "utf8mb4"
+    return default
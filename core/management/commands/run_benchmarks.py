@@ -0,0 +1,82 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import benchmarks, synthetic
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot views and services (queue, patient search, invoice generation, aging, "
+        "claims export) and compare against a stored baseline. Everything runs in a transaction "
+        "that is rolled back, so benchmarks that write leave no trace."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patients", type=int, default=0,
+            help="Generate this many synthetic patients first (rolled back afterwards); 0 = use existing data",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (median reported)")
+        parser.add_argument("--only", action="append", help="Run only this benchmark (repeatable)")
+        parser.add_argument("--baseline", default=str(Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"))
+        parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25,
+            help="Allowed slowdown over the baseline median before failing (0.25 = 25%%)",
+        )
+
+    def handle(self, *args, **opts):
+        baseline_path = Path(opts["baseline"])
+        try:
+            with transaction.atomic():
+                if opts["patients"]:
+                    synthetic.generate(opts["patients"])
+                meta = benchmarks.dataset_meta()
+                results = benchmarks.run(repeat=opts["repeat"], only=opts["only"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        if opts["save_baseline"]:
+            benchmarks.save_baseline(baseline_path, results, meta)
+            for r in results:
+                self.stdout.write(f"{r.label:<28} {r.median_ms:10.2f} ms {r.queries:5d} queries")
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+
+        if not baseline_path.exists():
+            for r in results:
+                self.stdout.write(f"{r.label:<28} {r.median_ms:10.2f} ms {r.queries:5d} queries")
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}; run with --save-baseline"))
+            return
+
+        baseline = benchmarks.load_baseline(baseline_path)
+        if baseline["meta"].get("patients") != meta["patients"]:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline dataset had {baseline['meta'].get('patients')} patients, this one {meta['patients']}"
+            ))
+
+        timings = baseline["meta"].get("host") == meta["host"]
+        if not timings:
+            self.stdout.write(self.style.WARNING(
+                "Baseline was recorded on another machine; comparing query counts only"
+            ))
+
+        regressions = []
+        for r, base, reason in benchmarks.compare(results, baseline, opts["tolerance"], timings=timings):
+            was = f"{base['median_ms']:10.2f} ms {base['queries']:5d} q" if base else " " * 21 + "new"
+            status = self.style.ERROR(f"REGRESSED ({reason})") if reason else self.style.SUCCESS("ok")
+            self.stdout.write(f"{r.label:<28} {r.median_ms:10.2f} ms {r.queries:5d} q   was {was}   {status}")
+            if reason:
+                regressions.append(r.label)
+
+        if regressions:
+            raise CommandError("Slower than baseline: " + ", ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import dbbench
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure write throughput with parallel workers doing short read-then-write transactions. "
+        "On SQLite, compares the stock profile with the tuned one (WAL, synchronous=NORMAL, busy "
+        "timeout, IMMEDIATE transactions) in a scratch file; elsewhere benchmarks the configured "
+        "database using scratch tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Parallel workers, one connection each")
+        parser.add_argument("--transactions", type=int, default=200, help="Write transactions per worker")
+        parser.add_argument("--profile", action="append", help="Profile to run (repeatable; default: all)")
+        parser.add_argument("--database", default="default", help="Database alias whose settings are used")
+
+    def handle(self, *args, **opts):
+        available = dbbench.profiles_for(opts["database"])
+        profiles = opts["profile"] or available
+        unknown = set(profiles) - set(available)
+        if unknown:
+            raise CommandError(f"Unknown profile(s) {', '.join(sorted(unknown))}; choose from {', '.join(available)}")
+
+        self.stdout.write(f"{opts['workers']} workers x {opts['transactions']} transactions")
+        for profile in profiles:
+            r = dbbench.run(
+                profile, workers=opts["workers"], transactions=opts["transactions"], database=opts["database"],
+            )
+            line = (
+                f"{r.profile:<12} {r.writes_per_second:9.0f} writes/s   p50 {r.p50_ms:7.2f} ms   "
+                f"p95 {r.p95_ms:7.2f} ms   committed {r.committed:6d}   failed {r.failed:5d}"
+            )
+            self.stdout.write(self.style.ERROR(line) if r.failed else line)
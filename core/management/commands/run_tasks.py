@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks (core.tasks). Polls until interrupted unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run what is due now, then exit")
+        parser.add_argument("--batch", type=int, default=10, help="Tasks claimed per poll")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **opts):
+        worker = tasks.worker_id()
+        interval = getattr(settings, "TASK_PURGE_INTERVAL", 3600)
+        next_purge = time.monotonic()
+        while True:
+            counts = tasks.run_pending(worker=worker, batch=opts["batch"])
+            if counts["done"] or counts["failed"]:
+                self.stdout.write(f"{worker}: {counts['done']} done, {counts['failed']} failed")
+            if opts["once"] or time.monotonic() >= next_purge:
+                purged = tasks.purge_finished()
+                if purged:
+                    self.stdout.write(f"Purged {purged} finished tasks")
+                next_purge = time.monotonic() + interval
+            if opts["once"]:
+                return
+            time.sleep(opts["sleep"])
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Stamp the replication heartbeat on the primary. With SQLite, also copy the primary "
+        "database onto the replica file (the local stand-in for replication)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=0,
+            help="Repeat every N seconds until interrupted (0 = run once)",
+        )
+
+    def handle(self, *args, **opts):
+        if not replicas.replica_configured():
+            raise CommandError("No replica configured; set DB_REPLICA_NAME or DB_REPLICA_HOST.")
+
+        while True:
+            t0 = time.perf_counter()
+            if connection.vendor == "sqlite":
+                replicas.sync_sqlite()
+                self.stdout.write(f"Replica copied in {(time.perf_counter() - t0) * 1000:.0f} ms")
+            else:
+                replicas.stamp_heartbeat()
+                self.stdout.write("Heartbeat stamped")
+            if not opts["interval"]:
+                return
+            time.sleep(opts["interval"])
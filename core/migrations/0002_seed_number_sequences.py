@@ -0,0 +1,40 @@
+import re
+
+from django.db import migrations
+from django.db.models import Max
+
+# series -> (app, model, number field, number pattern); numbers used to be
+# "<prefix>{id:06d}", assigned after insert
+SERIES = {
+    "patient": ("patients", "Patient", "hospital_number", re.compile(r"^EDH-(\d+)$")),
+    "visit": ("visits", "Visit", "visit_number", re.compile(r"^EDH-V-(\d+)$")),
+    "invoice": ("billing", "Invoice", "invoice_number", re.compile(r"^EDH-INV-(\d+)$")),
+}
+
+
+def seed_sequences(apps, schema_editor):
+    NumberSequence = apps.get_model("core", "NumberSequence")
+    for series, (app_label, model_name, field, pattern) in SERIES.items():
+        model = apps.get_model(app_label, model_name)
+        last = model.objects.aggregate(m=Max("id"))["m"] or 0
+        prefix = pattern.pattern[1:pattern.pattern.index("(")]
+        numbers = model.objects.filter(**{f"{field}__startswith": prefix}).values_list(field, flat=True)
+        for number in numbers.iterator(chunk_size=2000):
+            m = pattern.match(number)
+            if m:
+                last = max(last, int(m.group(1)))
+        NumberSequence.objects.update_or_create(name=series, defaults={"last_value": last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+        ("patients", "0003_patient_search_keys"),
+        ("visits", "0003_hot_path_indexes"),
+        ("billing", "0008_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import models
+
+
+class NumberSequence(models.Model):
+    """Last number handed out for one document series (see core.sequences)."""
+    name = models.CharField(max_length=40, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
+class ReplicaHeartbeat(models.Model):
+    """
+    Single row stamped on the primary and read back on the replica; the
+    difference is the replica's lag (see core.replicas).
+    """
+    beat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"heartbeat {self.beat_at:%Y-%m-%d %H:%M:%S}"
+
+
+class BackgroundTask(models.Model):
+    """One queued call of a @task function (see core.tasks); the table is the broker."""
+
+    class Status(models.TextChoices):
+        QUEUED = "QUEUED", "Queued"
+        RUNNING = "RUNNING", "Running"
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+
+    name = models.CharField(max_length=200)  # dotted path of the task function
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=80, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # worker poll: due queued tasks, oldest first
+            models.Index(fields=["status", "run_at"], name="task_status_run_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
@@ -0,0 +1,184 @@
+"""
+Per-request profiling.
+
+ProfilingMiddleware times every request and, through a database execute
+wrapper, every SQL statement it runs; template time comes from a wrapper
+around django.template.base.Template.render that only times the outermost
+render (includes and extends are counted once). Because querysets are lazy,
+template time includes SQL the template itself triggers (e.g. `invoice.lines`
+in a loop), which is exactly where N+1 patterns hide.
+
+It is off unless REQUEST_PROFILING is set. Each finished request becomes a
+small record in a per-process ring buffer (REQUEST_PROFILING_BUFFER
+entries). Responses to admins (the users who can open the ops page) also
+carry a Server-Timing header, so their browser dev tools show sql/tpl/total
+for any page; nobody else is told how long our queries take. `slowest_endpoints` aggregates the
+buffer per view for the ops page (core.views.profiling_report). Streaming
+responses are timed up to the point the response is returned; queries run
+while the body streams are not counted.
+"""
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import base as template_base
+from django.utils import timezone
+
+_current = ContextVar("request_profile", default=None)
+_lock = threading.Lock()
+_buffer = deque(maxlen=getattr(settings, "REQUEST_PROFILING_BUFFER", 1000))
+_original_render = None
+
+
+class RequestProfile:
+    __slots__ = ("queries", "sql_ms", "template_ms", "rendering")
+
+    def __init__(self):
+        self.queries = []  # (sql, ms)
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.rendering = False
+
+
+def _time_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        profile.sql_ms += ms
+        profile.queries.append((sql, ms))
+
+
+def _timed_render(self, context):
+    profile = _current.get()
+    if profile is None or profile.rendering:
+        return _original_render(self, context)
+    profile.rendering = True
+    t0 = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        profile.rendering = False
+        profile.template_ms += (time.perf_counter() - t0) * 1000
+
+
+def install():
+    """Wrap Template.render once per process (done when the middleware loads)."""
+    global _original_render
+    if _original_render is None:
+        _original_render = template_base.Template.render
+        template_base.Template.render = _timed_render
+
+
+def _summarize(request, response, profile, total_ms):
+    top = getattr(settings, "REQUEST_PROFILING_TOP_QUERIES", 5)
+    match = getattr(request, "resolver_match", None)
+    counts = Counter(sql for sql, _ in profile.queries).most_common(1)
+    repeated_sql, repeated = counts[0] if counts else ("", 0)
+    return {
+        "at": timezone.now(),
+        "view": match.view_name if match else request.path,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "total_ms": total_ms,
+        "sql_ms": profile.sql_ms,
+        "sql_count": len(profile.queries),
+        "template_ms": profile.template_ms,
+        "worst_queries": sorted(((ms, sql) for sql, ms in profile.queries), reverse=True)[:top],
+        # the same statement many times over is the usual N+1 signature
+        "repeated": (repeated, repeated_sql) if repeated > 1 else (0, ""),
+    }
+
+
+def may_see_timings(request) -> bool:
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return False
+    return user.is_superuser or getattr(user, "role", None) == "admin"
+
+
+def server_timing(record) -> str:
+    return (
+        f'sql;dur={record["sql_ms"]:.1f};desc="{record["sql_count"]} queries", '
+        f'tpl;dur={record["template_ms"]:.1f};desc="templates", '
+        f'total;dur={record["total_ms"]:.1f}'
+    )
+
+
+def recent():
+    with _lock:
+        return list(_buffer)
+
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+
+def slowest_endpoints(limit=20):
+    """Per-view stats over the buffer, slowest worst-case first, with each view's worst queries."""
+    by_view = {}
+    for r in recent():
+        by_view.setdefault(r["view"], []).append(r)
+
+    rows = []
+    for view, records in by_view.items():
+        worst = max(records, key=lambda r: r["total_ms"])
+        slowest_sql = {}
+        for r in records:
+            for ms, sql in r["worst_queries"]:
+                slowest_sql[sql] = max(ms, slowest_sql.get(sql, 0.0))
+        rows.append({
+            "view": view,
+            "requests": len(records),
+            "avg_ms": sum(r["total_ms"] for r in records) / len(records),
+            "max_ms": worst["total_ms"],
+            "avg_queries": sum(r["sql_count"] for r in records) / len(records),
+            "max_queries": max(r["sql_count"] for r in records),
+            "avg_sql_ms": sum(r["sql_ms"] for r in records) / len(records),
+            "avg_template_ms": sum(r["template_ms"] for r in records) / len(records),
+            "worst_path": worst["path"],
+            "repeated": max(r["repeated"] for r in records),
+            "worst_queries": sorted(((ms, sql) for sql, ms in slowest_sql.items()), reverse=True)[:3],
+        })
+    rows.sort(key=lambda row: row["max_ms"], reverse=True)
+    return rows[:limit]
+
+
+class ProfilingMiddleware:
+    """Records query count, SQL time, template time and latency for every request."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_PROFILING", False):
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        t0 = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        record = _summarize(request, response, profile, (time.perf_counter() - t0) * 1000)
+        with _lock:
+            _buffer.append(record)
+        if may_see_timings(request):
+            response["Server-Timing"] = server_timing(record)
+        return response
@@ -0,0 +1,155 @@
+"""
+Read-replica routing for reporting views.
+
+Dashboards, reports and exports read a lot and write nothing, yet they
+share the primary with the visit and payment writes. Views marked
+@read_only_replica send their ORM reads to the REPLICA alias; every other
+read, and every write anywhere, goes to the primary.
+
+The replica is only used when it is configured (DATABASES["replica"], see
+core.dbprofile) and fresh enough: its copy of the ReplicaHeartbeat row,
+stamped on the primary, must be at most DATABASE_REPLICA_MAX_LAG seconds
+old. The check is cached per process for DATABASE_REPLICA_CHECK_INTERVAL
+seconds. A lagging or unreachable replica falls back to the primary, so a
+marked view is never wrong by more than the tolerance, just slower.
+
+Only GET/HEAD requests are routed, and reads inside a transaction on the
+primary stay there, so a view that does write still reads its own writes.
+Streaming responses stay on the replica while their body is produced.
+Code that caches what it read checks `reading_replica()` first, so a
+lagging copy is never stored for longer than it is served.
+
+`sync_sqlite` is the stand-in replication for local setups: it stamps the
+heartbeat and copies the primary SQLite file onto the replica file with
+SQLite's online backup (see the sync_replica command). Server databases
+use their own replication and only need the heartbeat stamped.
+"""
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+REPLICA = "replica"
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_lock = threading.Lock()
+_health = {"checked": None, "ok": False, "lag": None}
+
+
+def replica_configured() -> bool:
+    return REPLICA in connections.settings
+
+
+def stamp_heartbeat(using=DEFAULT_DB_ALIAS):
+    from .models import ReplicaHeartbeat
+
+    ReplicaHeartbeat.objects.using(using).update_or_create(pk=1, defaults={"beat_at": timezone.now()})
+
+
+def replica_lag():
+    """Seconds the replica is behind the primary, or None if it can't be told (no heartbeat, unreachable)."""
+    from .models import ReplicaHeartbeat
+
+    try:
+        beat_at = ReplicaHeartbeat.objects.using(REPLICA).filter(pk=1).values_list("beat_at", flat=True).first()
+    except DatabaseError:
+        return None
+    return (timezone.now() - beat_at).total_seconds() if beat_at else None
+
+
+def replica_available() -> bool:
+    """Configured, reachable and within DATABASE_REPLICA_MAX_LAG; cached for the check interval."""
+    if not replica_configured():
+        return False
+    interval = getattr(settings, "DATABASE_REPLICA_CHECK_INTERVAL", 5)
+    now = time.monotonic()
+    with _lock:
+        if _health["checked"] is not None and now - _health["checked"] < interval:
+            return _health["ok"]
+
+    lag = replica_lag()
+    max_lag = getattr(settings, "DATABASE_REPLICA_MAX_LAG", 30)
+    ok = lag is not None and (max_lag is None or lag <= max_lag)
+    with _lock:
+        _health.update(checked=now, ok=ok, lag=lag)
+    return ok
+
+
+def reset_health():
+    with _lock:
+        _health.update(checked=None, ok=False, lag=None)
+
+
+def reading_replica() -> bool:
+    """Whether ORM reads made here and now are routed to the replica."""
+    return (
+        _replica_reads.get()
+        and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        and replica_available()
+    )
+
+
+class ReplicaRouter:
+    """Reads in @read_only_replica views go to the replica when it is fresh; everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if reading_replica() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # never follow an instance's _state.db to the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # same data on both aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA  # the replica gets its schema from the primary
+
+
+def _on_replica(chunks):
+    token = _replica_reads.set(True)
+    try:
+        yield from chunks
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_only_replica(view):
+    """Route this view's reads (GET/HEAD only) to the read replica when it is available."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+        if getattr(response, "streaming", False) and not getattr(response, "is_async", False):
+            response.streaming_content = _on_replica(response.streaming_content)
+        return response
+
+    return wrapper
+
+
+def sync_sqlite(primary=DEFAULT_DB_ALIAS, replica=REPLICA):
+    """Stand-in replication: stamp the heartbeat, then copy the primary SQLite database onto the replica."""
+    source = connections[primary]
+    target = connections.settings[replica]
+    if source.vendor != "sqlite" or target["ENGINE"] != "django.db.backends.sqlite3":
+        raise ValueError("sync_sqlite copies SQLite databases only; server replicas replicate themselves.")
+
+    stamp_heartbeat(primary)
+    source.ensure_connection()
+    dest = sqlite3.connect(str(target["NAME"]))
+    try:
+        source.connection.backup(dest)
+    finally:
+        dest.close()
+    reset_health()
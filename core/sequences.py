@@ -0,0 +1,68 @@
+"""
+Document numbers (hospital, visit, invoice) from counter rows.
+
+A number is reserved with a single UPDATE on the series' counter row
+before the record is inserted, so each insert is one write instead of an
+insert followed by a second save. The UPDATE runs in the caller's
+transaction: the row lock serializes concurrent workers, and a rolled
+back insert rolls its number back too, so series stay gap-free.
+Bulk writers reserve a whole block in the same single statement via
+allocate(series, count).
+"""
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import NumberSequence
+
+PATIENT = "patient"
+VISIT = "visit"
+INVOICE = "invoice"
+
+FORMATS = {
+    PATIENT: "EDH-{:06d}",
+    VISIT: "EDH-V-{:06d}",
+    INVOICE: "EDH-INV-{:06d}",
+}
+
+# backends that support UPDATE ... RETURNING
+_RETURNING_VENDORS = {"postgresql", "sqlite"}
+
+
+def _bump(series, count):
+    if connection.vendor in _RETURNING_VENDORS:
+        with connection.cursor() as cur:
+            cur.execute(
+                f"UPDATE {NumberSequence._meta.db_table} SET last_value = last_value + %s "
+                f"WHERE name = %s RETURNING last_value",
+                [count, series],
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    with transaction.atomic():
+        if not NumberSequence.objects.filter(name=series).update(last_value=F("last_value") + count):
+            return None
+        return NumberSequence.objects.filter(name=series).values_list("last_value", flat=True).get()
+
+
+def allocate(series, count=1) -> range:
+    """Reserve `count` consecutive values of `series`; returns them as a range."""
+    last = _bump(series, count)
+    if last is None:
+        # first use of a series the migrations did not seed
+        NumberSequence.objects.bulk_create([NumberSequence(name=series)], ignore_conflicts=True)
+        last = _bump(series, count)
+    return range(last - count + 1, last + 1)
+
+
+def format_number(series, value) -> str:
+    return FORMATS[series].format(value)
+
+
+def next_number(series) -> str:
+    return format_number(series, allocate(series)[0])
+
+
+def allocate_numbers(series, count) -> list:
+    """`count` formatted numbers for a bulk insert, reserved in one statement."""
+    return [format_number(series, v) for v in allocate(series, count)]
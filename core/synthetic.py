@@ -0,0 +1,403 @@
+"""
+Synthetic hospital-scale data.
+
+`generate` writes patients, visits, prescriptions, invoices (with lines),
+payments, HMO receivables and claim batches fast enough for million-patient
+datasets. Model instances and bulk_create are too slow at that size (most of
+the time goes into building objects and preparing each value), so rows are
+written as plain value lists through one prepared INSERT per table run with
+executemany, the nearest portable thing to COPY (`_BulkWriter`):
+
+- primary keys of referenced rows (patient, visit, invoice) are assigned up
+  front from the current max id, so children can be written in the same
+  pass; sequences are reset at the end of each chunk (PostgreSQL) and
+  SQLite's AUTOINCREMENT follows explicit ids on its own. Run it on a quiet
+  database;
+- document numbers are reserved in blocks from core.sequences, so generated
+  rows and later real ones never collide;
+- one transaction per chunk of patients keeps memory flat and lets an
+  interrupted run keep every completed chunk;
+- the tables signals normally maintain (HMO receivables, aging summary,
+  revenue rollups, invoice totals) are written from the same in-memory
+  figures, inside each chunk's transaction, so no rebuild pass over the
+  generated rows is needed and an interrupted run leaves them consistent
+  with the rows it kept.
+
+Figures follow billing.services (consultation fee + drug lines, HMO split
+from billing.utils). Randomness is seeded: the same arguments give the same
+data shape.
+"""
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from random import Random
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Max
+from django.utils import timezone
+
+from billing import aging, revenue
+from billing.models import (
+    DailyRevenueRollup, HMOClaimBatch, HMOClaimItem, HMOReceivable, Invoice, InvoiceLine, Payment,
+)
+from billing.services import CONSULTATION_FEE, invoice_status_for
+from billing.utils import split_amount
+from hmo.models import HMO
+from patients.models import Patient
+from patients.search import name_key, phone_key
+from pharmacy.models import Drug, PrescriptionItem
+from visits.models import Visit
+
+from . import sequences
+
+HMO_NAMES = ["Hygeia HMO", "AXA Mansard HMO", "Reliance HMO", "Leadway Health", "Avon HMO"]
+FIRST_NAMES = [
+    "Ada", "Chinedu", "Ngozi", "Tunde", "Funke", "Emeka", "Aisha", "Ibrahim", "Kemi", "Segun",
+    "Bola", "Uche", "Zainab", "Femi", "Amaka", "Yusuf", "Halima", "Obinna", "Tolu", "Nneka",
+]
+LAST_NAMES = [
+    "Obi", "Okafor", "Adeyemi", "Bello", "Eze", "Okonkwo", "Balogun", "Abubakar", "Nwosu", "Ogunleye",
+    "Ibrahim", "Olawale", "Chukwu", "Danjuma", "Onyeka", "Adebayo", "Musa", "Nnamdi", "Afolabi", "Ekwueme",
+]
+PHONE_PREFIXES = ["0803", "0806", "0813", "0816", "0703", "0706", "0810", "0905"]
+PAYMENT_METHODS = [Payment.Method.CASH, Payment.Method.POS, Payment.Method.TRANSFER]
+OPEN_STATUSES = [Visit.Status.OPEN, Visit.Status.WAITING_DOCTOR, Visit.Status.IN_CONSULT]
+CLAIM_PERIOD_DAYS = 30
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+
+
+class _BulkWriter:
+    """
+    Buffered executemany INSERTs for one table. Columns not passed to add()
+    take the field default; only dates, datetimes and decimals go through
+    the backend's adapters.
+    """
+
+    def __init__(self, model, batch_size, *, explicit_pk=False):
+        ops = connection.ops
+        fields = [
+            f for f in model._meta.concrete_fields
+            if explicit_pk or f is not model._meta.auto_field
+        ]
+        base = BaseDatabaseOperations
+        self.columns = []  # (attname, default, adapter or None)
+        for f in fields:
+            kind = f.get_internal_type()
+            adapt = None
+            if kind == "DateTimeField":
+                adapt = ops.adapt_datetimefield_value
+            elif kind == "DateField":
+                adapt = ops.adapt_datefield_value
+            elif kind == "DecimalField" and type(ops).adapt_decimalfield_value is not base.adapt_decimalfield_value:
+                adapt = lambda v, f=f: ops.adapt_decimalfield_value(v, f.max_digits, f.decimal_places)  # noqa: E731
+            self.columns.append((f.attname, f.get_default(), adapt))
+
+        qn = ops.quote_name
+        self.sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            qn(model._meta.db_table),
+            ", ".join(qn(f.column) for f in fields),
+            ", ".join(["%s"] * len(fields)),
+        )
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def add(self, **values):
+        row = []
+        for name, default, adapt in self.columns:
+            value = values.get(name, default)
+            row.append(value if adapt is None or value is None else adapt(value))
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+def _next_id(model):
+    return (model.objects.aggregate(m=Max("pk"))["m"] or 0) + 1
+
+
+def _numbers(series, count):
+    return [sequences.format_number(series, n) for n in sequences.allocate(series, count)] if count else []
+
+
+class _Generator:
+    def __init__(self, *, visits_per_patient, days, hmo_ratio, seed, batch_size, claims):
+        self.rnd = Random(seed)
+        self.visits_per_patient = visits_per_patient
+        self.days = days
+        self.hmo_ratio = hmo_ratio
+        self.tz = timezone.get_current_timezone()
+        self.now = timezone.now()
+        self.today = self._localdate(self.now)
+        self.rollups = defaultdict(lambda: [ZERO, 0])   # (day, method) -> [total, count]
+        self.summary = defaultdict(lambda: [ZERO, 0])   # (hmo, bucket) -> [total, count]
+        self.totals = [ZERO, ZERO]                       # InvoiceTotals: [outstanding, hmo_billed]
+
+        self.ids = {model: _next_id(model) for model in (Patient, Visit, Invoice)}
+        self.writers = {
+            Patient: _BulkWriter(Patient, batch_size, explicit_pk=True),
+            Visit: _BulkWriter(Visit, batch_size, explicit_pk=True),
+            PrescriptionItem: _BulkWriter(PrescriptionItem, batch_size),
+            Invoice: _BulkWriter(Invoice, batch_size, explicit_pk=True),
+            InvoiceLine: _BulkWriter(InvoiceLine, batch_size),
+            Payment: _BulkWriter(Payment, batch_size),
+            HMOReceivable: _BulkWriter(HMOReceivable, batch_size, explicit_pk=True),
+            HMOClaimItem: _BulkWriter(HMOClaimItem, batch_size),
+        }
+
+        self.hmos = [HMO.objects.get_or_create(name=name)[0] for name in HMO_NAMES]
+        self.drugs = self._drugs()
+        if not self.drugs:
+            Drug.objects.bulk_create([
+                Drug(name=f"Synthetic Drug {i}", strength="500mg", dosage_form="Tablet", price=Decimal(200 + i * 75))
+                for i in range(60)
+            ])
+            self.drugs = self._drugs()
+
+        # claim batches per HMO per 30-day period, up to a week ago
+        self.claim_start = self.today - timedelta(days=days)
+        self.claim_end = self.today - timedelta(days=7)
+        self.batches = {}
+        if claims:
+            self._create_batches()
+
+    @staticmethod
+    def _drugs():
+        return [
+            (pk, f"Drug: {name} {strength}".strip(), price)
+            for pk, name, strength, price in Drug.objects.filter(is_active=True, price__gt=0)
+            .values_list("id", "name", "strength", "price")
+        ]
+
+    def _create_batches(self):
+        periods = []
+        start = self.claim_start
+        while start <= self.claim_end:
+            end = min(start + timedelta(days=CLAIM_PERIOD_DAYS - 1), self.claim_end)
+            periods.append((start, end))
+            start = end + timedelta(days=1)
+        for hmo in self.hmos:
+            for index, (start, end) in enumerate(periods):
+                batch = HMOClaimBatch.objects.create(
+                    hmo_name=hmo.name, period_start=start, period_end=end,
+                    # a quarter of old claims are left unpaid (see _invoice)
+                    status="PARTIAL" if (self.today - end).days > 45 else "SUBMITTED",
+                )
+                self.batches[hmo.name, index] = batch.pk
+
+    def _localdate(self, value):
+        return value.astimezone(self.tz).date()
+
+    def _take_id(self, model):
+        pk = self.ids[model]
+        self.ids[model] = pk + 1
+        return pk
+
+    def _when(self, after=None):
+        """A timestamp in the generation window, no earlier than `after`."""
+        start = after or self.now - timedelta(days=self.days)
+        span = max((self.now - start).total_seconds(), 1)
+        return start + timedelta(seconds=self.rnd.random() * span)
+
+    def _payment(self, invoice_id, amount, method, paid_at, reference=""):
+        self.writers[Payment].add(
+            invoice_id=invoice_id, amount=amount, method=method, paid_at=paid_at, reference=reference,
+        )
+        key = (self._localdate(paid_at), method)
+        self.rollups[key][0] += amount
+        self.rollups[key][1] += 1
+
+    def _patient(self, hospital_number):
+        rnd = self.rnd
+        hmo = rnd.choice(self.hmos) if rnd.random() < self.hmo_ratio else None
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        phone = f"{rnd.choice(PHONE_PREFIXES)}{rnd.randrange(10**7):07d}"
+        patient = {
+            "id": self._take_id(Patient), "hospital_number": hospital_number, "created_at": self._when(),
+            "name": f"{last} {first}", "hmo_name": hmo.name if hmo else "",
+        }
+        self.writers[Patient].add(
+            id=patient["id"], hospital_number=hospital_number, first_name=first, last_name=last,
+            gender=rnd.choice("MF"), phone=phone, is_hmo=hmo is not None, hmo_id=hmo.pk if hmo else None,
+            created_at=patient["created_at"],
+            last_name_key=name_key(last), first_name_key=name_key(first), phone_key=phone_key(phone),
+        )
+        return patient
+
+    def _visit(self, patient, visit_number):
+        rnd = self.rnd
+        visit_id = self._take_id(Visit)
+        created = self._when(patient["created_at"])
+        # only today's visits can still be in the live queue
+        live = self._localdate(created) == self.today and rnd.random() < 0.5
+        self.writers[Visit].add(
+            id=visit_id, patient_id=patient["id"], visit_number=visit_number,
+            status=rnd.choice(OPEN_STATUSES) if live else Visit.Status.CLOSED,
+            created_at=created, updated_at=created, closed_at=None if live else created + timedelta(hours=2),
+        )
+
+        drugs = rnd.sample(self.drugs, rnd.randint(0, min(3, len(self.drugs))))
+        for drug_id, _, price in drugs:
+            self.writers[PrescriptionItem].add(
+                visit_id=visit_id, drug_id=drug_id, price=price, created_at=created,
+                dose="1 tab", frequency="bd", duration="5 days",
+                status=PrescriptionItem.Status.PENDING if live else PrescriptionItem.Status.DISPENSED,
+            )
+        return visit_id, created, live, drugs
+
+    def _invoice(self, patient, visit_id, visit_number, visited_at, drugs, invoice_number):
+        rnd = self.rnd
+        invoice_id = self._take_id(Invoice)
+        hmo_name = patient["hmo_name"]
+        created = visited_at + timedelta(hours=1)
+
+        total = patient_amount = hmo_amount = ZERO
+        priced = [(InvoiceLine.LineType.CONSULTATION, "Consultation Fee", CONSULTATION_FEE)]
+        priced += [(InvoiceLine.LineType.DRUG, description, price) for _, description, price in drugs]
+        for line_type, description, price in priced:
+            ps, hs = split_amount(price, bool(hmo_name))
+            self.writers[InvoiceLine].add(
+                invoice_id=invoice_id, line_type=line_type, description=description, qty=1,
+                unit_price=price, line_total=price, patient_share=ps, hmo_share=hs,
+            )
+            total += price
+            patient_amount += ps
+            hmo_amount += hs
+
+        # patients mostly pay on the day; a few leave a balance
+        roll = rnd.random()
+        paid = patient_amount if roll < 0.85 else (patient_amount / 2).quantize(CENT) if roll < 0.95 else ZERO
+        if paid > 0:
+            self._payment(invoice_id, paid, rnd.choice(PAYMENT_METHODS), created + timedelta(minutes=30))
+
+        hmo_state = Invoice.HMOState.OK
+        if hmo_amount > 0:
+            invoiced_on = self._localdate(created)
+            age = (self.today - invoiced_on).days
+            batch_id = self.batches.get((hmo_name, (invoiced_on - self.claim_start).days // CLAIM_PERIOD_DAYS))
+            claimed = bool(batch_id) and invoiced_on <= self.claim_end
+            if claimed:
+                hmo_state = Invoice.HMOState.SUBMITTED
+            # HMOs settle most claims a month or two after the invoice
+            hmo_paid = hmo_amount if age > 45 and rnd.random() < 0.75 else ZERO
+            settled_at, reference = None, f"SYN-{invoice_number}"
+            if hmo_paid:
+                settled_at = created + timedelta(days=rnd.randint(30, 45))
+                self._payment(invoice_id, hmo_paid, Payment.Method.HMO, settled_at, reference=reference)
+                hmo_state = Invoice.HMOState.SETTLED
+            if claimed:
+                self.writers[HMOClaimItem].add(
+                    batch_id=batch_id, invoice_id=invoice_id, hmo_amount=hmo_amount, patient=patient["name"],
+                    hospital_number=patient["hospital_number"], visit_number=visit_number, created_at=self.now,
+                    settled_at=settled_at, settled_amount=hmo_paid, settlement_reference=reference if hmo_paid else "",
+                )
+            outstanding = hmo_amount - hmo_paid
+            bucket = aging._bucket(age)
+            self.writers[HMOReceivable].add(
+                invoice_id=invoice_id, hmo_name=hmo_name, invoiced_on=invoiced_on, hmo_amount=hmo_amount,
+                hmo_paid=hmo_paid, outstanding=outstanding, bucket=bucket,
+            )
+            if outstanding > 0:
+                self.summary[hmo_name, bucket][0] += outstanding
+                self.summary[hmo_name, bucket][1] += 1
+
+        balance = patient_amount - paid
+        self.totals[0] += balance
+        self.totals[1] += hmo_amount
+        self.writers[Invoice].add(
+            id=invoice_id, invoice_number=invoice_number, patient_id=patient["id"], visit_id=visit_id,
+            hmo_name=hmo_name, status=invoice_status_for(balance, paid), created_at=created,
+            total_amount=total, patient_amount=patient_amount, hmo_amount=hmo_amount,
+            amount_paid=paid, balance=balance, hmo_state=hmo_state,
+        )
+
+    def chunk(self, n):
+        rnd = self.rnd
+        with transaction.atomic():
+            patients = [self._patient(hn) for hn in _numbers(sequences.PATIENT, n)]
+            plan = [(p, rnd.randint(1, 2 * self.visits_per_patient - 1)) for p in patients]
+            visit_numbers = iter(_numbers(sequences.VISIT, sum(k for _, k in plan)))
+
+            billable = []
+            for patient, k in plan:
+                for _ in range(k):
+                    visit_number = next(visit_numbers)
+                    visit_id, visited_at, live, drugs = self._visit(patient, visit_number)
+                    if not live:
+                        billable.append((patient, visit_id, visit_number, visited_at, drugs))
+
+            invoice_numbers = _numbers(sequences.INVOICE, len(billable))
+            for (patient, visit_id, visit_number, visited_at, drugs), number in zip(billable, invoice_numbers):
+                self._invoice(patient, visit_id, visit_number, visited_at, drugs, number)
+
+            for writer in self.writers.values():
+                writer.flush()
+            self._write_ledgers()
+
+    def _write_ledgers(self):
+        """Fold this chunk's figures into the signal-maintained tables, then start the next chunk at zero."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Patient, Visit, Invoice]):
+                cursor.execute(sql)
+
+        for (hmo_name, bucket), (total, count) in self.summary.items():
+            aging.shift_summary(hmo_name, bucket, total, count)
+
+        # merge into existing rollups: one read, one bulk update, one bulk insert
+        existing = {
+            (r.day, r.method): r
+            for r in DailyRevenueRollup.objects.filter(day__in={day for day, _ in self.rollups})
+        }
+        new = []
+        for key, (total, count) in self.rollups.items():
+            row = existing.get(key)
+            if row is None:
+                new.append(DailyRevenueRollup(day=key[0], method=key[1], total=total, payment_count=count))
+            else:
+                row.total += total
+                row.payment_count += count
+        DailyRevenueRollup.objects.bulk_update(existing.values(), ["total", "payment_count"], batch_size=500)
+        DailyRevenueRollup.objects.bulk_create(new, batch_size=500)
+        revenue.shift_totals(outstanding=self.totals[0], hmo=self.totals[1])
+
+        self.rollups.clear()
+        self.summary.clear()
+        self.totals = [ZERO, ZERO]
+
+    def counts(self):
+        counts = Counter({model._meta.model_name: writer.count for model, writer in self.writers.items()})
+        counts["hmoclaimbatch"] = len(self.batches)
+        return counts
+
+
+def generate(patients, *, visits_per_patient=5, days=365, hmo_ratio=0.4, seed=7,
+             chunk_size=10000, batch_size=500, claims=True, log=None) -> Counter:
+    """
+    Write `patients` synthetic patients and their history; returns rows written per model.
+    `log`, if given, is called with a progress line after every chunk.
+    """
+    gen = _Generator(
+        visits_per_patient=visits_per_patient, days=days, hmo_ratio=hmo_ratio, seed=seed,
+        batch_size=batch_size, claims=claims,
+    )
+    t0 = time.perf_counter()
+    done = 0
+    while done < patients:
+        n = min(chunk_size, patients - done)
+        gen.chunk(n)
+        done += n
+        if log:
+            rate = done / max(time.perf_counter() - t0, 1e-9)
+            log(f"{done}/{patients} patients, {gen.writers[Visit].count} visits ({rate:,.0f} patients/s)")
+    return gen.counts()
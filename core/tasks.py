@@ -0,0 +1,194 @@
+"""
+Database-backed background tasks.
+
+Slow side effects (mail, PDF pre-rendering) leave the request
+through a BackgroundTask row instead of a broker:
+
+    @task(max_attempts=5, backoff=30)
+    def send_password_reset(email, domain, use_https): ...
+
+    send_password_reset.enqueue(email=..., domain=..., use_https=...)
+
+`enqueue` inserts the row in transaction.on_commit, so a task is only
+queued for work that was committed and the worker can never pick it up
+before the data it needs is visible. Arguments must be JSON-serializable;
+pass ids, not model instances.
+
+`run_tasks` (the worker command) polls for due tasks. Claiming is one
+conditional UPDATE (status QUEUED -> RUNNING, stamped with the worker id),
+so several workers can share the table on any backend. A task that raises
+is retried after backoff * 2^(attempt-1) seconds (capped at
+TASK_MAX_BACKOFF) until max_attempts, then kept as FAILED with the
+traceback. Finished rows (DONE and FAILED) are purged after
+TASK_RETENTION_DAYS; the worker does this every TASK_PURGE_INTERVAL
+seconds, and `run_tasks --once` does it on each run. A task left RUNNING longer than TASK_LOCK_TIMEOUT (its worker
+died) is queued again. Tasks must therefore be idempotent.
+
+A task that may legitimately run longer calls heartbeat() between steps to
+renew its lock. The outcome is only recorded while the worker still holds
+the lock (locked_by), so a worker that was presumed dead and came back
+cannot overwrite the row another worker has since claimed.
+"""
+import logging
+import os
+import socket
+import traceback
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# (task id, worker) of the task executing in this context, for heartbeat()
+_running = ContextVar("running_task", default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(max_attempts=5, backoff=30):
+    """Make a function enqueueable: fn.enqueue(**kwargs) runs it in the worker; fn(...) still runs inline."""
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return fn(*args, **kwargs)
+
+        wrapper.task_name = f"{fn.__module__}.{fn.__qualname__}"
+        wrapper.max_attempts = max_attempts
+        wrapper.backoff = backoff
+        wrapper.enqueue = lambda delay=0, **kwargs: enqueue(wrapper, delay=delay, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def enqueue(fn, *, delay=0, **kwargs):
+    """Queue fn(**kwargs) to run `delay` seconds after the current transaction commits."""
+    def insert():
+        BackgroundTask.objects.create(
+            name=fn.task_name,
+            kwargs=kwargs,
+            max_attempts=fn.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    transaction.on_commit(insert)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale(now=None) -> int:
+    """Put back tasks whose worker died mid-run (RUNNING past TASK_LOCK_TIMEOUT)."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=_setting("TASK_LOCK_TIMEOUT", 600))
+    return BackgroundTask.objects.filter(status=BackgroundTask.Status.RUNNING, locked_at__lt=cutoff).update(
+        status=BackgroundTask.Status.QUEUED, locked_by="", locked_at=None, run_at=now,
+    )
+
+
+def claim(worker, limit=10, now=None) -> list:
+    """Take up to `limit` due tasks for `worker`; a task another worker claimed first is skipped."""
+    now = now or timezone.now()
+    due = list(
+        BackgroundTask.objects.filter(status=BackgroundTask.Status.QUEUED, run_at__lte=now)
+        .order_by("run_at", "id").values_list("id", flat=True)[:limit]
+    )
+    if not due:
+        return []
+    BackgroundTask.objects.filter(id__in=due, status=BackgroundTask.Status.QUEUED).update(
+        status=BackgroundTask.Status.RUNNING, locked_by=worker, locked_at=now,
+        attempts=F("attempts") + 1,
+    )
+    return list(
+        BackgroundTask.objects.filter(id__in=due, status=BackgroundTask.Status.RUNNING, locked_by=worker)
+        .order_by("run_at", "id")
+    )
+
+
+def retry_delay(backoff, attempts) -> int:
+    """Seconds before retry number `attempts`: backoff, 2x, 4x, ... capped at TASK_MAX_BACKOFF."""
+    return min(backoff * 2 ** (attempts - 1), _setting("TASK_MAX_BACKOFF", 3600))
+
+
+def heartbeat() -> bool:
+    """
+    Renew the running task's lock so requeue_stale leaves it alone.
+    False if the lock was lost (the task was requeued); True outside the worker.
+    """
+    running = _running.get()
+    if running is None:
+        return True
+    pk, worker = running
+    return bool(
+        BackgroundTask.objects.filter(pk=pk, status=BackgroundTask.Status.RUNNING, locked_by=worker)
+        .update(locked_at=timezone.now())
+    )
+
+
+def _finish(bg, **fields) -> bool:
+    """Record the outcome, but only if this worker still holds the task."""
+    held = BackgroundTask.objects.filter(pk=bg.pk, status=BackgroundTask.Status.RUNNING, locked_by=bg.locked_by)
+    if not held.update(locked_by="", locked_at=None, **fields):
+        logger.warning("Task %s (%s) was requeued while %s ran it; outcome dropped", bg.pk, bg.name, bg.locked_by)
+        return False
+    return True
+
+
+def execute(bg) -> bool:
+    """Run one claimed task and record the outcome; True if it succeeded."""
+    fn = None
+    token = _running.set((bg.pk, bg.locked_by))
+    try:
+        fn = import_string(bg.name)
+        fn(**bg.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if bg.attempts >= bg.max_attempts:
+            logger.error("Task %s (%s) failed for good after %d attempts", bg.pk, bg.name, bg.attempts)
+            fields = {"status": BackgroundTask.Status.FAILED, "finished_at": timezone.now()}
+        else:
+            delay = retry_delay(getattr(fn, "backoff", 30), bg.attempts)
+            fields = {"status": BackgroundTask.Status.QUEUED, "run_at": timezone.now() + timedelta(seconds=delay)}
+        _finish(bg, last_error=error, **fields)
+        return False
+    finally:
+        _running.reset(token)
+
+    _finish(bg, status=BackgroundTask.Status.DONE, finished_at=timezone.now())
+    return True
+
+
+def run_pending(worker=None, limit=None, batch=10) -> dict:
+    """Run due tasks until none are left (or `limit` ran); {"done": n, "failed": n}."""
+    worker = worker or worker_id()
+    requeue_stale()
+    counts = {"done": 0, "failed": 0}
+    while limit is None or sum(counts.values()) < limit:
+        claimed = claim(worker, batch if limit is None else min(batch, limit - sum(counts.values())))
+        if not claimed:
+            break
+        for bg in claimed:
+            counts["done" if execute(bg) else "failed"] += 1
+    return counts
+
+
+def purge_finished(older_than_days=None) -> int:
+    """Delete DONE and FAILED tasks that finished more than TASK_RETENTION_DAYS ago."""
+    days = older_than_days if older_than_days is not None else _setting("TASK_RETENTION_DAYS", 14)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = BackgroundTask.objects.filter(
+        status__in=[BackgroundTask.Status.DONE, BackgroundTask.Status.FAILED], finished_at__lt=cutoff
+    ).delete()
+    return deleted
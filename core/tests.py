@@ -0,0 +1,489 @@
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Sum
+from django.db.utils import load_backend
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from billing import aging, revenue
+from billing.models import (
+    DailyRevenueRollup, HMOAgingSummary, HMOClaimItem, HMOFollowUp, HMOReceivable, Invoice, InvoiceTotals,
+)
+from patients.models import Patient
+from patients.search import search_patients
+from visits.models import Visit
+
+from . import dbbench, profiling, replicas, sequences, synthetic, tasks
+from .dbprofile import database_settings, sqlite_options
+from .models import BackgroundTask, NumberSequence, ReplicaHeartbeat
+
+
+class SequenceTests(TestCase):
+    def test_allocate_is_consecutive(self):
+        first = sequences.allocate("test")
+        block = sequences.allocate("test", 5)
+        self.assertEqual(list(first), [1])
+        self.assertEqual(list(block), [2, 3, 4, 5, 6])
+        self.assertEqual(NumberSequence.objects.get(name="test").last_value, 6)
+
+    def test_allocation_is_one_statement(self):
+        sequences.allocate("test")
+        with self.assertNumQueries(1):
+            sequences.allocate("test", 100)
+
+    def test_rolled_back_insert_returns_its_number(self):
+        before = NumberSequence.objects.get(name=sequences.PATIENT).last_value
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+            raise IntegrityError
+        p = Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+        self.assertEqual(p.hospital_number, sequences.format_number(sequences.PATIENT, before + 1))
+
+    def test_patient_number_assigned_in_the_insert(self):
+        with self.assertNumQueries(2):  # counter + insert
+            p = Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+        self.assertRegex(p.hospital_number, r"^EDH-\d{6}$")
+
+    def test_allocate_numbers(self):
+        numbers = sequences.allocate_numbers(sequences.VISIT, 2)
+        self.assertEqual(len(set(numbers)), 2)
+        self.assertTrue(all(n.startswith("EDH-V-") for n in numbers))
+
+
+@override_settings(REQUEST_PROFILING=True)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        profiling.clear()
+        self.admin = get_user_model().objects.create_user(username="ops", password="x", role="admin")
+        self.client.force_login(self.admin)
+        for i in range(3):
+            Patient.objects.create(first_name=f"Ada{i}", last_name="Obi", gender="F", phone="080")
+
+    def test_records_request_and_sets_server_timing(self):
+        response = self.client.get(reverse("patients:patient_list"))
+
+        header = response["Server-Timing"]
+        self.assertRegex(header, r'sql;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn("tpl;dur=", header)
+        self.assertIn("total;dur=", header)
+
+        record = profiling.recent()[-1]
+        self.assertEqual(record["view"], "patients:patient_list")
+        self.assertEqual(record["status"], 200)
+        self.assertGreater(record["sql_count"], 0)
+        self.assertGreater(record["template_ms"], 0)
+        self.assertLessEqual(record["sql_ms"], record["total_ms"])
+        self.assertIn(f'desc="{record["sql_count"]} queries"', header)
+
+    def test_server_timing_is_for_admins_only(self):
+        self.client.logout()
+        self.assertNotIn("Server-Timing", self.client.get(reverse("accounts:login")))
+        clerk = get_user_model().objects.create_user(username="desk", password="x", role="frontdesk")
+        self.client.force_login(clerk)
+        response = self.client.get(reverse("patients:patient_list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(profiling.recent()[-1]["view"], "patients:patient_list")  # still recorded
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_off_unless_enabled(self):
+        self.client.get(reverse("patients:patient_list"))
+        self.assertEqual(profiling.recent(), [])
+
+    def test_report_ranks_endpoints_and_can_be_cleared(self):
+        self.client.get(reverse("patients:patient_list"))
+        for patient in Patient.objects.all():
+            self.client.get(reverse("patients:patient_detail", args=[patient.pk]))
+
+        endpoints = {e["view"]: e for e in profiling.slowest_endpoints()}
+        self.assertEqual(endpoints["patients:patient_detail"]["requests"], 3)
+        self.assertTrue(endpoints["patients:patient_list"]["worst_queries"])
+
+        response = self.client.get(reverse("core:profiling"))
+        self.assertContains(response, "patients:patient_detail")
+
+        self.client.post(reverse("core:profiling"))
+        # only the clearing request itself remains
+        self.assertEqual([r["view"] for r in profiling.recent()], ["core:profiling"])
+
+    def test_report_is_admin_only(self):
+        nurse = get_user_model().objects.create_user(username="nurse", password="x", role="nurse")
+        self.client.force_login(nurse)
+        self.assertEqual(self.client.get(reverse("core:profiling")).status_code, 403)
+
+
+class SyntheticDataTests(TestCase):
+    def ledgers(self):
+        return (
+            set(HMOAgingSummary.objects.filter(invoice_count__gt=0).values_list(
+                "hmo_name", "bucket", "total", "invoice_count",
+            )),
+            set(DailyRevenueRollup.objects.values_list("day", "method", "total", "payment_count")),
+            InvoiceTotals.objects.aggregate(Sum("outstanding"), Sum("hmo_billed")),
+        )
+
+    def test_interrupted_run_keeps_ledgers_consistent(self):
+        invoice = synthetic._Generator._invoice
+        calls = []
+
+        def interrupt(gen, *args):
+            calls.append(args)
+            if len(calls) > 20:  # well past the first chunk of 5 patients
+                raise KeyboardInterrupt
+            return invoice(gen, *args)
+
+        with mock.patch.object(synthetic._Generator, "_invoice", interrupt), self.assertRaises(KeyboardInterrupt):
+            synthetic.generate(40, visits_per_patient=2, days=120, chunk_size=5)
+
+        self.assertTrue(Invoice.objects.exists())
+        kept = self.ledgers()
+        aging.rebuild_summary()
+        revenue.backfill_rollups()
+        revenue.rebuild_totals()
+        self.assertEqual(self.ledgers(), kept)
+
+    def test_generated_rows_are_consistent_with_the_ledgers(self):
+        counts = synthetic.generate(40, visits_per_patient=2, days=120, chunk_size=15)
+
+        self.assertEqual(counts["patient"], 40)
+        self.assertEqual(Visit.objects.count(), counts["visit"])
+        self.assertEqual(Invoice.objects.count(), counts["invoice"])
+        self.assertEqual(HMOClaimItem.objects.count(), counts["hmoclaimitem"])
+        self.assertEqual(
+            NumberSequence.objects.get(name=sequences.PATIENT).last_value,
+            int(Patient.objects.order_by("-pk").first().hospital_number.split("-")[-1]),
+        )
+        self.assertTrue(search_patients(Patient.objects.first().last_name[:4]).exists())
+
+        receivables = set(HMOReceivable.objects.values_list("pk", "hmo_paid", "outstanding", "bucket"))
+        summary = set(HMOAgingSummary.objects.filter(invoice_count__gt=0).values_list(
+            "hmo_name", "bucket", "total", "invoice_count",
+        ))
+        rollups = set(DailyRevenueRollup.objects.values_list("day", "method", "total", "payment_count"))
+        aging.backfill_receivables()
+        aging.rebuild_summary()
+        revenue.backfill_rollups()
+        self.assertEqual(set(HMOReceivable.objects.values_list("pk", "hmo_paid", "outstanding", "bucket")), receivables)
+        self.assertEqual(set(HMOAgingSummary.objects.values_list("hmo_name", "bucket", "total", "invoice_count")), summary)
+        self.assertEqual(set(DailyRevenueRollup.objects.values_list("day", "method", "total", "payment_count")), rollups)
+
+        # ordinary inserts carry on after the explicit ids
+        p = Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+        self.assertGreater(p.pk, counts["patient"])
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.baseline = Path(tmp.name) / "baseline.json"
+
+    def test_saves_baseline_then_flags_regressions(self):
+        out = StringIO()
+        call_command(
+            "run_benchmarks", "--patients", "30", "--repeat", "1",
+            "--baseline", str(self.baseline), "--save-baseline", stdout=out,
+        )
+
+        saved = json.loads(self.baseline.read_text())
+        self.assertIn("billing.generate_invoice", saved["results"])
+        self.assertEqual(saved["meta"]["patients"], 30)
+        # the seeded dataset was rolled back
+        self.assertFalse(Patient.objects.exists())
+
+        # another machine's timings are not compared, only its query counts
+        saved["meta"]["host"] = "elsewhere"
+        saved["results"]["patients.search"]["median_ms"] = 0.001
+        self.baseline.write_text(json.dumps(saved))
+        out = StringIO()
+        call_command(
+            "run_benchmarks", "--patients", "30", "--repeat", "1", "--only", "patients.search",
+            "--baseline", str(self.baseline), stdout=out,
+        )
+        self.assertIn("comparing query counts only", out.getvalue())
+
+        saved["results"]["patients.search"]["queries"] = 0
+        self.baseline.write_text(json.dumps(saved))
+        with self.assertRaisesMessage(CommandError, "patients.search"):
+            call_command(
+                "run_benchmarks", "--patients", "30", "--repeat", "1", "--only", "patients.search",
+                "--baseline", str(self.baseline), stdout=StringIO(),
+            )
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_profile_is_the_default(self):
+        db = database_settings(Path("/srv/edh"), env={})["default"]
+        self.assertEqual(db["NAME"], Path("/srv/edh/db.sqlite3"))
+        self.assertEqual(db["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        self.assertIn("PRAGMA journal_mode=WAL", db["OPTIONS"]["init_command"])
+        self.assertEqual(db["CONN_MAX_AGE"], 600)
+
+    def test_server_profiles(self):
+        env = {"DB_ENGINE": "postgresql", "DB_NAME": "edh", "DB_HOST": "db", "DB_CONN_MAX_AGE": "persistent"}
+        db = database_settings(Path("."), env=env)["default"]
+        self.assertEqual(db["ENGINE"], "django.db.backends.postgresql")
+        self.assertIsNone(db["CONN_MAX_AGE"])
+
+        pooled = database_settings(Path("."), env={**env, "DB_POOL_MAX_SIZE": "20"})["default"]
+        self.assertEqual(pooled["OPTIONS"]["pool"]["max_size"], 20)
+        self.assertEqual(pooled["CONN_MAX_AGE"], 0)
+
+        with self.assertRaises(ValueError):
+            database_settings(Path("."), env={"DB_ENGINE": "oracle"})
+
+    def test_replica_alias_from_env(self):
+        dbs = database_settings(Path("/srv/edh"), env={"DB_REPLICA_NAME": "/srv/edh/replica.sqlite3"})
+        self.assertEqual(dbs["replica"]["NAME"], "/srv/edh/replica.sqlite3")
+        self.assertEqual(dbs["replica"]["TEST"], {"MIRROR": "default"})
+        self.assertEqual(dbs["replica"]["OPTIONS"], dbs["default"]["OPTIONS"])
+        self.assertNotIn("replica", database_settings(Path("."), env={}))
+
+    def test_sqlite_connections_get_the_pragmas(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cfg = {
+            **connections.settings["default"], "NAME": str(Path(tmp.name) / "check.sqlite3"),
+            "OPTIONS": sqlite_options(env={"DB_BUSY_TIMEOUT": "7"}),
+        }
+        conn = load_backend(cfg["ENGINE"]).DatabaseWrapper(cfg, "pragma_check")
+        try:
+            with conn.cursor() as cur:
+                values = []
+                for pragma in ("journal_mode", "synchronous", "busy_timeout", "temp_store"):
+                    cur.execute(f"PRAGMA {pragma}")
+                    values.append(cur.fetchone()[0])
+        finally:
+            conn.close()
+        self.assertEqual(values, ["wal", 1, 7000, 2])
+
+    def test_concurrency_benchmark_commits_every_write_when_tuned(self):
+        result = dbbench.run("tuned", workers=4, transactions=25)
+        self.assertEqual((result.committed, result.failed), (100, 0))
+        self.assertGreater(result.writes_per_second, 0)
+
+
+@replicas.read_only_replica
+def _count_patients(request):
+    return HttpResponse(str(Patient.objects.count()))
+
+
+@replicas.read_only_replica
+def _stream_patients(request):
+    return StreamingHttpResponse(str(p.pk) for p in Patient.objects.all())
+
+
+@override_settings(DATABASE_REPLICA_CHECK_INTERVAL=0, DATABASE_REPLICA_MAX_LAG=30)
+class ReadReplicaTests(TransactionTestCase):
+    """The primary is the test database; the replica a second SQLite file synced by the stand-in."""
+
+    @classmethod
+    def setUpClass(cls):
+        # registered here rather than in settings so the runner doesn't try to create it
+        cls._tmp = tempfile.TemporaryDirectory()
+        connections.settings[replicas.REPLICA] = {
+            **connections.settings["default"], "NAME": str(Path(cls._tmp.name) / "replica.sqlite3"),
+        }
+        cls.databases = {"default", replicas.REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[replicas.REPLICA].close()
+        del connections[replicas.REPLICA]
+        del connections.settings[replicas.REPLICA]
+        cls._tmp.cleanup()
+        replicas.reset_health()
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+        replicas.sync_sqlite()
+        # a write the replica hasn't seen yet
+        Patient.objects.create(first_name="Chi", last_name="Eze", gender="M", phone="081")
+
+    def test_stand_in_copies_the_primary(self):
+        self.assertEqual(Patient.objects.using(replicas.REPLICA).count(), 1)
+        replicas.sync_sqlite()
+        self.assertEqual(Patient.objects.using(replicas.REPLICA).count(), 2)
+        self.assertLess(replicas.replica_lag(), 5)
+
+    def test_marked_views_read_the_replica(self):
+        self.assertEqual(_count_patients(self.factory.get("/")).content, b"1")
+        self.assertEqual(Patient.objects.count(), 2)  # unmarked reads stay on the primary
+
+    def test_streaming_body_is_read_on_the_replica(self):
+        first = Patient.objects.order_by("pk").first()
+        response = _stream_patients(self.factory.get("/"))
+        self.assertEqual(b"".join(response.streaming_content), str(first.pk).encode())
+
+    def test_writes_and_unsafe_methods_use_the_primary(self):
+        self.assertEqual(_count_patients(self.factory.post("/")).content, b"2")
+        self.assertEqual(replicas.ReplicaRouter().db_for_write(Patient), "default")
+
+    def test_stale_replica_falls_back_to_the_primary(self):
+        ReplicaHeartbeat.objects.using(replicas.REPLICA).update(beat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(_count_patients(self.factory.get("/")).content, b"2")
+        with self.settings(DATABASE_REPLICA_MAX_LAG=None):
+            self.assertEqual(_count_patients(self.factory.get("/")).content, b"1")
+
+    def test_snapshot_read_on_the_replica_is_not_cached(self):
+        cache.clear()
+        admin = get_user_model().objects.create_user(username="boss", password="x", role="admin")
+        self.client.force_login(admin)
+        replicas.sync_sqlite()
+        self.client.get(reverse("billing:dashboard"))
+        self.assertIsNone(cache.get(revenue.SNAPSHOT_CACHE_KEY.format(day=timezone.localdate())))
+
+        ReplicaHeartbeat.objects.using(replicas.REPLICA).update(beat_at=timezone.now() - timedelta(minutes=5))
+        replicas.reset_health()
+        self.client.get(reverse("billing:dashboard"))  # fell back to the primary
+        self.assertIsNotNone(cache.get(revenue.SNAPSHOT_CACHE_KEY.format(day=timezone.localdate())))
+
+    def test_reporting_views_are_routed(self):
+        admin = get_user_model().objects.create_user(username="boss", password="x", role="admin")
+        replicas.sync_sqlite()
+        HMOFollowUp.objects.create(
+            hmo_name="Hygeia", period_start=timezone.localdate(), period_end=timezone.localdate(),
+            next_follow_up_at=timezone.localdate(),
+        )
+        self.client.force_login(admin)
+        self.assertEqual(len(self.client.get(reverse("billing:followups_list")).context["followups"]), 0)
+        replicas.sync_sqlite()
+        self.assertEqual(len(self.client.get(reverse("billing:followups_list")).context["followups"]), 1)
+
+
+CALLS = []
+
+
+@tasks.task(max_attempts=3, backoff=10)
+def flaky_task(label, failures=0):
+    CALLS.append(label)
+    if CALLS.count(label) <= failures:
+        raise RuntimeError(f"{label} failed")
+
+
+@tasks.task(max_attempts=3, backoff=10)
+def outlived_task(label):
+    """Runs past its lock: requeue_stale hands it to another worker mid-run."""
+    CALLS.append((label, tasks.heartbeat()))
+    BackgroundTask.objects.filter(name="core.tests.outlived_task").update(locked_by="w2")
+    CALLS.append((label, tasks.heartbeat()))
+
+
+class BackgroundTaskTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def enqueue(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            flaky_task.enqueue(**kwargs)
+        return BackgroundTask.objects.latest("id")
+
+    def test_enqueue_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            flaky_task.enqueue(label="a")
+            self.assertFalse(BackgroundTask.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+    def test_run_pending_runs_due_tasks_once(self):
+        bg = self.enqueue(label="a")
+        self.assertEqual(bg.name, "core.tests.flaky_task")
+        self.assertEqual(tasks.run_pending(), {"done": 1, "failed": 0})
+        self.assertEqual(tasks.run_pending(), {"done": 0, "failed": 0})
+        bg.refresh_from_db()
+        self.assertEqual((bg.status, bg.attempts, bg.locked_by), (BackgroundTask.Status.DONE, 1, ""))
+        self.assertEqual(CALLS, ["a"])
+
+    def test_failure_backs_off_exponentially_then_gives_up(self):
+        bg = self.enqueue(label="b", failures=5)
+        delays = []
+        for _ in range(3):
+            before = timezone.now()
+            BackgroundTask.objects.filter(pk=bg.pk).update(run_at=before)
+            self.assertEqual(tasks.run_pending(), {"done": 0, "failed": 1})
+            bg.refresh_from_db()
+            delays.append(round((bg.run_at - before).total_seconds()))
+        self.assertEqual(bg.status, BackgroundTask.Status.FAILED)
+        self.assertEqual(bg.attempts, 3)
+        self.assertIn("RuntimeError: b failed", bg.last_error)
+        self.assertEqual(delays[:2], [10, 20])  # the last attempt is not rescheduled
+
+    def test_retry_succeeds_before_max_attempts(self):
+        bg = self.enqueue(label="c", failures=1)
+        tasks.run_pending()
+        BackgroundTask.objects.filter(pk=bg.pk).update(run_at=timezone.now())
+        self.assertEqual(tasks.run_pending(), {"done": 1, "failed": 0})
+        bg.refresh_from_db()
+        self.assertEqual((bg.status, bg.attempts), (BackgroundTask.Status.DONE, 2))
+
+    def test_claimed_task_is_not_claimed_twice(self):
+        self.enqueue(label="d")
+        self.assertEqual(len(tasks.claim("w1")), 1)
+        self.assertEqual(tasks.claim("w2"), [])
+
+    def test_stale_running_task_is_requeued(self):
+        bg = self.enqueue(label="e")
+        tasks.claim("dead-worker")
+        BackgroundTask.objects.filter(pk=bg.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.run_pending(worker="w2"), {"done": 1, "failed": 0})
+        self.assertEqual(CALLS, ["e"])
+
+    def test_requeued_task_does_not_overwrite_the_new_owner(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            outlived_task.enqueue(label="g")
+        self.assertEqual(tasks.run_pending(worker="w1"), {"done": 1, "failed": 0})
+        self.assertEqual(CALLS, [("g", True), ("g", False)])
+        bg = BackgroundTask.objects.get(name="core.tests.outlived_task")
+        self.assertEqual((bg.status, bg.locked_by), (BackgroundTask.Status.RUNNING, "w2"))
+
+    def test_heartbeat_renews_the_lock(self):
+        bg = self.enqueue(label="h")
+        [claimed] = tasks.claim("w1")
+        BackgroundTask.objects.filter(pk=bg.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        token = tasks._running.set((claimed.pk, "w1"))
+        try:
+            self.assertTrue(tasks.heartbeat())
+        finally:
+            tasks._running.reset(token)
+        self.assertEqual(tasks.requeue_stale(), 0)
+        self.assertTrue(tasks.heartbeat())  # outside the worker: nothing to renew
+        bg.refresh_from_db()
+        self.assertEqual(bg.status, BackgroundTask.Status.RUNNING)
+
+    def test_run_tasks_once_command(self):
+        self.enqueue(label="f")
+        out = StringIO()
+        call_command("run_tasks", "--once", stdout=out)
+        self.assertIn("1 done, 0 failed", out.getvalue())
+
+    def test_purge_removes_old_done_and_failed_tasks(self):
+        old = timezone.now() - timedelta(days=30)
+        done, failed, fresh, queued = (self.enqueue(label=x) for x in "wxyz")
+        BackgroundTask.objects.filter(pk__in=[done.pk, failed.pk, fresh.pk]).update(
+            status=BackgroundTask.Status.DONE, finished_at=old
+        )
+        BackgroundTask.objects.filter(pk=failed.pk).update(status=BackgroundTask.Status.FAILED)
+        BackgroundTask.objects.filter(pk=fresh.pk).update(finished_at=timezone.now())
+        self.assertEqual(tasks.purge_finished(), 2)
+        self.assertEqual(set(BackgroundTask.objects.values_list("pk", flat=True)), {fresh.pk, queued.pk})
+
+    @override_settings(TASK_PURGE_INTERVAL=0)
+    def test_worker_loop_purges_periodically(self):
+        # The long-running worker must purge too, not only `--once`.
+        with mock.patch.object(tasks, "purge_finished", return_value=0) as purge, \
+                mock.patch("core.management.commands.run_tasks.time.sleep", side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("run_tasks", stdout=StringIO())
+        self.assertEqual(purge.call_count, 2)
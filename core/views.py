@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect, render
+
+from accounts.utils import require_roles
+
+from . import profiling
+
+
+@login_required
+def profiling_report(request):
+    """Slowest endpoints and their worst queries from this process's profiling buffer."""
+    require_roles(request.user, roles={"admin"})
+    if request.method == "POST":
+        profiling.clear()
+        return redirect("core:profiling")
+
+    return render(request, "core/profiling.html", {
+        "endpoints": profiling.slowest_endpoints(),
+        "recent": profiling.recent()[-50:][::-1],
+        "enabled": settings.REQUEST_PROFILING,
+    })
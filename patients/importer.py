@@ -0,0 +1,364 @@
+"""
+Bulk patient registration from a CSV or Excel (.xlsx) file.
+
+An HMO enrollee list or a legacy register is imported in three steps per
+chunk of rows, so memory and query counts stay flat however long the file is:
+
+1. read     - rows are streamed from the file (CSV line by line, .xlsx
+              sheet XML incrementally; no spreadsheet library needed) and
+              matched to columns by header name, with common aliases
+              (surname, sex, dob, enrollee_id, ...);
+2. validate - each row is normalized (names trimmed, gender folded to M/F,
+              dates in ISO, dd/mm/yyyy or Excel serial form, numeric phones
+              given their leading 0 back) and checked against the Patient
+              field limits; a bad row is reported with its line number and
+              never stops the rest;
+3. dedupe   - a row is dropped as a duplicate when its (phone, last name,
+              first name) key or its (HMO, HMO ID number) pair is already in
+              the database or earlier in the file. Seen keys are kept in
+              hash sets; the database is asked once per chunk and key kind,
+              on the phone_key and patient_hmo_member_idx indexes.
+              Phone alone is not a duplicate: families share a phone.
+
+The surviving rows of a chunk are inserted with one bulk_create, numbered
+from a block reserved with sequences.allocate_numbers, in the chunk's own
+transaction. A failure part-way therefore keeps the chunks already
+committed; re-running the same file skips them as duplicates.
+
+No portal accounts are created here: patient_create invites patients one at
+a time, and a bulk import should not mail a whole enrollee list.
+"""
+import codecs
+import csv
+import re
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from itertools import islice
+from xml.etree.ElementTree import iterparse, parse
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from core import sequences
+from hmo.models import HMO
+
+from .models import Patient
+from .search import phone_key
+
+CHUNK_SIZE = 1000
+
+# header (normalized) -> Patient field
+COLUMNS = {
+    "first_name": "first_name", "firstname": "first_name", "given_name": "first_name",
+    "last_name": "last_name", "lastname": "last_name", "surname": "last_name",
+    "other_names": "other_names", "middle_name": "other_names",
+    "gender": "gender", "sex": "gender",
+    "date_of_birth": "date_of_birth", "dob": "date_of_birth", "birth_date": "date_of_birth",
+    "phone": "phone", "phone_number": "phone", "mobile": "phone", "telephone": "phone",
+    "email": "email", "email_address": "email",
+    "address": "address",
+    "hmo": "hmo", "hmo_name": "hmo",
+    "hmo_id_number": "hmo_id_number", "hmo_id": "hmo_id_number", "enrollee_id": "hmo_id_number",
+    "member_id": "hmo_id_number",
+    "next_of_kin_name": "next_of_kin_name", "next_of_kin": "next_of_kin_name",
+    "next_of_kin_phone": "next_of_kin_phone",
+    "blood_group": "blood_group",
+    "allergies": "allergies",
+}
+REQUIRED = ("first_name", "last_name", "phone", "gender")
+TEXT_FIELDS = (
+    "first_name", "last_name", "other_names", "phone", "email", "address",
+    "hmo_id_number", "next_of_kin_name", "next_of_kin_phone", "allergies",
+)
+GENDERS = {"m": "M", "male": "M", "f": "F", "female": "F"}
+BLOOD_GROUPS = {"A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"}
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+EXCEL_EPOCH = date(1899, 12, 30)
+
+_MAX_LENGTH = {
+    f.name: f.max_length for f in Patient._meta.concrete_fields if f.max_length and f.name in TEXT_FIELDS
+}
+_HEADER_RE = re.compile(r"[^a-z0-9]+")
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+class ImportFileError(ValueError):
+    """The uploaded file can't be read as a patient list (format, encoding, headers)."""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    duplicates: list = field(default_factory=list)  # (line, reason)
+    errors: list = field(default_factory=list)      # (line, [messages])
+    dry_run: bool = False
+
+
+# ------------------------------------------------------------------
+# Reading
+# ------------------------------------------------------------------
+def _header(value) -> str:
+    return _HEADER_RE.sub("_", str(value or "").strip().lower()).strip("_")
+
+
+def _csv_rows(fileobj):
+    try:
+        yield from csv.reader(codecs.iterdecode(fileobj, "utf-8-sig"))
+    except UnicodeDecodeError:
+        raise ImportFileError("CSV files must be UTF-8 encoded.")
+
+
+def _column_index(ref) -> int:
+    """'C12' -> 2"""
+    index = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        index = index * 26 + ord(ch.upper()) - 64
+    return index - 1
+
+
+def _shared_strings(zf):
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    with zf.open("xl/sharedStrings.xml") as fh:
+        return ["".join(t.text or "" for t in si.iter(f"{_SHEET_NS}t")) for si in parse(fh).getroot()]
+
+
+def _first_sheet(zf) -> str:
+    with zf.open("xl/workbook.xml") as fh:
+        sheet = parse(fh).getroot().find(f"{_SHEET_NS}sheets/{_SHEET_NS}sheet")
+    with zf.open("xl/_rels/workbook.xml.rels") as fh:
+        targets = {rel.get("Id"): rel.get("Target") for rel in parse(fh).getroot().iter(f"{_PKG_REL_NS}Relationship")}
+    target = targets[sheet.get(f"{_REL_NS}id")]
+    return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+
+def _cell(c, strings) -> str:
+    kind = c.get("t")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in c.iter(f"{_SHEET_NS}t"))
+    value = c.findtext(f"{_SHEET_NS}v") or ""
+    if kind == "s":
+        return strings[int(value)]
+    if kind in (None, "n") and value.endswith(".0"):
+        return value[:-2]  # whole numbers (phones, serial dates) come back as floats
+    return value
+
+
+def _xlsx_rows(fileobj):
+    try:
+        zf = zipfile.ZipFile(fileobj)
+        strings = _shared_strings(zf)
+        sheet = zf.open(_first_sheet(zf))
+    except (zipfile.BadZipFile, KeyError, AttributeError):
+        raise ImportFileError("Not a readable .xlsx workbook.")
+
+    with sheet:
+        for _, row in iterparse(sheet):
+            if row.tag != f"{_SHEET_NS}row":
+                continue
+            values = []
+            for c in row.iter(f"{_SHEET_NS}c"):
+                index = _column_index(c.get("r") or "") if c.get("r") else len(values)
+                values.extend([""] * (index - len(values)))
+                values.append(_cell(c, strings))
+            row.clear()  # keep memory flat on large sheets
+            yield values
+
+
+def read_rows(fileobj, filename=""):
+    """Yield (line number, {field: raw text}) from a CSV or .xlsx file, header row first in the file."""
+    if filename.lower().endswith(".xlsx"):
+        rows = _xlsx_rows(fileobj)
+    elif filename.lower().endswith((".csv", ".txt")) or not filename:
+        rows = _csv_rows(fileobj)
+    else:
+        raise ImportFileError("Upload a .csv or .xlsx file.")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    fields = [COLUMNS.get(_header(name)) for name in header]
+    missing = [name for name in REQUIRED if name not in fields]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}.")
+
+    for line_no, values in enumerate(rows, start=2):
+        row = {}
+        for name, value in zip(fields, values):
+            if name and not row.get(name):
+                row[name] = str(value).strip()
+        if any(row.values()):
+            yield line_no, row
+
+
+# ------------------------------------------------------------------
+# Validation
+# ------------------------------------------------------------------
+def _date(raw):
+    if raw.isdigit() and 1 <= int(raw) < 2958466:
+        return EXCEL_EPOCH + timedelta(days=int(raw))
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def _phone(raw) -> str:
+    # numeric spreadsheet cells lose the leading 0 of local numbers
+    if raw.isdigit() and len(raw) == 10 and raw[0] in "789":
+        return "0" + raw
+    return raw
+
+
+def validate_row(row, hmos, default_hmo=None):
+    """(unsaved Patient, None) for a good row, else (None, [messages])."""
+    errors = []
+    values = {name: row.get(name, "") for name in TEXT_FIELDS}
+    values["phone"] = _phone(values["phone"])
+    values["next_of_kin_phone"] = _phone(values["next_of_kin_phone"])
+
+    for name in REQUIRED:
+        if not row.get(name):
+            errors.append(f"{name} is required.")
+    for name, limit in _MAX_LENGTH.items():
+        if len(values[name]) > limit:
+            errors.append(f"{name} is longer than {limit} characters.")
+
+    if values["phone"] and not phone_key(values["phone"]):
+        errors.append(f"phone '{values['phone']}' has no digits.")
+
+    gender = GENDERS.get(row.get("gender", "").lower())
+    if row.get("gender") and gender is None:
+        errors.append(f"gender '{row['gender']}' is not M or F.")
+
+    date_of_birth = None
+    if row.get("date_of_birth"):
+        try:
+            date_of_birth = _date(row["date_of_birth"])
+        except ValueError:
+            errors.append(f"date_of_birth '{row['date_of_birth']}' is not a date.")
+        else:
+            if date_of_birth > timezone.localdate():
+                errors.append("date_of_birth is in the future.")
+
+    if values["email"]:
+        try:
+            validate_email(values["email"])
+        except ValidationError:
+            errors.append(f"email '{values['email']}' is not valid.")
+
+    blood_group = row.get("blood_group", "").upper().replace(" ", "")
+    if blood_group and blood_group not in BLOOD_GROUPS:
+        errors.append(f"blood_group '{row['blood_group']}' is not recognised.")
+
+    hmo = default_hmo
+    if row.get("hmo"):
+        hmo = hmos.get(row["hmo"].strip().lower())
+        if hmo is None:
+            errors.append(f"HMO '{row['hmo']}' is not registered.")
+    elif values["hmo_id_number"] and hmo is None:
+        errors.append("hmo_id_number given without an HMO.")
+
+    if errors:
+        return None, errors
+
+    patient = Patient(
+        **values, gender=gender, date_of_birth=date_of_birth, blood_group=blood_group,
+        hmo=hmo, is_hmo=hmo is not None,
+    )
+    patient.fill_search_keys()
+    return patient, None
+
+
+# ------------------------------------------------------------------
+# Import
+# ------------------------------------------------------------------
+def _person_key(patient):
+    return patient.phone_key, patient.last_name_key, patient.first_name_key
+
+
+def _member_key(patient):
+    return (patient.hmo_id, patient.hmo_id_number) if patient.hmo_id and patient.hmo_id_number else None
+
+
+def _known_keys(patients):
+    """(person keys, member keys) among `patients` already in the database: one query per kind."""
+    phones = {p.phone_key for p in patients}
+    people = set(
+        Patient.objects.filter(phone_key__in=phones).values_list("phone_key", "last_name_key", "first_name_key")
+    )
+    members = {_member_key(p) for p in patients} - {None}
+    known_members = set()
+    if members:
+        known_members = set(
+            Patient.objects.filter(
+                hmo_id__in={hmo_id for hmo_id, _ in members},
+                hmo_id_number__in={number for _, number in members},
+            ).values_list("hmo_id", "hmo_id_number")
+        ) & members
+    return people, known_members
+
+
+def _import_chunk(chunk, result, hmos, default_hmo, seen_people, seen_members):
+    valid = []
+    for line_no, row in chunk:
+        patient, errors = validate_row(row, hmos, default_hmo)
+        if errors:
+            result.errors.append((line_no, errors))
+        else:
+            valid.append((line_no, patient))
+    if not valid:
+        return
+
+    known_people, known_members = _known_keys([p for _, p in valid])
+    new = []
+    for line_no, patient in valid:
+        person, member = _person_key(patient), _member_key(patient)
+        if member and (member in known_members or member in seen_members):
+            result.duplicates.append((line_no, f"HMO ID {patient.hmo_id_number} is already registered."))
+            continue
+        if person in known_people or person in seen_people:
+            result.duplicates.append((line_no, f"{patient.last_name} {patient.first_name} ({patient.phone}) "
+                                               "is already registered."))
+            continue
+        seen_people.add(person)
+        if member:
+            seen_members.add(member)
+        new.append(patient)
+
+    if new and not result.dry_run:
+        with transaction.atomic():
+            numbers = sequences.allocate_numbers(sequences.PATIENT, len(new))
+            for patient, number in zip(new, numbers):
+                patient.hospital_number = number
+            Patient.objects.bulk_create(new, batch_size=500)
+    result.created += len(new)
+
+
+def import_patients(rows, *, hmo=None, chunk_size=CHUNK_SIZE, dry_run=False) -> ImportResult:
+    """
+    Register the patients in `rows` ((line, {field: text}) pairs from read_rows).
+
+    `hmo` is the HMO for rows without an hmo column (an enrollee list).
+    dry_run validates and de-duplicates without inserting; `created` is then
+    the number that would be created.
+    """
+    result = ImportResult(dry_run=dry_run)
+    hmos = {h.name.strip().lower(): h for h in HMO.objects.all()}
+    seen_people, seen_members = set(), set()
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        result.rows += len(chunk)
+        _import_chunk(chunk, result, hmos, hmo, seen_people, seen_members)
+    return result
@@ -0,0 +1,52 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hmo.models import HMO
+from patients.importer import CHUNK_SIZE, ImportFileError, import_patients, read_rows
+
+
+class Command(BaseCommand):
+    help = "Register patients in bulk from a CSV or .xlsx file (an HMO enrollee list or a legacy register)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or .xlsx file with a header row")
+        parser.add_argument("--hmo", help="HMO name for rows without an hmo column")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows validated and inserted together")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and de-duplicate only")
+        parser.add_argument("--errors", help="Write rejected rows (line, reason) to this CSV")
+
+    def handle(self, *args, **options):
+        hmo = None
+        if options["hmo"]:
+            hmo = HMO.objects.filter(name__iexact=options["hmo"].strip()).first()
+            if hmo is None:
+                raise CommandError(f"HMO '{options['hmo']}' is not registered.")
+
+        t0 = time.perf_counter()
+        try:
+            with open(options["path"], "rb") as fh:
+                result = import_patients(
+                    read_rows(fh, options["path"]), hmo=hmo,
+                    chunk_size=options["chunk_size"], dry_run=options["dry_run"],
+                )
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(str(exc))
+        seconds = time.perf_counter() - t0
+
+        if options["errors"]:
+            with open(options["errors"], "w", newline="") as fh:
+                writer = csv.writer(fh)
+                writer.writerow(["line", "kind", "reason"])
+                writer.writerows((line, "error", "; ".join(msgs)) for line, msgs in result.errors)
+                writer.writerows((line, "duplicate", reason) for line, reason in result.duplicates)
+        else:
+            for line, msgs in result.errors[:20]:
+                self.stderr.write(f"Line {line}: {'; '.join(msgs)}")
+
+        verb = "would be created" if result.dry_run else "created"
+        self.stdout.write(
+            f"{result.rows} row(s) in {seconds:.1f}s: {result.created} patient(s) {verb}, "
+            f"{len(result.duplicates)} duplicate(s), {len(result.errors)} error(s)"
+        )
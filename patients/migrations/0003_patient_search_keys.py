@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-17 20:40
+
+from django.conf import settings
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _name_key(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    return "".join(ch for ch in value.lower() if ch.isalnum() and not unicodedata.combining(ch))
+
+
+def _phone_key(value):
+    digits = re.sub(r"\D", "", value or "")
+    if digits.startswith("234"):  # local numbers always start with 0
+        digits = "0" + digits[3:]
+    return digits
+
+
+def fill_search_keys(apps, schema_editor):
+    Patient = apps.get_model("patients", "Patient")
+    batch = []
+    for p in Patient.objects.only("id", "first_name", "last_name", "phone").iterator(chunk_size=2000):
+        p.last_name_key = _name_key(p.last_name)[:60]
+        p.first_name_key = _name_key(p.first_name)[:60]
+        p.phone_key = _phone_key(p.phone)[:30]
+        batch.append(p)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ["last_name_key", "first_name_key", "phone_key"])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ["last_name_key", "first_name_key", "phone_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hmo', '0001_initial'),
+        ('patients', '0002_alter_patient_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='first_name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=60),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='last_name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=60),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at'], name='patient_created_idx'),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 21:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_patient_search_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['hmo', 'hmo_id_number'], name='patient_hmo_member_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from core import sequences
 from hmo.models import HMO
 
 class Patient(models.Model):
@@ -37,6 +38,34 @@ class Patient(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Normalized search keys (see patients.search); maintained in save()
+    last_name_key = models.CharField(max_length=60, blank=True, editable=False, db_index=True)
+    first_name_key = models.CharField(max_length=60, blank=True, editable=False, db_index=True)
+    phone_key = models.CharField(max_length=30, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            # default patient list, newest registrations first
+            models.Index(fields=["-created_at"], name="patient_created_idx"),
+            # enrollee lookup by HMO membership number (patients.importer dedupe)
+            models.Index(fields=["hmo", "hmo_id_number"], name="patient_hmo_member_idx"),
+        ]
+
+    def fill_search_keys(self):
+        from .search import name_key, phone_key
+        self.last_name_key = name_key(self.last_name)[:60]
+        self.first_name_key = name_key(self.first_name)[:60]
+        self.phone_key = phone_key(self.phone)[:30]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.hospital_number:
+            self.hospital_number = sequences.next_number(sequences.PATIENT)
+        self.fill_search_keys()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"first_name", "last_name", "phone"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"last_name_key", "first_name_key", "phone_key"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.hospital_number} - {self.last_name} {self.first_name}"
 
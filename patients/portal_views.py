@@ -3,17 +3,19 @@ from django.shortcuts import render, get_object_or_404
 from .models import Patient
 from visits.models import Visit
 from .portal_utils import patient_only
+from .record import visit_page
 
 @login_required
 def patient_dashboard(request):
     patient_only(request.user)
 
     patient = get_object_or_404(Patient, user=request.user)
-    visits = patient.visits.select_related("doctor").order_by("-created_at")
+    visits, next_cursor = visit_page(patient, request.GET.get("before"))
 
     return render(request, "patients/portal/dashboard.html", {
         "patient": patient,
         "visits": visits,
+        "next_cursor": next_cursor,
     })
 
 
@@ -0,0 +1,101 @@
+"""
+Longitudinal patient record.
+
+Visit history is read a page at a time, newest first, keyset-paged on
+(created_at, id) so the Nth page costs the same as the first and walks the
+(patient, -created_at) index. Each page is a fixed two queries whatever
+its length: visits with doctor and invoice joined in, then prescriptions
+with their drugs in one prefetch. Vitals live on the visit row itself.
+
+The vitals trend is one grouped query over the patient's vital
+observations (visits.vitals), pivoted into per-period averages, so the
+record stays small for patients with years of visits.
+"""
+from django.db.models import Prefetch, Q
+
+from pharmacy.models import PrescriptionItem
+from visits.models import Visit
+from visits import vitals
+from visits.queue import decode_cursor, encode_cursor
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+TREND_PERIODS = ("day", "week", "month")
+VITALS = ["bp_systolic", "bp_diastolic", "pulse_bpm", "temperature_c", "spo2", "weight_kg", "resp_rate"]
+
+
+def _visits(patient):
+    return (
+        Visit.objects.filter(patient=patient)
+        .select_related("doctor", "invoice")
+        .prefetch_related(Prefetch(
+            "prescriptions",
+            queryset=PrescriptionItem.objects.select_related("drug").order_by("id"),
+        ))
+        .order_by("-created_at", "-id")
+    )
+
+
+def visit_page(patient, before=None, limit=PAGE_SIZE):
+    """(visits, next cursor or None): `limit` visits older than the `before` cursor."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    qs = _visits(patient)
+    position = decode_cursor(before)
+    if position is not None:
+        created_at, pk = position
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    visits = list(qs[:limit + 1])
+    more = len(visits) > limit
+    visits = visits[:limit]
+    next_cursor = encode_cursor(visits[-1].created_at, visits[-1].pk) if more else None
+    return visits, next_cursor
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def visit_summary(visit) -> dict:
+    """JSON-ready summary of a visit from visit_page (touches no further queries)."""
+    invoice = getattr(visit, "invoice", None)
+    return {
+        "id": visit.pk,
+        "visit_number": visit.visit_number,
+        "created_at": visit.created_at.isoformat(),
+        "visit_type": visit.visit_type,
+        "status": visit.status,
+        "doctor": str(visit.doctor) if visit.doctor else None,
+        "chief_complaint": visit.chief_complaint,
+        "diagnosis": visit.diagnosis_primary,
+        "vitals": {name: _number(getattr(visit, name)) for name in VITALS} if visit.has_vitals() else None,
+        "invoice": {
+            "invoice_number": invoice.invoice_number,
+            "status": invoice.status,
+            "total": _number(invoice.total_amount),
+            "balance": _number(invoice.balance),
+            "hmo_state": invoice.hmo_state,
+        } if invoice else None,
+        "prescriptions": [
+            {
+                "drug": str(rx.drug),
+                "dose": rx.dose,
+                "frequency": rx.frequency,
+                "duration": rx.duration,
+                "status": rx.status,
+            }
+            for rx in visit.prescriptions.all()
+        ],
+    }
+
+
+def vitals_trend(patient, period="month"):
+    """[{period, readings, <vital>: average}] oldest first over every charted observation."""
+    series = vitals.trend(patient, kinds=VITALS, interval=period if period in TREND_PERIODS else "month")["series"]
+    rows = {}
+    for kind, points in series.items():
+        for point in points:
+            row = rows.setdefault(point["t"], dict.fromkeys(VITALS, None) | {"readings": 0})
+            row[kind] = round(point["avg"], 1)
+            row["readings"] += point["n"]
+    return [{"period": t[:10], **rows[t]} for t in sorted(rows)]
@@ -0,0 +1,94 @@
+"""
+Front-desk patient search.
+
+Patient keeps normalized, indexed copies of its names and phone
+(last_name_key / first_name_key / phone_key, filled in Patient.save), so
+every lookup here is an exact match or a prefix range scan on an index
+instead of LIKE '%q%' over the whole table:
+
+- "EDH-000123" (or bare "123")  -> exact hospital number
+- phone digits (+234 / 0 forms)  -> phone_key prefix
+- name tokens                    -> last/first name key prefixes, ranked
+                                    exact > prefix, last name before first
+"""
+import re
+import unicodedata
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Patient
+
+HOSPITAL_NUMBER_RE = re.compile(r"^EDH-?(\d+)$", re.IGNORECASE)
+TYPEAHEAD_LIMIT = 10
+
+
+def name_key(value) -> str:
+    """'Ọ̀kafor-Obi ' -> 'okaforobi': accents stripped, lowercase letters/digits only."""
+    value = unicodedata.normalize("NFKD", value or "")
+    return "".join(ch for ch in value.lower() if ch.isalnum() and not unicodedata.combining(ch))
+
+
+def phone_key(value) -> str:
+    """Digits only, +234/234 international prefix folded to the local leading 0."""
+    digits = re.sub(r"\D", "", value or "")
+    if digits.startswith("234"):  # local numbers always start with 0
+        digits = "0" + digits[3:]
+    return digits
+
+
+def _prefix(field, prefix) -> Q:
+    """field starts with prefix, as a range so any backend can walk the index."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": upper})
+
+
+def _name_query(tokens):
+    first, rest = tokens[0], tokens[1:]
+    cond = _prefix("last_name_key", first) | _prefix("first_name_key", first)
+    for token in rest:
+        # "obi ada" / "ada obi": later tokens may hit either name
+        cond &= _prefix("last_name_key", token) | _prefix("first_name_key", token)
+
+    rank = Case(
+        When(last_name_key=first, then=Value(0)),
+        When(first_name_key=first, then=Value(1)),
+        When(_prefix("last_name_key", first), then=Value(2)),
+        default=Value(3),
+        output_field=IntegerField(),
+    )
+    return Patient.objects.filter(cond).annotate(rank=rank).order_by("rank", "last_name_key", "first_name_key", "pk")
+
+
+def search_patients(q):
+    """Queryset of patients matching the front-desk query `q`, best matches first."""
+    q = (q or "").strip()
+    if not q:
+        return Patient.objects.order_by("-created_at")
+
+    m = HOSPITAL_NUMBER_RE.match(q)
+    if m:
+        return Patient.objects.filter(hospital_number=f"EDH-{int(m.group(1)):06d}")
+
+    compact = re.sub(r"[\s\-()+]", "", q)
+    if compact.isdigit():
+        cond = _prefix("phone_key", phone_key(q))
+        if len(compact) <= 6:
+            # short numbers are more likely a hospital number typed without "EDH-"
+            cond |= Q(hospital_number=f"EDH-{int(compact):06d}")
+        return Patient.objects.filter(cond).order_by("phone_key", "pk")
+
+    tokens = [t for t in (name_key(part) for part in q.split()) if t]
+    if not tokens:
+        return Patient.objects.none()
+    return _name_query(tokens)
+
+
+def typeahead(q, limit=TYPEAHEAD_LIMIT):
+    """Compact dicts for the JSON typeahead (one indexed query, no model instances)."""
+    if len((q or "").strip()) < 2:
+        return []
+    rows = search_patients(q).values_list("id", "hospital_number", "last_name", "first_name", "phone")[:limit]
+    return [
+        {"id": pk, "hospital_number": hn, "name": f"{last} {first}", "phone": phone}
+        for pk, hn, last, first, phone in rows
+    ]
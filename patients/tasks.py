@@ -0,0 +1,18 @@
+"""Background tasks for patient registration (see core.tasks)."""
+from django.contrib.auth.forms import PasswordResetForm
+
+from core.tasks import task
+
+
+@task(max_attempts=5, backoff=60)
+def send_password_reset(email, domain, use_https=False):
+    """The set-your-password mail for a newly registered patient's portal account."""
+    reset_form = PasswordResetForm({"email": email})
+    if reset_form.is_valid():
+        reset_form.save(
+            domain_override=domain,
+            use_https=use_https,
+            from_email=None,  # set when SMTP is configured
+            email_template_name="registration/password_reset_email.html",
+            subject_template_name="registration/password_reset_subject.txt",
+        )
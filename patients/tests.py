@@ -1,3 +1,327 @@
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import tasks
+from core.models import BackgroundTask
+from hmo.models import HMO
+from pharmacy.models import Drug, PrescriptionItem
+from visits import vitals
+from visits.models import Visit
+
+from .importer import import_patients, read_rows
+from .models import Patient
+from .record import visit_page, vitals_trend
+from .search import name_key, phone_key, search_patients, typeahead
+
+
+def make_patient(first, last, phone="08030000000"):
+    return Patient.objects.create(first_name=first, last_name=last, gender="F", phone=phone)
+
+
+class SearchKeyTests(TestCase):
+    def test_keys_are_normalized_on_save(self):
+        p = make_patient("Ádàẹ́ze", "Okafor-Obi", phone="+234 803 123 4567")
+        self.assertEqual(p.first_name_key, "adaeze")
+        self.assertEqual(p.last_name_key, "okaforobi")
+        self.assertEqual(p.phone_key, "08031234567")
+
+    def test_partial_save_refreshes_keys(self):
+        p = make_patient("Ada", "Obi")
+        p.last_name = "Eze"
+        p.save(update_fields=["last_name"])
+        p.refresh_from_db()
+        self.assertEqual(p.last_name_key, "eze")
+
+    def test_normalizers(self):
+        self.assertEqual(name_key(" Nwa  Chukwu "), "nwachukwu")
+        self.assertEqual(phone_key("0803-123-4567"), "08031234567")
+
+
+class SearchPatientsTests(TestCase):
+    def setUp(self):
+        self.obi = make_patient("Ada", "Obi", phone="08031234567")
+        self.obiora = make_patient("Chidi", "Obiora", phone="08099990000")
+        self.first_obi = make_patient("Obinna", "Eze", phone="07011112222")
+
+    def test_hospital_number_is_exact(self):
+        self.assertEqual(list(search_patients(self.obi.hospital_number.lower())), [self.obi])
+        self.assertEqual(list(search_patients(str(self.obiora.pk))), [self.obiora])
+
+    def test_phone_matches_local_and_international_forms(self):
+        self.assertEqual(list(search_patients("+2348031234")), [self.obi])
+        self.assertEqual(list(search_patients("0803 123")), [self.obi])
+
+    def test_name_ranks_exact_then_last_name_prefix(self):
+        self.assertEqual(list(search_patients("obi")), [self.obi, self.obiora, self.first_obi])
+
+    def test_multiple_tokens_narrow_in_any_order(self):
+        self.assertEqual(list(search_patients("ada obi")), [self.obi])
+        self.assertEqual(list(search_patients("obi ada")), [self.obi])
+
+    def test_lookups_use_indexes(self):
+        plan = search_patients("obi").explain()
+        self.assertNotRegex(plan, r"\bSCAN patients_patient\s*$")
+
+    def test_typeahead(self):
+        self.assertEqual(typeahead("o"), [])
+        rows = typeahead("obi", limit=2)
+        self.assertEqual([r["id"] for r in rows], [self.obi.pk, self.obiora.pk])
+        self.assertEqual(rows[0]["name"], "Obi Ada")
+
+
+class PatientSearchViewTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="frontdesk", password="x")
+        self.client.force_login(self.user)
+        self.patient = make_patient("Ada", "Obi")
+
+    def test_list_filters(self):
+        resp = self.client.get(reverse("patients:patient_list"), {"q": "obi"})
+        self.assertEqual(list(resp.context["patients"]), [self.patient])
+
+    def test_typeahead_json(self):
+        resp = self.client.get(reverse("patients:patient_search_json"), {"q": "ob"})
+        self.assertEqual(resp.json()["results"][0]["hospital_number"], self.patient.hospital_number)
+
+
+class LongitudinalRecordTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient("Ada", "Obi")
+        self.drug = Drug.objects.create(name="Paracetamol", price=Decimal("200.00"))
+        start = timezone.now() - timedelta(days=90)
+        self.visits = []
+        for i in range(7):
+            visit = Visit.objects.create(patient=self.patient, bp_systolic=120 + i, pulse_bpm=70)
+            PrescriptionItem.objects.create(visit=visit, drug=self.drug)
+            self.visits.append(visit)
+        # spread the history over three months, oldest first
+        for i, visit in enumerate(self.visits):
+            taken_at = start + timedelta(days=15 * i)
+            Visit.objects.filter(pk=visit.pk).update(created_at=taken_at)
+            vitals.record(self.patient, [{"bp_systolic": 120 + i, "pulse_bpm": 70, "taken_at": taken_at}], visit=visit)
+
+    def walk(self, limit):
+        pages, cursor = [], None
+        while True:
+            visits, cursor = visit_page(self.patient, cursor, limit)
+            pages.append([v.pk for v in visits])
+            if cursor is None:
+                return pages
+
+    def test_pages_walk_newest_first_without_gaps(self):
+        pages = self.walk(3)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), [v.pk for v in reversed(self.visits)])
+
+    def test_page_query_count_is_fixed(self):
+        with self.assertNumQueries(2):
+            visits, _ = visit_page(self.patient, limit=7)
+            for v in visits:
+                list(v.prescriptions.all())
+                getattr(v, "invoice", None)
+                str(v.doctor)
+
+    def test_vitals_trend_is_one_grouped_query(self):
+        with self.assertNumQueries(1):
+            trend = vitals_trend(self.patient, "month")
+        self.assertEqual(sum(row["readings"] for row in trend), 14)
+        self.assertTrue(all(row["pulse_bpm"] == 70.0 for row in trend))
+        self.assertEqual([row["period"] for row in trend], sorted(row["period"] for row in trend))
+
+    def test_record_json_pages_and_trend(self):
+        staff = get_user_model().objects.create_user(username="doc", password="x", role="doctor")
+        self.client.force_login(staff)
+        url = reverse("patients:patient_record_json", args=[self.patient.pk])
+        first = self.client.get(url, {"limit": 5}).json()
+        self.assertEqual(len(first["visits"]), 5)
+        self.assertEqual(first["visits"][0]["prescriptions"][0]["drug"], str(self.drug))
+        self.assertIn("vitals_trend", first)
+
+        rest = self.client.get(url, {"limit": 5, "before": first["next_cursor"]}).json()
+        self.assertEqual(len(rest["visits"]), 2)
+        self.assertIsNone(rest["next_cursor"])
+        self.assertNotIn("vitals_trend", rest)
+
+    def test_detail_older_page_keeps_latest_visit(self):
+        staff = get_user_model().objects.create_user(username="doc", password="x", role="doctor")
+        self.client.force_login(staff)
+        _, cursor = visit_page(self.patient, limit=3)
+        resp = self.client.get(reverse("patients:patient_detail", args=[self.patient.pk]), {"before": cursor})
+        self.assertEqual([v.pk for v in resp.context["visits"]], [v.pk for v in reversed(self.visits[:4])])
+        self.assertEqual(resp.context["latest_visit"], self.visits[-1])
+
+    def test_patients_only_read_their_own_record(self):
+        user = get_user_model().objects.create_user(username="p", password="x", role="patient")
+        self.patient.user = user
+        self.patient.save()
+        other = make_patient("Chi", "Eze")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("patients:patient_record_json", args=[self.patient.pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse("patients:patient_record_json", args=[other.pk])).status_code, 403)
+
+
+class PatientRegistrationTaskTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user("desk", password="pw", role="frontdesk"))
+        # a portal account that already has a password, so the reset form will mail it
+        get_user_model().objects.create_user("ada@example.com", email="ada@example.com", password="pw", role="patient")
+
+    def test_reset_mail_leaves_the_request_and_goes_out_from_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse("patients:patient_create"), {
+                "first_name": "Ada", "last_name": "Obi", "gender": "F",
+                "phone": "08030000000", "email": "ada@example.com",
+            })
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        bg = BackgroundTask.objects.get()
+        self.assertEqual(bg.name, "patients.tasks.send_password_reset")
+        self.assertEqual(bg.kwargs["email"], "ada@example.com")
+
+        self.assertEqual(tasks.run_pending(), {"done": 1, "failed": 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["ada@example.com"])
+        self.assertIn("testserver", mail.outbox[0].body)
+
+
+def csv_file(*lines):
+    return BytesIO(("\n".join(lines) + "\n").encode())
+
+
+def xlsx_file(rows):
+    """A minimal one-sheet workbook: strings inline, numbers as numeric cells."""
+    ns = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    body = []
+    for r, row in enumerate(rows, start=1):
+        cells = []
+        for c, value in enumerate(row):
+            ref = f"{chr(65 + c)}{r}"
+            if isinstance(value, (int, float)):
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{value}</t></is></c>')
+        body.append(f'<row r="{r}">{"".join(cells)}</row>')
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("xl/workbook.xml",
+                    f'<workbook xmlns="{ns}" xmlns:r="{rel}"><sheets><sheet name="Enrollees" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        zf.writestr("xl/_rels/workbook.xml.rels",
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    f'<Relationship Id="rId1" Type="{rel}/worksheet" Target="worksheets/sheet1.xml"/></Relationships>')
+        zf.writestr("xl/worksheets/sheet1.xml", f'<worksheet xmlns="{ns}"><sheetData>{"".join(body)}</sheetData></worksheet>')
+    buf.seek(0)
+    return buf
+
+
+class PatientImportTests(TestCase):
+    HEADER = "Surname,First Name,Sex,DOB,Phone,HMO,Enrollee ID"
+
+    def setUp(self):
+        self.hmo = HMO.objects.create(name="Hygeia")
+
+    def run_import(self, *lines, **kwargs):
+        return import_patients(read_rows(csv_file(self.HEADER, *lines), "list.csv"), **kwargs)
+
+    def test_rows_are_normalized_and_numbered_in_one_block(self):
+        result = self.run_import(
+            "Obi,Ada,female,14/02/1990,+234 803 111 2222,hygeia,HYG-1",
+            "Okafor,Chidi,M,1985-07-01,08032223333,,",
+        )
+        self.assertEqual((result.rows, result.created, result.errors), (2, 2, []))
+        ada, chidi = Patient.objects.order_by("hospital_number")
+        self.assertEqual([ada.hospital_number, chidi.hospital_number], ["EDH-000001", "EDH-000002"])
+        self.assertEqual((ada.gender, ada.date_of_birth, ada.hmo, ada.is_hmo), ("F", date(1990, 2, 14), self.hmo, True))
+        self.assertEqual((ada.phone_key, ada.last_name_key), ("08031112222", "obi"))
+        self.assertFalse(chidi.is_hmo)
+
+    def test_bad_rows_are_reported_by_line_and_the_rest_imported(self):
+        result = self.run_import(
+            "Obi,Ada,F,,0803,,",
+            ",Bola,X,31/02/1990,0805,,",
+            "Eze,Ngozi,F,,0806,Unknown HMO,",
+        )
+        self.assertEqual(result.created, 1)
+        lines = dict(result.errors)
+        self.assertEqual(sorted(lines), [3, 4])
+        self.assertEqual(len(lines[3]), 3)  # last_name, gender, date
+        self.assertIn("Unknown HMO", lines[4][0])
+
+    def test_duplicates_against_database_and_within_file(self):
+        Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="08031112222")
+        Patient.objects.create(first_name="Uche", last_name="Nwosu", gender="M", phone="0809", hmo=self.hmo,
+                               hmo_id_number="HYG-7")
+        result = self.run_import(
+            "OBI,ada,F,,+2348031112222,,",    # same person, phone in another form
+            "Obi,Emeka,M,,08031112222,,",     # family member sharing the phone
+            "Nwosu,Uchenna,M,,0810,Hygeia,HYG-7",
+            "Eze,Ngozi,F,,0811,Hygeia,HYG-8",
+            "Eze,Ngozi,F,,0812,Hygeia,HYG-8",
+        )
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _ in result.duplicates], [2, 4, 6])
+
+    def test_reimport_skips_everything(self):
+        lines = [f"Name{i},Test,F,,0803{i:07d},Hygeia,HYG-{i}" for i in range(30)]
+        self.assertEqual(self.run_import(*lines, chunk_size=7).created, 30)
+        again = self.run_import(*lines, chunk_size=7)
+        self.assertEqual((again.created, len(again.duplicates)), (0, 30))
+
+    def test_queries_per_chunk_do_not_grow_with_rows(self):
+        def count(n, start):
+            lines = [f"Name{i},Test,F,,0803{i:07d},Hygeia,HYG-{i}" for i in range(start, start + n)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.run_import(*lines).created, n)
+            # INSERTs are split by the backend's parameter limit; everything else is per chunk
+            return sum(not q["sql"].startswith("INSERT") for q in ctx.captured_queries)
+
+        self.assertEqual(count(20, 0), count(400, 100))
+
+    def test_dry_run_inserts_nothing(self):
+        result = self.run_import("Obi,Ada,F,,0803,,", dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertFalse(Patient.objects.exists())
+
+    def test_xlsx_enrollee_list_with_default_hmo(self):
+        upload = xlsx_file([
+            ["Surname", "First Name", "Sex", "DOB", "Mobile", "Enrollee ID"],
+            ["Obi", "Ada", "F", 32918, 8031112222, "HYG-1"],  # serial date and numeric phone
+        ])
+        result = import_patients(read_rows(upload, "enrollees.xlsx"), hmo=self.hmo)
+        self.assertEqual((result.created, result.errors), (1, []))
+        ada = Patient.objects.get()
+        self.assertEqual((ada.phone, ada.date_of_birth, ada.hmo_id_number, ada.hmo),
+                         ("08031112222", date(1990, 2, 14), "HYG-1", self.hmo))
+
+    def test_upload_view_reports_result(self):
+        self.client.force_login(get_user_model().objects.create_user("desk", password="x", role="frontdesk"))
+        upload = SimpleUploadedFile("list.csv", (self.HEADER + "\nObi,Ada,F,,0803,,\nEze,,F,,0804,,\n").encode())
+        resp = self.client.post(reverse("patients:patient_import"), {"file": upload, "hmo": ""})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["result"].created, 1)
+        self.assertContains(resp, "first_name is required.")
+
+        resp = self.client.post(reverse("patients:patient_import"),
+                                {"file": SimpleUploadedFile("list.pdf", b"%PDF")}, follow=True)
+        self.assertContains(resp, "Upload a .csv or .xlsx file.")
 
-# Create your tests here.
+    def test_command_imports_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as fh:
+            fh.write(self.HEADER + "\nObi,Ada,F,,0803,,\n")
+        out = StringIO()
+        call_command("import_patients", fh.name, "--hmo", "hygeia", stdout=out)
+        self.assertIn("1 patient(s) created", out.getvalue())
+        self.assertEqual(Patient.objects.get().hmo, self.hmo)
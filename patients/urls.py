@@ -6,7 +6,10 @@ app_name = "patients"
 urlpatterns = [
     path("", views.patient_list, name="patient_list"),
     path("new/", views.patient_create, name="patient_create"),
+    path("import/", views.patient_import, name="patient_import"),
+    path("search.json", views.patient_search_json, name="patient_search_json"),
     path("<int:pk>/", views.patient_detail, name="patient_detail"),
+    path("<int:pk>/record.json", views.patient_record_json, name="patient_record_json"),
     path("portal/", include("patients.portal_urls")),
     path("portal/", views.patient_portal, name="patient_portal"),
 ]
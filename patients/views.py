@@ -1,13 +1,21 @@
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.contrib.auth.forms import PasswordResetForm
+from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from accounts.utils import require_roles
+from hmo.models import HMO
 from visits.models import Visit
 
 from .forms import PatientForm
+from .importer import ImportFileError, import_patients, read_rows
 from .models import Patient
+from .record import PAGE_SIZE, visit_page, visit_summary, vitals_trend
+from .search import search_patients, typeahead
+from .tasks import send_password_reset
 
 User = get_user_model()
 
@@ -25,43 +33,64 @@ def patient_create(request):
     form = PatientForm(request.POST or None, request.FILES or None)
 
     if request.method == "POST" and form.is_valid():
-        patient = form.save(commit=False)
-
-        # ✅ Password-reset only: auto-create patient user (no default password)
-        if patient.email:
-            user, created = User.objects.get_or_create(
-                username=patient.email,
-                defaults={
-                    "email": patient.email,
-                    "role": "patient",
-                },
-            )
+        with transaction.atomic():
+            patient = form.save(commit=False)
+
+            # ✅ Password-reset only: auto-create patient user (no default password)
+            if patient.email:
+                user, created = User.objects.get_or_create(
+                    username=patient.email,
+                    defaults={
+                        "email": patient.email,
+                        "role": "patient",
+                    },
+                )
 
-            # Ensure patient users cannot login until they set password via reset
-            if created:
-                user.set_unusable_password()
-                user.save()
+                # Ensure patient users cannot login until they set password via reset
+                if created:
+                    user.set_unusable_password()
+                    user.save()
 
-            # Link patient to user (whether newly created or existing)
-            patient.user = user
+                # Link patient to user (whether newly created or existing)
+                patient.user = user
 
-            # Trigger password reset email/link (prints to console if EMAIL_BACKEND is console)
-            reset_form = PasswordResetForm({"email": patient.email})
-            if reset_form.is_valid():
-                reset_form.save(
-                    request=request,
+                # Password reset email/link goes out from the task worker once the patient is committed
+                send_password_reset.enqueue(
+                    email=patient.email,
+                    domain=get_current_site(request).domain,
                     use_https=request.is_secure(),
-                    from_email=None,  # set when SMTP is configured
-                    email_template_name="registration/password_reset_email.html",
-                    subject_template_name="registration/password_reset_subject.txt",
                 )
 
-        patient.save()
+            patient.save()
         return redirect("patients:patient_detail", patient.id)
 
     return render(request, "patients/patient_form.html", {"form": form})
 
 
+@login_required
+def patient_import(request):
+    """Bulk registration from an uploaded CSV/.xlsx (patients.importer); large files use `import_patients`."""
+    require_roles(request.user, roles={"frontdesk", "admin"})
+    context = {"hmos": HMO.objects.filter(active=True).order_by("name")}
+
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        hmo = HMO.objects.filter(pk=request.POST.get("hmo") or None).first()
+        if upload is None:
+            messages.error(request, "Choose a CSV or .xlsx file to import.")
+            return redirect("patients:patient_import")
+        try:
+            result = import_patients(
+                read_rows(upload, upload.name), hmo=hmo, dry_run=bool(request.POST.get("dry_run")),
+            )
+        except ImportFileError as exc:
+            messages.error(request, str(exc))
+            return redirect("patients:patient_import")
+        context.update(result=result, errors=result.errors[:200], duplicates=result.duplicates[:200])
+
+    return render(request, "patients/patient_import.html", context)
+
+
 @login_required
 def patient_list(request):
     # ✅ Patients cannot access staff patient list
@@ -69,64 +98,96 @@ def patient_list(request):
         return redirect("patients:patient_portal")
 
     q = (request.GET.get("q") or "").strip()
-    qs = Patient.objects.all().order_by("-created_at")
-
-    if q:
-        qs = qs.filter(
-            Q(hospital_number__icontains=q)
-            | Q(first_name__icontains=q)
-            | Q(last_name__icontains=q)
-            | Q(phone__icontains=q)
-        )
+    qs = search_patients(q).select_related("hmo")
 
     return render(request, "patients/patient_list.html", {"patients": qs[:200], "q": q})
 
 
 @login_required
-def patient_detail(request, pk: int):
-    # ✅ If logged-in user is a patient, only allow their own record
+def patient_search_json(request):
+    """Typeahead for registration / visit check-in: ?q=... -> top matches as JSON."""
+    if _is_patient_user(request.user):
+        raise PermissionDenied("Staff only.")
+
+    return JsonResponse({"results": typeahead(request.GET.get("q"))})
+
+
+def _record_patient(request, pk: int):
+    """The patient whose record `request.user` may read: their own if a patient, any for staff."""
     if _is_patient_user(request.user):
         my_patient = getattr(request.user, "patient", None)
         if not my_patient:
             raise PermissionDenied("Patient profile not linked.")
         if my_patient.pk != pk:
             raise PermissionDenied("You cannot view another patient's record.")
+        return my_patient
+    return get_object_or_404(Patient, pk=pk)
 
-        visits = (
-            my_patient.visits.select_related("doctor")
-            .order_by("-created_at")
-        )
-        return render(
-            request,
-            "patients/patient_detail.html",
-            {"patient": my_patient, "visits": visits},
-        )
-
-    # ✅ Staff access
-    patient = get_object_or_404(Patient, pk=pk)
-    visits = (
-        patient.visits.select_related("doctor")
-        .order_by("-created_at")
-    )
+
+@login_required
+def patient_detail(request, pk: int):
+    # ✅ Patients only see their own record; staff any
+    patient = _record_patient(request, pk)
+
+    # one page of history at a time; ?before=<cursor> walks back
+    before = request.GET.get("before")
+    visits, next_cursor = visit_page(patient, before)
+    if before:
+        latest_visit = patient.visits.order_by("-created_at", "-id").first()
+    else:
+        latest_visit = visits[0] if visits else None
 
     return render(
         request,
         "patients/patient_detail.html",
-        {"patient": patient, "visits": visits},
+        {
+            "patient": patient,
+            "visits": visits,
+            "next_cursor": next_cursor,
+            "older": bool(before),
+            "latest_visit": latest_visit,
+        },
     )
 
 
+@login_required
+def patient_record_json(request, pk: int):
+    """Longitudinal record: ?before=<cursor> pages visits; the first page carries the vitals trend."""
+    patient = _record_patient(request, pk)
+    before = request.GET.get("before")
+    try:
+        limit = int(request.GET.get("limit") or PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+    visits, next_cursor = visit_page(patient, before, limit)
+
+    payload = {
+        "patient": {
+            "id": patient.pk,
+            "hospital_number": patient.hospital_number,
+            "name": f"{patient.last_name} {patient.first_name}".strip(),
+            "date_of_birth": patient.date_of_birth.isoformat() if patient.date_of_birth else None,
+            "blood_group": patient.blood_group,
+            "allergies": patient.allergies,
+        },
+        "visits": [visit_summary(v) for v in visits],
+        "next_cursor": next_cursor,
+    }
+    if not before:
+        payload["vitals_trend"] = vitals_trend(patient, request.GET.get("period") or "month")
+    return JsonResponse(payload)
+
+
 @login_required
 def patient_portal(request):
     patient = getattr(request.user, "patient", None)
     if patient is None:
         return redirect("patients:patient_list")  # staff fallback
 
-    visits = patient.visits.select_related("doctor").order_by("-created_at")
+    visits, next_cursor = visit_page(patient, request.GET.get("before"))
 
     return render(
         request,
         "patients/patient_portal.html",
-        {"patient": patient, "visits": visits},
+        {"patient": patient, "visits": visits, "next_cursor": next_cursor},
     )
-
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Drug, PrescriptionItem
+from .models import Drug, PrescriptionItem, PrescriptionStatusLog
 
 
 @admin.register(Drug)
@@ -12,4 +12,9 @@ class DrugAdmin(admin.ModelAdmin):
 class PrescriptionItemAdmin(admin.ModelAdmin):
     list_display = ("visit", "drug", "status", "created_at")
     search_fields = ("visit__visit_number", "drug__name")
-    list_filter = ("status",)
\ No newline at end of file
+    list_filter = ("status",)
+
+@admin.register(PrescriptionStatusLog)
+class PrescriptionStatusLogAdmin(admin.ModelAdmin):
+    list_display = ("item", "visit", "from_status", "to_status", "changed_by", "changed_at")
+    list_filter = ("to_status",)
@@ -4,3 +4,5 @@ class PharmacyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pharmacy'
 
+    def ready(self):
+        import pharmacy.signals  # noqa
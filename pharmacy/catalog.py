@@ -0,0 +1,127 @@
+"""
+Process-local drug catalog for prescribing.
+
+Each process keeps the active drugs plus a sorted token index over
+name, strength and dosage form. The cache holds only a catalog version,
+derived from the Drug table itself (latest updated_at, row count, highest
+id), so it changes only when the drugs do. A request costs one cache read;
+the Drug signals drop the cached version on every change, and the table is
+reloaded only when the re-derived version differs from the one in memory.
+The version is re-derived (one small aggregate) at most every
+CATALOG_VERSION_TTL seconds, which bounds how long another worker's edits
+take to show with the default per-process local-memory cache; an expiry on
+its own never forces a reload.
+"""
+import bisect
+import difflib
+import re
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Drug
+
+CATALOG_VERSION_KEY = "pharmacy:drug_catalog:version"
+CATALOG_VERSION_TTL = 60  # seconds a cached version is trusted before it is re-derived
+TYPEAHEAD_LIMIT = 15
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokens(text) -> list:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+@dataclass
+class DrugCatalog:
+    version: str
+    drugs: dict = field(default_factory=dict)   # id -> {"id", "label", "price"}
+    index: list = field(default_factory=list)   # sorted (token, id)
+    vocabulary: list = field(default_factory=list)
+
+    @classmethod
+    def load(cls, version):
+        catalog = cls(version=version)
+        rows = (
+            Drug.objects.filter(is_active=True)
+            .order_by("name", "strength", "id")
+            .values_list("id", "name", "strength", "dosage_form", "price")
+        )
+        entries = set()
+        for pk, name, strength, dosage_form, price in rows:
+            label = name + (f" {strength}" if strength else "") + (f" ({dosage_form})" if dosage_form else "")
+            catalog.drugs[pk] = {"id": pk, "label": label, "price": str(price) if price is not None else None}
+            for token in tokens(f"{name} {strength} {dosage_form}") + ["".join(tokens(name))]:
+                entries.add((token, pk))
+        catalog.index = sorted(entries)
+        catalog.vocabulary = sorted({token for token, _ in catalog.index})
+        return catalog
+
+    def _prefix_ids(self, prefix) -> set:
+        start = bisect.bisect_left(self.index, (prefix, 0))
+        ids = set()
+        for token, pk in self.index[start:]:
+            if not token.startswith(prefix):
+                break
+            ids.add(pk)
+        return ids
+
+    def _term_ids(self, term) -> set:
+        ids = self._prefix_ids(term)
+        if not ids and len(term) >= 4:
+            # misspelt term ("paracetmol"): nearest known tokens instead
+            for close in difflib.get_close_matches(term, self.vocabulary, n=3, cutoff=0.75):
+                ids |= self._prefix_ids(close)
+        return ids
+
+    def search(self, q, limit=TYPEAHEAD_LIMIT) -> list:
+        terms = tokens(q)
+        if not terms:
+            return []
+        ids = None
+        for term in terms:
+            ids = self._term_ids(term) if ids is None else ids & self._term_ids(term)
+            if not ids:
+                return []
+
+        first = terms[0]
+        ranked = sorted(
+            (self.drugs[pk] for pk in ids),
+            key=lambda d: (not d["label"].lower().startswith(first), d["label"].lower()),
+        )
+        return ranked[:limit]
+
+
+_catalog = None
+
+
+def data_version() -> str:
+    """Changes whenever a drug is saved, added or deleted; stable otherwise."""
+    state = Drug.objects.aggregate(changed=Max("updated_at"), count=Count("id"), last=Max("id"))
+    changed = state["changed"].isoformat() if state["changed"] else ""
+    return f"{changed}:{state['count']}:{state['last'] or 0}"
+
+
+def current_version() -> str:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = data_version()
+        cache.set(CATALOG_VERSION_KEY, version, CATALOG_VERSION_TTL)
+    return version
+
+
+def invalidate():
+    cache.delete(CATALOG_VERSION_KEY)
+
+
+def get_catalog() -> DrugCatalog:
+    global _catalog
+    version = current_version()
+    if _catalog is None or _catalog.version != version:
+        _catalog = DrugCatalog.load(version)
+    return _catalog
+
+
+def search_drugs(q, limit=TYPEAHEAD_LIMIT) -> list:
+    return get_catalog().search(q, limit)
@@ -5,16 +5,12 @@ class PrescriptionItemForm(forms.ModelForm):
     class Meta:
         model = PrescriptionItem
         fields = ["drug", "dose", "frequency", "duration", "instructions"]
+        # picked through the drug typeahead (pharmacy:drug_search); rendering
+        # a <select> would load the whole catalog on every consultation page
+        widgets = {"drug": forms.HiddenInput}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        qs = Drug.objects.all()
-        # prefer is_active if it exists, else active if it exists
-        field_names = {f.name for f in Drug._meta.fields}
-        if "is_active" in field_names:
-            qs = Drug.objects.filter(is_active=True)
-        elif "active" in field_names:
-            qs = Drug.objects.filter(active=True)
-
-        self.fields["drug"].queryset = qs.order_by("name")
+        # only consulted to validate the submitted id
+        self.fields["drug"].queryset = Drug.objects.filter(is_active=True)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0002_prescriptionitem_price'),
+        ('visits', '0002_visit_chief_complaint_visit_closed_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prescriptionitem',
+            index=models.Index(fields=['status', 'created_at'], name='rx_status_created_idx'),
+        ),
+    ]
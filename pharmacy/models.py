@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from visits.models import Visit
 
@@ -8,6 +9,7 @@ class Drug(models.Model):
     active = models.BooleanField(default=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)  # part of the catalog version (pharmacy.catalog)
 
     def __str__(self):
         s = f"{self.name}"
@@ -32,5 +34,29 @@ class PrescriptionItem(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # pharmacy queue: pending items oldest first
+            models.Index(fields=["status", "created_at"], name="rx_status_created_idx"),
+            # queue pages: visits with pending items, keyset on visit id
+            models.Index(fields=["status", "visit"], name="rx_status_visit_idx"),
+        ]
+
     def __str__(self):
         return f"{self.visit.visit_number} - {self.drug}"
+
+
+class PrescriptionStatusLog(models.Model):
+    """
+    Append-only record of prescription status changes (new items included).
+    Its increasing id is the cursor open queue pages refresh from.
+    """
+    item = models.ForeignKey(PrescriptionItem, on_delete=models.CASCADE, related_name="status_log")
+    visit = models.ForeignKey(Visit, on_delete=models.CASCADE, related_name="+")
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20, choices=PrescriptionItem.Status.choices)
+    changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.item_id}: {self.from_status or '-'} -> {self.to_status}"
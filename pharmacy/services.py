@@ -0,0 +1,96 @@
+"""
+Pharmacy dispensing queue.
+
+The queue is paged by visit: a page is the next N visits (by id) that
+still have pending items, found with a keyset range on the
+(status, visit) index, followed by one query for those visits' items.
+Status changes are written with UPDATE statements and appended to
+PrescriptionStatusLog, so open queue pages poll the log for what changed
+instead of reloading the backlog.
+"""
+from django.db import transaction
+
+from .models import PrescriptionItem, PrescriptionStatusLog
+
+VISITS_PER_PAGE = 25
+CHANGES_LIMIT = 500
+
+
+def queue_page(after=0, limit=VISITS_PER_PAGE):
+    """
+    (items, next_after): pending items for the next `limit` visits after
+    visit id `after`, ordered by visit then time; next_after is None on the
+    last page.
+    """
+    visit_ids = list(
+        PrescriptionItem.objects.filter(status=PrescriptionItem.Status.PENDING, visit_id__gt=after or 0)
+        .order_by("visit_id")
+        .values_list("visit_id", flat=True)
+        .distinct()[:limit + 1]
+    )
+    has_more = len(visit_ids) > limit
+    visit_ids = visit_ids[:limit]
+    if not visit_ids:
+        return [], None
+
+    items = list(
+        PrescriptionItem.objects.select_related("visit__patient", "drug")
+        .filter(status=PrescriptionItem.Status.PENDING, visit_id__in=visit_ids)
+        .order_by("visit_id", "created_at", "id")
+    )
+    return items, (visit_ids[-1] if has_more else None)
+
+
+def _transition(items, to_status, user):
+    """Move (id, visit_id, status) rows to `to_status`: one UPDATE, one bulk log insert."""
+    if not items:
+        return 0
+    PrescriptionItem.objects.filter(pk__in=[pk for pk, _, _ in items]).update(status=to_status)
+    PrescriptionStatusLog.objects.bulk_create([
+        PrescriptionStatusLog(item_id=pk, visit_id=visit_id, from_status=status, to_status=to_status, changed_by=user)
+        for pk, visit_id, status in items
+    ])
+    return len(items)
+
+
+@transaction.atomic
+def set_item_status(item_id, to_status, user=None) -> int:
+    """Change one item's status if it is still pending; returns 1 if it changed."""
+    items = list(
+        PrescriptionItem.objects.select_for_update()
+        .filter(pk=item_id, status=PrescriptionItem.Status.PENDING)
+        .values_list("id", "visit_id", "status")
+    )
+    return _transition(items, to_status, user)
+
+
+@transaction.atomic
+def dispense_visit(visit_id, user=None) -> int:
+    """Dispense every pending item of a visit; returns how many were dispensed."""
+    items = list(
+        PrescriptionItem.objects.select_for_update()
+        .filter(visit_id=visit_id, status=PrescriptionItem.Status.PENDING)
+        .values_list("id", "visit_id", "status")
+    )
+    return _transition(items, PrescriptionItem.Status.DISPENSED, user)
+
+
+def latest_change_id() -> int:
+    return PrescriptionStatusLog.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def changes_since(cursor, limit=CHANGES_LIMIT) -> dict:
+    """Status changes after log id `cursor`, oldest first."""
+    rows = list(
+        PrescriptionStatusLog.objects.filter(id__gt=cursor)
+        .order_by("id")
+        .values_list("id", "item_id", "visit_id", "to_status")[:limit]
+    )
+    return {
+        "cursor": rows[-1][0] if rows else cursor,
+        "changes": [
+            {"item_id": item_id, "visit_id": visit_id, "status": status}
+            for _, item_id, visit_id, status in rows
+        ],
+        "more": len(rows) == limit,
+    }
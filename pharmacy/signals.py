@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Drug, PrescriptionItem, PrescriptionStatusLog
+from . import catalog
+
+@receiver(post_save, sender=PrescriptionItem)
+def log_new_prescription(sender, instance: PrescriptionItem, created, **kwargs):
+    if created:
+        PrescriptionStatusLog.objects.create(item=instance, visit_id=instance.visit_id, to_status=instance.status)
+
+
+@receiver(post_save, sender=Drug)
+@receiver(post_delete, sender=Drug)
+def invalidate_drug_catalog(sender, instance: Drug, **kwargs):
+    transaction.on_commit(catalog.invalidate)
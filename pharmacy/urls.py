@@ -6,5 +6,8 @@ app_name = "pharmacy"
 urlpatterns = [
     path("queue/", views.pharmacy_queue, name="queue"),
     path("add/<int:visit_id>/", views.add_prescription, name="add_prescription"),
+    path("queue/changes/", views.queue_changes, name="queue_changes"),
+    path("drugs/search/", views.drug_search, name="drug_search"),
     path("dispense/<int:item_id>/", views.mark_dispensed, name="mark_dispensed"),
+    path("dispense/visit/<int:visit_id>/", views.dispense_visit, name="dispense_visit"),
 ]
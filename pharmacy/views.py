@@ -1,9 +1,14 @@
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from accounts.utils import require_roles
 from visits.models import Visit
 from .forms import PrescriptionItemForm
 from .models import PrescriptionItem
+from . import catalog, services
 
 @login_required
 def add_prescription(request, visit_id: int):
@@ -17,22 +22,65 @@ def add_prescription(request, visit_id: int):
         item.save()
     return redirect("visits:consultation", visit_id=visit.id)
 
+def _int_param(request, name) -> int:
+    try:
+        return max(int(request.GET.get(name) or 0), 0)
+    except ValueError:
+        return 0
+
+
+def _back_to_queue(request):
+    url = reverse("pharmacy:queue")
+    after = _int_param(request, "after")
+    return redirect(f"{url}?after={after}" if after else url)
+
+
 @login_required
 def pharmacy_queue(request):
     require_roles(request.user, roles={"pharmacy", "admin"})
 
-    items = PrescriptionItem.objects.select_related("visit__patient", "drug").filter(
-        status=PrescriptionItem.Status.PENDING
-    ).order_by("created_at")
+    after = _int_param(request, "after")
+    items, next_after = services.queue_page(after)
+
+    return render(request, "pharmacy/queue.html", {
+        "items": items,
+        "after": after,
+        "next_after": next_after,
+        "cursor": services.latest_change_id(),
+    })
+
+
+@login_required
+def drug_search(request):
+    """Typeahead over the cached drug catalog: ?q=amox 500 -> matching drugs as JSON."""
+    require_roles(request.user, roles={"doctor", "pharmacy", "admin"})
+
+    return JsonResponse({"results": catalog.search_drugs(request.GET.get("q"))})
+
+
+@login_required
+def queue_changes(request):
+    """Status log entries after ?since=<log id>, for refreshing an open queue page."""
+    require_roles(request.user, roles={"pharmacy", "admin"})
+
+    return JsonResponse(services.changes_since(_int_param(request, "since")))
 
-    return render(request, "pharmacy/queue.html", {"items": items})
 
 @login_required
 def mark_dispensed(request, item_id: int):
     require_roles(request.user, roles={"pharmacy", "admin"})
 
     item = get_object_or_404(PrescriptionItem, pk=item_id)
-    item.status = PrescriptionItem.Status.DISPENSED
-    item.save(update_fields=["status"])
-    return redirect("pharmacy:queue")
+    services.set_item_status(item.pk, PrescriptionItem.Status.DISPENSED, request.user)
+    return _back_to_queue(request)
+
 
+@login_required
+@require_POST
+def dispense_visit(request, visit_id: int):
+    require_roles(request.user, roles={"pharmacy", "admin"})
+
+    visit = get_object_or_404(Visit, pk=visit_id)
+    count = services.dispense_visit(visit.pk, request.user)
+    messages.success(request, f"Dispensed {count} item(s) for {visit.visit_number}.")
+    return _back_to_queue(request)
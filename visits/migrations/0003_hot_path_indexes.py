@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 20:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_alter_patient_user'),
+        ('visits', '0002_visit_chief_complaint_visit_closed_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['status', 'created_at'], name='visit_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['patient', '-created_at'], name='visit_patient_created_idx'),
+        ),
+    ]
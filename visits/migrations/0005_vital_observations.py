@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-17 21:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+KINDS = ["bp_systolic", "bp_diastolic", "pulse_bpm", "temperature_c", "resp_rate", "spo2", "weight_kg", "height_cm"]
+
+
+def backfill_from_visits(apps, schema_editor):
+    """Copy each visit's triage vitals into observations, one INSERT ... SELECT per kind."""
+    Visit = apps.get_model("visits", "Visit")
+    VitalObservation = apps.get_model("visits", "VitalObservation")
+    qn = schema_editor.connection.ops.quote_name
+    for kind in KINDS:
+        schema_editor.execute(
+            f"INSERT INTO {qn(VitalObservation._meta.db_table)} "
+            f"({qn('patient_id')}, {qn('visit_id')}, {qn('kind')}, {qn('value')}, {qn('taken_at')}) "
+            f"SELECT {qn('patient_id')}, {qn('id')}, %s, {qn(kind)}, {qn('created_at')} "
+            f"FROM {qn(Visit._meta.db_table)} WHERE {qn(kind)} IS NOT NULL",
+            [kind],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_patient_search_keys'),
+        ('visits', '0004_visit_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bp_systolic', 'BP systolic (mmHg)'), ('bp_diastolic', 'BP diastolic (mmHg)'), ('pulse_bpm', 'Pulse (bpm)'), ('temperature_c', 'Temperature (°C)'), ('resp_rate', 'Respiratory rate (/min)'), ('spo2', 'SpO2 (%)'), ('weight_kg', 'Weight (kg)'), ('height_cm', 'Height (cm)')], max_length=16)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('taken_at', models.DateTimeField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vital_observations', to='patients.patient')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('visit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='observations', to='visits.visit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'kind', 'taken_at'], name='vitalobs_patient_kind_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_from_visits, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from core import sequences
 from patients.models import Patient
 
 
@@ -60,6 +61,21 @@ class Visit(models.Model):
 
     triage_note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # queue: open/waiting/in-consult visits oldest first
+            models.Index(fields=["status", "created_at"], name="visit_status_created_idx"),
+            # patient history, newest first
+            models.Index(fields=["patient", "-created_at"], name="visit_patient_created_idx"),
+            # live queue feed: visits changed since a (updated_at, id) cursor
+            models.Index(fields=["updated_at", "id"], name="visit_updated_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.visit_number:
+            self.visit_number = sequences.next_number(sequences.VISIT)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         # NOTE: this assumes Patient has `hospital_number`.
         return f"{self.visit_number} - {self.patient.hospital_number}"
@@ -69,3 +85,44 @@ class Visit(models.Model):
             self.bp_systolic, self.bp_diastolic, self.temperature_c, self.pulse_bpm,
             self.resp_rate, self.spo2, self.weight_kg, self.height_cm
         ])
+
+
+class VitalObservation(models.Model):
+    """
+    One vital-sign reading: a patient, what was measured, its value and when.
+
+    Visit keeps the triage set captured at check-in; this table holds every
+    reading (triage and repeated ward observations alike) so a trend is an
+    index range scan on (patient, kind, taken_at) rather than a walk over
+    the patient's visits. See visits.vitals for recording and trend queries.
+    """
+
+    class Kind(models.TextChoices):
+        BP_SYSTOLIC = "bp_systolic", "BP systolic (mmHg)"
+        BP_DIASTOLIC = "bp_diastolic", "BP diastolic (mmHg)"
+        PULSE = "pulse_bpm", "Pulse (bpm)"
+        TEMPERATURE = "temperature_c", "Temperature (°C)"
+        RESP_RATE = "resp_rate", "Respiratory rate (/min)"
+        SPO2 = "spo2", "SpO2 (%)"
+        WEIGHT = "weight_kg", "Weight (kg)"
+        HEIGHT = "height_cm", "Height (cm)"
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="vital_observations")
+    visit = models.ForeignKey(
+        Visit, null=True, blank=True, on_delete=models.SET_NULL, related_name="observations",
+    )
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    value = models.DecimalField(max_digits=6, decimal_places=2)
+    taken_at = models.DateTimeField()
+    recorded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+",
+    )
+
+    class Meta:
+        indexes = [
+            # trend charts: one kind for one patient over a time range
+            models.Index(fields=["patient", "kind", "taken_at"], name="vitalobs_patient_kind_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}={self.value} @ {self.taken_at:%Y-%m-%d %H:%M}"
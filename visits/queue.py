@@ -0,0 +1,174 @@
+"""
+Live visit queue.
+
+Workstations render the queue once, then ask for the visits changed since
+their cursor, a (Visit.updated_at, id) pair. Every status change goes
+through Visit.save and bumps updated_at, so the feed also sees visits that
+leave the queue.
+
+updated_at is stamped when a visit is saved, not when its transaction
+commits, so a save that commits late can land behind a cursor that was
+already handed out. Every feed therefore also re-sends the visits changed
+in the last VISIT_QUEUE_OVERLAP_SECONDS behind the cursor (rows are
+replaced by id on the client, so a repeat is harmless); only rows past the
+cursor move it on, so paging through a large backlog always advances.
+
+The ETag covers the latest updated_at, the queue length, the (id,
+updated_at) pairs inside the overlap window (so a late commit changes it)
+and the client's cursor (so draining `more` pages is never answered 304).
+All of it comes straight from indexes: polling an unchanged queue costs
+two tiny queries and a 304. Edits to a patient's name/phone don't bump a
+visit and show up on the next full page load.
+
+Polling the feed is the default. The server-sent events stream is opt-in
+(VISIT_QUEUE_SSE) because each open stream holds a sync worker for as long
+as it lasts. Streams therefore end after VISIT_QUEUE_STREAM_SECONDS. The
+browser's EventSource reconnects after the `retry:` delay and resumes from
+the last event id (Last-Event-ID), so a short stream loses nothing.
+"""
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Visit
+
+QUEUE_STATUSES = [Visit.Status.OPEN, Visit.Status.WAITING_DOCTOR, Visit.Status.IN_CONSULT]
+FEED_LIMIT = 200
+STREAM_POLL_SECONDS = 3
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_RETRY_MS = 3000  # EventSource reconnect delay once a stream ends
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def queue_visits():
+    return Visit.objects.select_related("patient").filter(status__in=QUEUE_STATUSES).order_by("created_at")
+
+
+def encode_cursor(updated_at, pk) -> str:
+    return f"{(updated_at - _EPOCH) // timedelta(microseconds=1)}.{pk}"
+
+
+def decode_cursor(cursor):
+    """(updated_at, pk), or None for a missing/garbled cursor."""
+    try:
+        micros, pk = (int(part) for part in (cursor or "").split("."))
+    except ValueError:
+        return None
+    return _EPOCH + timedelta(microseconds=micros), pk
+
+
+def latest_cursor() -> str:
+    last = Visit.objects.order_by("-updated_at", "-id").values_list("updated_at", "id").first()
+    return encode_cursor(*last) if last else encode_cursor(_EPOCH, 0)
+
+
+def stream_seconds() -> int:
+    return getattr(settings, "VISIT_QUEUE_STREAM_SECONDS", 25)
+
+
+def overlap() -> timedelta:
+    return timedelta(seconds=getattr(settings, "VISIT_QUEUE_OVERLAP_SECONDS", 10))
+
+
+def queue_etag(cursor="") -> str:
+    recent = list(
+        Visit.objects.filter(updated_at__gte=timezone.now() - overlap())
+        .order_by("updated_at", "id").values_list("updated_at", "id")
+    )
+    latest = encode_cursor(*recent[-1]) if recent else latest_cursor()
+    size = Visit.objects.filter(status__in=QUEUE_STATUSES).count()
+    window = hashlib.sha1(repr(recent).encode()).hexdigest()[:12]
+    return f'"{latest}-{size}-{window}-{cursor or ""}"'
+
+
+def render_row(visit, request=None) -> str:
+    return render_to_string("visits/_queue_row.html", {"v": visit}, request=request)
+
+
+def changes_since(cursor, request=None) -> dict:
+    """
+    Visits touched after `cursor`, oldest change first:
+    rows still in the queue come back rendered, the rest as removed ids.
+    """
+    position = decode_cursor(cursor)
+    if position is None:
+        return snapshot(request)
+
+    updated_at, pk = position
+    after_cursor = Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk)
+    changed = list(
+        Visit.objects.select_related("patient").filter(after_cursor)
+        .order_by("updated_at", "id")[:FEED_LIMIT]
+    )
+    # late commits: rows stamped just behind the cursor that weren't visible when it was served
+    resent = Visit.objects.select_related("patient").filter(
+        updated_at__gt=updated_at - overlap(),
+    ).exclude(after_cursor).exclude(pk__in=[v.pk for v in changed])
+
+    upserts, removed = [], []
+    for v in [*resent.order_by("updated_at", "id"), *changed]:
+        if v.status in QUEUE_STATUSES:
+            upserts.append({"id": v.pk, "html": render_row(v, request)})
+        else:
+            removed.append(v.pk)
+
+    return {
+        "cursor": encode_cursor(changed[-1].updated_at, changed[-1].pk) if changed else cursor,
+        "reset": False,
+        "upserts": upserts,
+        "removed": removed,
+        "more": len(changed) == FEED_LIMIT,
+    }
+
+
+def snapshot(request=None) -> dict:
+    """The whole queue; clients replace their table with it."""
+    cursor = latest_cursor()
+    return {
+        "cursor": cursor,
+        "reset": True,
+        "upserts": [
+            {"id": v.pk, "html": render_row(v, request)}
+            for v in queue_visits()
+        ],
+        "removed": [],
+        "more": False,
+    }
+
+
+def stream_events(cursor, request=None, *, max_seconds=None, poll=STREAM_POLL_SECONDS):
+    """
+    Server-sent events: one `queue` event per batch of changes. Between
+    changes only the ETag query runs; the feed query runs when it moves.
+    Ends after `max_seconds` (VISIT_QUEUE_STREAM_SECONDS); the client reconnects.
+    """
+    max_seconds = stream_seconds() if max_seconds is None else max_seconds
+    started = last_sent = time.monotonic()
+    etag = None
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    while True:
+        current = queue_etag()  # global: the stream tracks its own cursor
+        if current != etag:
+            etag = current
+            while True:
+                feed = changes_since(cursor, request)
+                cursor = feed["cursor"]
+                if feed["upserts"] or feed["removed"] or feed["reset"]:
+                    yield f"id: {cursor}\nevent: queue\ndata: {json.dumps(feed)}\n\n"
+                    last_sent = time.monotonic()
+                if not feed["more"]:
+                    break
+        elif time.monotonic() - last_sent >= STREAM_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+        if time.monotonic() - started >= max_seconds:
+            return
+        time.sleep(poll)
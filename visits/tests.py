@@ -1,3 +1,182 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from patients.models import Patient
+
+from . import queue as live_queue
+from . import vitals
+from .models import Visit, VitalObservation
+
+
+class LiveQueueTests(TestCase):
+    def setUp(self):
+        self.nurse = get_user_model().objects.create_user(username="nurse", password="x", role="nurse")
+        self.client.force_login(self.nurse)
+        self.patient = Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+        self.waiting = Visit.objects.create(patient=self.patient, status=Visit.Status.WAITING_DOCTOR)
+
+    def test_cursor_round_trip(self):
+        cursor = live_queue.encode_cursor(self.waiting.updated_at, self.waiting.pk)
+        self.assertEqual(live_queue.decode_cursor(cursor), (self.waiting.updated_at, self.waiting.pk))
+        self.assertIsNone(live_queue.decode_cursor("garbage"))
+
+    @override_settings(VISIT_QUEUE_OVERLAP_SECONDS=0)
+    def test_feed_returns_only_changes_since_cursor(self):
+        cursor = live_queue.latest_cursor()
+        self.assertEqual(live_queue.changes_since(cursor)["upserts"], [])
+
+        new = Visit.objects.create(patient=self.patient)
+        self.waiting.status = Visit.Status.CLOSED
+        self.waiting.save(update_fields=["status", "updated_at"])
+
+        feed = live_queue.changes_since(cursor)
+        self.assertEqual([u["id"] for u in feed["upserts"]], [new.pk])
+        self.assertEqual(feed["removed"], [self.waiting.pk])
+        self.assertEqual(live_queue.changes_since(feed["cursor"])["upserts"], [])
+
+    def test_feed_without_cursor_is_a_snapshot(self):
+        feed = self.client.get(reverse("visits:queue_feed")).json()
+        self.assertTrue(feed["reset"])
+        self.assertEqual([u["id"] for u in feed["upserts"]], [self.waiting.pk])
+        self.assertIn(self.waiting.visit_number, feed["upserts"][0]["html"])
+
+    def test_unchanged_queue_is_304(self):
+        url = reverse("visits:queue_feed")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(4):  # session + user, then recent changes + queue size
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        Visit.objects.create(patient=self.patient)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_late_commit_behind_the_cursor_is_resent(self):
+        cursor = live_queue.latest_cursor()
+        late = Visit.objects.create(patient=self.patient)
+        # stamped before the cursor was served, committed after it
+        Visit.objects.filter(pk=late.pk).update(updated_at=self.waiting.updated_at - timedelta(seconds=1))
+        feed = live_queue.changes_since(cursor)
+        self.assertIn(late.pk, [u["id"] for u in feed["upserts"]])
+        self.assertEqual(feed["cursor"], cursor)
+
+    def test_draining_more_pages_is_not_answered_304(self):
+        url = reverse("visits:queue_feed")
+        first = live_queue.latest_cursor()
+        for _ in range(3):
+            Visit.objects.create(patient=self.patient)
+        with self.settings(VISIT_QUEUE_OVERLAP_SECONDS=0):
+            original, live_queue.FEED_LIMIT = live_queue.FEED_LIMIT, 2
+            try:
+                page = self.client.get(url, {"since": first})
+                self.assertTrue(page.json()["more"])
+                # the client's stored ETag is for the first page; the next page still comes back
+                rest = self.client.get(url, {"since": page.json()["cursor"]}, HTTP_IF_NONE_MATCH=page["ETag"])
+            finally:
+                live_queue.FEED_LIMIT = original
+        self.assertEqual(rest.status_code, 200)
+        self.assertEqual(len(rest.json()["upserts"]), 1)
+
+    def test_queue_page_supports_etag(self):
+        resp = self.client.get(reverse("visits:queue"))
+        self.assertContains(resp, self.waiting.visit_number)
+        resp = self.client.get(reverse("visits:queue"), HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+    @override_settings(VISIT_QUEUE_OVERLAP_SECONDS=0)
+    def test_stream_emits_changes(self):
+        cursor = live_queue.latest_cursor()
+        new = Visit.objects.create(patient=self.patient)
+        retry, *events = live_queue.stream_events(cursor, max_seconds=0)
+        self.assertEqual(retry, f"retry: {live_queue.STREAM_RETRY_MS}\n\n")
+        self.assertEqual(len(events), 1)
+        header, data = events[0].split("data: ")
+        self.assertIn("event: queue", header)
+        self.assertEqual([u["id"] for u in json.loads(data)["upserts"]], [new.pk])
+
+    def test_stream_is_opt_in(self):
+        self.assertEqual(self.client.get(reverse("visits:queue_stream")).status_code, 404)
+
+    @override_settings(VISIT_QUEUE_SSE=True, VISIT_QUEUE_STREAM_SECONDS=0, VISIT_QUEUE_OVERLAP_SECONDS=0)
+    def test_stream_ends_early_and_resumes_from_last_event_id(self):
+        cursor = live_queue.latest_cursor()
+        new = Visit.objects.create(patient=self.patient)
+        resp = self.client.get(reverse("visits:queue_stream"), HTTP_LAST_EVENT_ID=cursor)
+        body = b"".join(resp.streaming_content).decode()  # returns: the stream is capped
+        self.assertIn("retry: ", body)
+        self.assertEqual([u["id"] for u in json.loads(body.split("data: ")[1])["upserts"]], [new.pk])
+
+    def test_patients_cannot_watch_the_queue(self):
+        self.client.force_login(get_user_model().objects.create_user(username="p", password="x", role="patient"))
+        self.assertEqual(self.client.get(reverse("visits:queue_feed")).status_code, 403)
+
+
+class VitalObservationTests(TestCase):
+    def setUp(self):
+        self.nurse = get_user_model().objects.create_user(username="nurse", password="x", role="nurse")
+        self.client.force_login(self.nurse)
+        self.patient = Patient.objects.create(first_name="Ada", last_name="Obi", gender="F", phone="080")
+        self.visit = Visit.objects.create(patient=self.patient, visit_type=Visit.VisitType.ADMISSION)
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=12)
+
+    def chart_rounds(self, hours=6, per_hour=4):
+        readings = [
+            {"taken_at": self.start + timedelta(hours=h, minutes=15 * i), "pulse_bpm": 80 + i, "spo2": 95}
+            for h in range(hours) for i in range(per_hour)
+        ]
+        return vitals.record(self.patient, readings, visit=self.visit, user=self.nurse)
+
+    def test_record_is_one_insert(self):
+        with self.assertNumQueries(1):
+            created = self.chart_rounds()
+        self.assertEqual(len(created), 48)
+
+    def test_bad_reading_writes_nothing(self):
+        with self.assertRaises(vitals.ObservationError):
+            vitals.record(self.patient, [{"pulse_bpm": 80}, {"spo2": 140}])
+        with self.assertRaises(vitals.ObservationError):
+            vitals.record(self.patient, [{"pulse": 80}])
+        self.assertFalse(VitalObservation.objects.exists())
+
+    def test_trend_downsamples_in_one_query(self):
+        self.chart_rounds()
+        with self.assertNumQueries(1):
+            trend = vitals.trend(self.patient, since=self.start, interval="hour")
+        pulse = trend["series"]["pulse_bpm"]
+        self.assertEqual(len(pulse), 6)
+        self.assertEqual((pulse[0]["n"], pulse[0]["min"], pulse[0]["max"], pulse[0]["avg"]), (4, 80.0, 83.0, 81.5))
+        self.assertEqual(trend["series"]["spo2"][0]["avg"], 95.0)
+
+    def test_interval_is_picked_from_the_range(self):
+        now = timezone.now()
+        self.assertEqual(vitals.pick_interval(now - timedelta(hours=2), now), "minute")
+        self.assertEqual(vitals.pick_interval(now - timedelta(days=3), now), "hour")
+        self.assertEqual(vitals.pick_interval(now - timedelta(days=90), now), "day")
+        self.assertEqual(vitals.pick_interval(now - timedelta(days=3650), now), "month")
+
+    def test_vitals_form_charts_changed_fields(self):
+        self.client.post(reverse("visits:vitals_update", args=[self.visit.pk]), {"pulse_bpm": 90, "spo2": 97})
+        self.assertEqual(
+            sorted(VitalObservation.objects.filter(visit=self.visit).values_list("kind", flat=True)),
+            ["pulse_bpm", "spo2"],
+        )
+
+    def test_observation_and_trend_endpoints(self):
+        url = reverse("visits:record_observations", args=[self.visit.pk])
+        body = {"readings": [
+            {"taken_at": (self.start + timedelta(minutes=m)).isoformat(), "pulse_bpm": 100 + m} for m in (0, 30)
+        ]}
+        resp = self.client.post(url, json.dumps(body), content_type="application/json")
+        self.assertEqual(resp.json(), {"recorded": 2})
+        resp = self.client.post(url, json.dumps({"readings": [{"pulse_bpm": "fast"}]}), content_type="application/json")
+        self.assertEqual(resp.status_code, 400)
+
+        trend = self.client.get(
+            reverse("visits:vitals_trend", args=[self.patient.pk]),
+            {"kinds": "pulse_bpm", "since": self.start.isoformat(), "interval": "hour"},
+        ).json()
+        self.assertEqual(trend["series"]["pulse_bpm"][0]["avg"], 115.0)
@@ -6,9 +6,13 @@ app_name = "visits"
 
 urlpatterns = [
     path("queue/", views.queue, name="queue"),
+    path("queue/feed/", views.queue_feed, name="queue_feed"),
+    path("queue/stream/", views.queue_stream, name="queue_stream"),
     path("start/<int:patient_id>/", views.start_visit, name="start_visit"),
     path("<int:visit_id>/", views.visit_detail, name="visit_detail"),
     path("<int:visit_id>/vitals/", views.vitals_update, name="vitals_update"),
+    path("<int:visit_id>/observations/", views.record_observations, name="record_observations"),
+    path("patient/<int:patient_id>/vitals.json", views.vitals_trend_json, name="vitals_trend"),
     path("<int:visit_id>/take/", views.doctor_take_case, name="doctor_take_case"),
     path("<int:visit_id>/consultation/", views.consultation, name="consultation"),
     path("<int:visit_id>/close/", views.close_visit, name="close_visit"),
@@ -1,13 +1,24 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control
 from accounts.utils import require_roles
 from patients.models import Patient
 from .forms import VisitStartForm, VitalsForm
 from .models import Visit
+from . import queue as live_queue
+from . import vitals
 from .forms import ConsultationForm
 from pharmacy.forms import PrescriptionItemForm
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_POST
 from billing.services import generate_invoice_for_visit
+from billing.tasks import prerender_invoice_pdf
 
 @login_required
 def start_visit(request, patient_id: int):
@@ -37,21 +48,127 @@ def vitals_update(request, visit_id: int):
         updated = form.save(commit=False)
         # once vitals are captured, move to doctor queue
         updated.status = Visit.Status.WAITING_DOCTOR
-        updated.save()
+        with transaction.atomic():
+            updated.save()
+            # chart what was (re)measured so trends see triage readings too
+            vitals.record_visit_vitals(updated, kinds=form.changed_data, user=request.user)
         return redirect("visits:queue")
 
     return render(request, "visits/vitals_form.html", {"visit": visit, "form": form})
 
 
+VITALS_ROLES = {"frontdesk", "nurse", "doctor", "admin"}
+
+
+@login_required
+@require_POST
+def record_observations(request, visit_id: int):
+    """
+    Chart one or more sets of vitals against a visit (ward rounds).
+
+    JSON body {"readings": [{"taken_at": iso, "pulse_bpm": 88, ...}, ...]} or
+    the vitals as form fields for a single set; all are written in one insert.
+    """
+    require_roles(request.user, roles=VITALS_ROLES)
+    visit = get_object_or_404(Visit.objects.select_related("patient"), pk=visit_id)
+
+    if request.content_type == "application/json":
+        try:
+            readings = json.loads(request.body or b"{}").get("readings") or []
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Body must be a JSON object with a 'readings' list."}, status=400)
+    else:
+        readings = [{k: v for k, v in request.POST.items() if k in vitals.KINDS or k == "taken_at"}]
+
+    try:
+        created = vitals.record(visit.patient, readings, visit=visit, user=request.user)
+    except (vitals.ObservationError, TypeError, AttributeError) as exc:
+        return JsonResponse({"error": str(exc) or "Malformed readings."}, status=400)
+    return JsonResponse({"recorded": len(created)}, status=201)
+
+
+def _datetime_param(request, name):
+    raw = request.GET.get(name)
+    if not raw:
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        raise vitals.ObservationError(f"{name} must be an ISO date/time.")
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+@login_required
+def vitals_trend_json(request, patient_id: int):
+    """?kinds=pulse_bpm,spo2&since=iso&until=iso&interval=hour&visit=<id> -> min/max/avg per bucket."""
+    require_roles(request.user, roles=VITALS_ROLES)
+    patient = get_object_or_404(Patient, pk=patient_id)
+
+    try:
+        since, until = _datetime_param(request, "since"), _datetime_param(request, "until")
+    except vitals.ObservationError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    kinds = [k for k in (request.GET.get("kinds") or "").split(",") if k in vitals.KINDS]
+    visit = request.GET.get("visit") or ""
+
+    return JsonResponse(vitals.trend(
+        patient,
+        kinds=kinds or None,
+        since=since,
+        until=until,
+        interval=request.GET.get("interval"),
+        visit=int(visit) if visit.isdigit() else None,
+    ))
+
+
+QUEUE_ROLES = {"doctor", "admin", "frontdesk", "nurse"}
+
+
+def _conditional(request, etag, build):
+    """304 when the client already has `etag`, otherwise build() with revalidation headers."""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @login_required
 def queue(request):
-    require_roles(request.user, roles={"doctor", "admin", "frontdesk", "nurse"})
+    require_roles(request.user, roles=QUEUE_ROLES)
 
-    visits = Visit.objects.select_related("patient").filter(
-        status__in=[Visit.Status.OPEN, Visit.Status.WAITING_DOCTOR, Visit.Status.IN_CONSULT]
-    ).order_by("created_at")
+    return _conditional(request, live_queue.queue_etag(), lambda: render(request, "visits/queue.html", {
+        "visits": live_queue.queue_visits(),
+        "cursor": live_queue.latest_cursor(),
+        "use_sse": getattr(settings, "VISIT_QUEUE_SSE", False),
+    }))
+
+
+@login_required
+def queue_feed(request):
+    """JSON changes since ?since=<cursor> (the whole queue without one)."""
+    require_roles(request.user, roles=QUEUE_ROLES)
+
+    since = request.GET.get("since")
+    return _conditional(request, live_queue.queue_etag(since), lambda: JsonResponse(
+        live_queue.changes_since(since, request)
+    ))
+
+
+@login_required
+def queue_stream(request):
+    """Server-sent events version of queue_feed; resumes from Last-Event-ID."""
+    require_roles(request.user, roles=QUEUE_ROLES)
+    if not getattr(settings, "VISIT_QUEUE_SSE", False):
+        raise Http404  # opt-in: each stream holds a worker; the queue page polls queue_feed
 
-    return render(request, "visits/queue.html", {"visits": visits})
+    cursor = request.headers.get("Last-Event-ID") or request.GET.get("since")
+    response = StreamingHttpResponse(
+        live_queue.stream_events(cursor, request), content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
 
 
 @login_required
@@ -129,6 +246,7 @@ def close_visit(request, visit_id: int):
     if not getattr(visit, "invoice", None):
         return redirect("visits:visit_detail", visit_id=visit.id)
 
+    prerender_invoice_pdf.enqueue(invoice_id=visit.invoice.id)
     return redirect("billing:invoice_detail", visit.invoice.id)
 
     
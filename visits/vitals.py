@@ -0,0 +1,155 @@
+"""
+Vital-sign observations.
+
+Every reading is a VitalObservation row (patient, kind, value, taken_at), so
+a ward chart is a range scan on the (patient, kind, taken_at) index however
+long the admission. Readings are recorded in bulk: a set of vitals taken
+together, or a batch of sets charted after the round, becomes one INSERT.
+
+Trends are downsampled in the database: `trend` buckets readings by
+minute/hour/day/week/month and returns count, min, max and average per
+bucket from a single grouped query. When no interval is asked for it picks
+the finest one that keeps each series under MAX_POINTS buckets.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import VitalObservation
+
+KINDS = [kind.value for kind in VitalObservation.Kind]
+
+# plausible bounds; anything outside is a typo, not a reading
+RANGES = {
+    "bp_systolic": (40, 300),
+    "bp_diastolic": (20, 200),
+    "pulse_bpm": (20, 300),
+    "temperature_c": (25, 45),
+    "resp_rate": (2, 80),
+    "spo2": (30, 100),
+    "weight_kg": (Decimal("0.3"), 500),
+    "height_cm": (20, 260),
+}
+
+# finest first, with the width used to estimate bucket counts
+INTERVALS = {
+    "minute": (TruncMinute, timedelta(minutes=1)),
+    "hour": (TruncHour, timedelta(hours=1)),
+    "day": (TruncDay, timedelta(days=1)),
+    "week": (TruncWeek, timedelta(weeks=1)),
+    "month": (TruncMonth, timedelta(days=31)),
+}
+MAX_POINTS = 200
+
+
+class ObservationError(ValueError):
+    """A submitted reading has an unknown kind, a non-numeric or implausible value, or a bad time."""
+
+
+def _value(kind, raw):
+    if raw is None or raw == "":
+        return None
+    try:
+        value = Decimal(str(raw).strip()).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ObservationError(f"{kind}: '{raw}' is not a number.")
+    low, high = RANGES[kind]
+    if not low <= value <= high:
+        raise ObservationError(f"{kind}: {value} is outside {low}-{high}.")
+    return value
+
+
+def _taken_at(raw, default):
+    if raw in (None, ""):
+        return default
+    taken_at = raw if isinstance(raw, datetime) else parse_datetime(str(raw))
+    if taken_at is None:
+        raise ObservationError(f"taken_at: '{raw}' is not a date/time.")
+    if timezone.is_naive(taken_at):
+        taken_at = timezone.make_aware(taken_at)
+    if taken_at > default + timedelta(minutes=5):
+        raise ObservationError(f"taken_at: {taken_at:%Y-%m-%d %H:%M} is in the future.")
+    return taken_at
+
+
+def record(patient, readings, *, visit=None, user=None):
+    """
+    Insert observations for `patient` in one statement.
+
+    `readings` is an iterable of mappings {kind: value, ..., "taken_at": ...};
+    missing/blank kinds are skipped and taken_at defaults to now. Unknown keys
+    raise ObservationError, as does any bad value, before anything is written.
+    """
+    now = timezone.now()
+    rows = []
+    for reading in readings:
+        unknown = set(reading) - set(KINDS) - {"taken_at"}
+        if unknown:
+            raise ObservationError(f"Unknown vital(s): {', '.join(sorted(unknown))}.")
+        taken_at = _taken_at(reading.get("taken_at"), now)
+        for kind in KINDS:
+            value = _value(kind, reading.get(kind))
+            if value is not None:
+                rows.append(VitalObservation(
+                    patient=patient, visit=visit, kind=kind, value=value,
+                    taken_at=taken_at, recorded_by=user,
+                ))
+    return VitalObservation.objects.bulk_create(rows, batch_size=500)
+
+
+def record_visit_vitals(visit, kinds=KINDS, user=None):
+    """Chart the triage vitals just saved on `visit` (only `kinds`, e.g. the fields a form changed)."""
+    reading = {kind: getattr(visit, kind) for kind in kinds if kind in RANGES}
+    return record(visit.patient, [reading], visit=visit, user=user)
+
+
+def pick_interval(since, until):
+    """The finest interval that splits since..until into at most MAX_POINTS buckets."""
+    span = until - since
+    for name, (_, width) in INTERVALS.items():
+        if span / width <= MAX_POINTS:
+            return name
+    return "month"
+
+
+def trend(patient, *, kinds=None, since=None, until=None, interval=None, visit=None):
+    """
+    {"interval", "series": {kind: [{t, n, min, max, avg}]}} oldest first, from one grouped query.
+
+    since/until bound taken_at (until defaults to now; no since means the
+    whole history). Without an interval one is picked from since..until,
+    or "day" when the range is open-ended.
+    """
+    until = until or timezone.now()
+    if interval not in INTERVALS:
+        interval = pick_interval(since, until) if since else "day"
+    trunc = INTERVALS[interval][0]
+
+    qs = VitalObservation.objects.filter(patient=patient, taken_at__lte=until)
+    if since:
+        qs = qs.filter(taken_at__gte=since)
+    if visit is not None:
+        qs = qs.filter(visit=visit)
+    if kinds:
+        qs = qs.filter(kind__in=kinds)
+
+    rows = (
+        qs.annotate(t=trunc("taken_at"))
+        .values("kind", "t")
+        .annotate(n=Count("id"), lo=Min("value"), hi=Max("value"), mean=Avg("value"))
+        .order_by("kind", "t")
+    )
+    series = {}
+    for row in rows:
+        series.setdefault(row["kind"], []).append({
+            "t": row["t"].isoformat(),
+            "n": row["n"],
+            "min": float(row["lo"]),
+            "max": float(row["hi"]),
+            "avg": round(float(row["mean"]), 2),
+        })
+    return {"interval": interval, "series": series}